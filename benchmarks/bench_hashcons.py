@@ -0,0 +1,54 @@
+"""What hash-consing costs and saves.
+
+Usage: python benchmarks/bench_hashcons.py [size] [repetitions]
+
+For each corpus kind (see corpus.py) this parses one corpus without and with
+a NodeTable, and reports the parse times, the nodes and bytes each tree
+holds (as bench_memory.py counts them), and the time to compare two parses
+of the corpus for equality and to count its distinct statements with a set.
+Two parses with one table are the same tree, so comparing them is
+immediate.
+"""
+from __future__ import print_function
+
+import sys
+
+from bench_memory import measure
+from bench_reparse import best_of
+from corpus import KINDS, generate
+
+from blackbeard.hashcons import NodeTable
+from blackbeard.parser import parse
+
+
+def main():
+    # type: () -> None
+    "NOT_RPYTHON"
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1 << 20
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    print("%-12s %9s %9s %9s %9s %10s %10s %8s %8s %8s %8s" % (
+        "kind", "parse ms", "cons ms", "nodes", "cons", "bytes", "cons",
+        "eq ms", "cons", "set ms", "cons"))
+    for kind in KINDS:
+        source = generate(kind, size)
+        tree = parse(source)
+        other = parse(source)
+        table = NodeTable()
+        shared = parse(source, nodes=table)
+        shared_other = parse(source, nodes=table)
+        nodes, total = measure(tree)
+        shared_nodes, shared_total = measure(shared)
+        plain_ms = best_of(repeat, lambda: parse(source)) * 1000
+        cons_ms = best_of(repeat, lambda: parse(source, nodes=NodeTable())) * 1000
+        # Fresh parses each time, so that no hash is cached beforehand.
+        eq_ms = best_of(repeat, lambda: tree == other) * 1000
+        cons_eq_ms = best_of(repeat, lambda: shared == shared_other) * 1000
+        set_ms = best_of(repeat, lambda: len(set(parse(source).statements))) * 1000 - plain_ms
+        cons_set_ms = best_of(repeat, lambda: len(set(shared.statements))) * 1000
+        print("%-12s %9.1f %9.1f %9d %9d %10d %10d %8.2f %8.3f %8.1f %8.2f" % (
+            kind, plain_ms, cons_ms, nodes, shared_nodes, total, shared_total,
+            eq_ms, cons_eq_ms, set_ms, cons_set_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Time to import blackbeard.parser with and without its LR table cache.
+
+Usage: python benchmarks/bench_import.py [repetitions]
+
+Each import runs in a fresh interpreter with XDG_CACHE_HOME pointing at a
+temporary directory: an empty one for a cold import, which builds the
+tables and writes them, and one already holding the tables for a warm
+import. The baseline is an interpreter that imports rply and the lexer only.
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from typing import Dict  # noqa
+
+BASELINE = "import rply, blackbeard.lexer"
+IMPORT = "import blackbeard.parser"
+
+
+def run(statement, cache_home):
+    # type: (str, str) -> float
+    "NOT_RPYTHON"
+    env = dict(os.environ, XDG_CACHE_HOME=cache_home)
+    with open(os.devnull, "w") as devnull:
+        start = time.time()
+        subprocess.check_call([sys.executable, "-c", statement], env=env, stderr=devnull)
+        return time.time() - start
+
+
+def main():
+    # type: () -> None
+    "NOT_RPYTHON"
+    reps = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    warm_home = tempfile.mkdtemp()
+    try:
+        run(IMPORT, warm_home)
+        best = {}  # type: Dict[str, float]
+        for _ in range(reps):
+            cold_home = tempfile.mkdtemp()
+            try:
+                timings = [
+                    ("baseline", run(BASELINE, cold_home)),
+                    ("cold", run(IMPORT, cold_home)),
+                    ("warm", run(IMPORT, warm_home)),
+                ]
+            finally:
+                shutil.rmtree(cold_home)
+            for name, elapsed in timings:
+                best[name] = min(best.get(name, elapsed), elapsed)
+    finally:
+        shutil.rmtree(warm_home)
+    for name in ["baseline", "cold", "warm"]:
+        print("%-8s %7.1f ms" % (name, best[name] * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Tokens-per-second benchmark for blackbeard.lexer.Lexer.tokenize.
+
+Usage: python benchmarks/bench_lexer.py [repetitions]
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from blackbeard.lexer import Lexer
+
+SNIPPET = b"""\
+# Compute some summary statistics.
+scale <- function(x, center = TRUE, factor = 1.5e-3) {
+    total <- x[1] + x[2] * 60 * 60 * 24 - x[3] / 2 ^ 10
+    if (total >= 100 && center != FALSE || is.na(total)) {
+        label <- "a fairly long string literal with \\"escapes\\" inside"
+    }
+    result = total %in% values; other <- `quoted name` %% 7L
+    -total -> negated
+}
+"""
+
+
+def bench(source, repeat=5):
+    # type: (bytes, int) -> Tuple[int, float]
+    best = None
+    count = 0
+    for _ in range(repeat):
+        start = time.time()
+        count = 0
+        for _token in Lexer(source, 1, {}).tokenize():
+            count += 1
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return count, best
+
+
+def main():
+    # type: () -> None
+    "NOT_RPYTHON"
+    reps = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    source = SNIPPET * reps
+    count, elapsed = bench(source)
+    print("%d bytes, %d tokens in %.3fs: %.0f tokens/s" %
+          (len(source), count, elapsed, count / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Memory held by parsed trees, per AST node.
+
+Usage: python benchmarks/bench_memory.py [size] [seed]
+
+For each corpus kind (see corpus.py) this parses one corpus and adds up
+sys.getsizeof() over every object reachable from the tree: the nodes, their
+attribute dicts and lists, and the values and strings they hold. Shared
+objects, such as symbols, are counted once. It then stores the tree in an
+Arena (see blackbeard/arena.py) and reports the size of its arrays and
+pools, and how long walking each form of the tree takes. Last, it compares a
+long numeric vector as a list of Values with the same vector as an
+ast.Vector, which keeps its elements in a typed list, without a Value each.
+Translated, the list holds the doubles themselves.
+"""
+from __future__ import print_function
+
+import gc
+import sys
+import timeit
+
+from corpus import KINDS, generate
+from typing import Callable, Set, Tuple  # noqa
+
+from blackbeard import ast
+from blackbeard.arena import Arena
+from blackbeard.parser import parse
+
+
+def measure(tree):
+    # type: (ast.ASTNode) -> Tuple[int, int]
+    "NOT_RPYTHON"
+    # gc.get_referents() finds an instance's dict without creating one.
+    seen = set()  # type: Set[int]
+    stack = [tree]
+    nodes = 0
+    size = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, type):
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, ast.ASTNode):
+            nodes += 1
+        size += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return nodes, size
+
+
+def measure_arena(arena):
+    # type: (Arena) -> int
+    "NOT_RPYTHON"
+    size = sys.getsizeof(arena)
+    for column in [arena.kinds, arena.flags, arena.data, arena.child_starts,
+                   arena.children, arena.ints, arena.floats]:
+        size += sys.getsizeof(column)
+    for pool in [arena.strings, arena.operators, arena.symtable.names]:
+        size += sys.getsizeof(pool) + sum(sys.getsizeof(item) for item in pool)
+    return size + sys.getsizeof(arena.symtable.ids)
+
+
+def walk_tree(tree):
+    # type: (ast.ASTNode) -> int
+    "NOT_RPYTHON"
+    count = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        count += 1
+        for field in node._fields:
+            value = getattr(node, field)
+            if isinstance(value, ast.ASTNode):
+                stack.append(value)
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, tuple):
+                        stack.extend(v for v in item if v is not None)
+                    elif isinstance(item, ast.ASTNode):
+                        stack.append(item)
+    return count
+
+
+def best_of(func, repeat=3):
+    # type: (Callable[[], object], int) -> float
+    "NOT_RPYTHON"
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    # type: () -> None
+    "NOT_RPYTHON"
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1 << 20
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    print("%-12s %10s %12s %10s %12s %10s %9s %9s" % (
+        "kind", "nodes", "bytes", "bytes/node", "arena bytes", "bytes/node",
+        "walk ms", "arena ms"))
+    for kind in KINDS:
+        tree = parse(generate(kind, size, seed))
+        nodes, total = measure(tree)
+        arena = Arena.from_tree(tree)
+        arena_total = measure_arena(arena)
+        walk_seconds = best_of(lambda: walk_tree(tree))
+        arena_seconds = best_of(lambda: sum(1 for _ in arena.walk()))
+        print("%-12s %10d %12d %10.1f %12d %10.1f %9.1f %9.1f" % (
+            kind, nodes, total, float(total) / max(nodes, 1),
+            arena_total, float(arena_total) / max(len(arena), 1),
+            walk_seconds * 1e3, arena_seconds * 1e3))
+
+
+def main_vector(length=1 << 20):
+    # type: (int) -> None
+    "NOT_RPYTHON"
+    values = [ast.FloatValue(float(i)) for i in range(length)]
+    _, boxed = measure(values)  # type: ignore
+    _, unboxed = measure(ast.Vector(values))
+    print("%d-element vector: %d bytes as Values, %d as a Vector (%.1f bytes/element)" % (
+        length, boxed, unboxed, float(unboxed) / length))
+
+
+if __name__ == "__main__":
+    main()
+    main_vector()
@@ -0,0 +1,39 @@
+"""Latency of Lexer.relex after a one-byte insertion and a one-byte
+replacement, against a full lex, as the source grows.
+
+Usage: python benchmarks/bench_relex.py [repetitions]
+"""
+from __future__ import print_function
+
+import sys
+
+from bench_reparse import best_of
+from corpus import generate
+
+from blackbeard.lexer import Lexer
+
+SIZES = [256 << 10, 1 << 20, 4 << 20]
+
+
+def main():
+    # type: () -> None
+    "NOT_RPYTHON"
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print("%10s %10s %12s %12s" % ("bytes", "lex ms", "insert ms", "replace ms"))
+    for size in SIZES:
+        source = generate("mixed", size)
+        lexer = Lexer(source, 1, {})
+        old = lexer.tokenize_incremental()
+        start = source.index(b"\n", len(source) // 2) + 1
+        inserted = source[:start] + b"z" + source[start:]
+        replaced = source[:start] + b"z" + source[start + 1:]
+        full = best_of(repeat, lambda: list(Lexer(source, 1, {}).tokenize()))
+        insert = best_of(repeat, lambda: Lexer(inserted, 1, lexer.symtable).relex(
+            old, start, start, start + 1))
+        replace = best_of(repeat, lambda: Lexer(replaced, 1, lexer.symtable).relex(
+            old, start, start + 1, start + 1))
+        print("%10d %10.1f %12.3f %12.3f" % (len(source), full * 1000, insert * 1000, replace * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Latency of ParsedSource.reparse after a one-character edit, against a
+full parse, as the source grows.
+
+Usage: python benchmarks/bench_reparse.py [repetitions]
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from corpus import generate
+from typing import Callable  # noqa
+
+from blackbeard.incremental import ParsedSource
+from blackbeard.parser import parse
+
+SIZES = [16 << 10, 64 << 10, 256 << 10, 1 << 20]
+
+
+def best_of(repeat, func):
+    # type: (int, Callable[[], object]) -> float
+    "NOT_RPYTHON"
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    assert best is not None
+    return best
+
+
+def main():
+    # type: () -> None
+    "NOT_RPYTHON"
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print("%10s %12s %12s" % ("bytes", "parse ms", "reparse ms"))
+    for size in SIZES:
+        source = generate("mixed", size)
+        parsed = ParsedSource.parse(source)
+        # Rename a symbol in the middle of the source.
+        start = parsed.starts[len(parsed.starts) // 2]
+        edited = source[:start] + b"z" + source[start:]
+        full = best_of(repeat, lambda: parse(edited))
+        incremental = best_of(repeat, lambda: parsed.reparse(edited, start, start, start + 1))
+        print("%10d %12.2f %12.3f" % (len(source), full * 1000, incremental * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Lexer and parser throughput and peak memory over the synthetic corpora.
+
+Usage: python benchmarks/bench_suite.py [--size BYTES] [--repeat N]
+           [--seed N] [--kinds KIND,...] [--output results.json]
+           [--compare baseline.json [--tolerance FRACTION]]
+
+For each corpus kind (see corpus.py) this times Lexer.tokenize and
+Parser.parse with each backend ("parse" for the LR parser, "pratt" for the
+Pratt parser), taking the best of --repeat runs, and reports MB/s, tokens/s
+and AST nodes/s. Each measurement runs in a fresh subprocess so that peak
+memory, the growth of the peak RSS over the run, is not inherited from an
+earlier one (the corpus is written to a temporary file first, so that
+generating it does not count either). Results are printed as a table and, with --output, written as
+JSON. Given --compare with an earlier JSON file, it exits with status 1 if
+any measurement's MB/s fell by more than --tolerance.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from typing import Any, Dict, List, Tuple  # noqa
+
+from blackbeard import ast
+from blackbeard.lexer import Lexer
+from blackbeard.parser import Parser
+from blackbeard.version import __version__
+from corpus import KINDS, generate
+
+PHASES = ["lex", "parse", "pratt"]
+
+
+def peak_rss():
+    # type: () -> int
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def count_nodes(node):
+    # type: (Any) -> int
+    """Number of ASTNodes reachable from node, through lists and tuples."""
+    count = 0
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, ast.ASTNode):
+            count += 1
+            stack.extend(getattr(item, field) for field in item._fields)
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return count
+
+
+def run_lex(source):
+    # type: (bytes) -> Tuple[int, int]
+    count = 0
+    for _token in Lexer(source, 1, {}).tokenize():
+        count += 1
+    return count, 0
+
+
+def run_parse(source, backend=Parser.LR):
+    # type: (bytes, int) -> Tuple[int, int]
+    count = [0]
+
+    def counting(tokens):
+        # type: (Any) -> Any
+        for token in tokens:
+            count[0] += 1
+            yield token
+    parser = Parser(Lexer(source, 1, {}), backend)
+    tree = parser.parse_tokens(counting(parser.lexer.tokenize()))
+    return count[0], count_nodes(tree)
+
+
+def run_pratt(source):
+    # type: (bytes) -> Tuple[int, int]
+    return run_parse(source, Parser.PRATT)
+
+
+def measure(kind, phase, path, repeat):
+    # type: (str, str, str, int) -> Dict[str, Any]
+    "NOT_RPYTHON"
+    with open(path, "rb") as f:
+        source = f.read()
+    run = {"lex": run_lex, "parse": run_parse, "pratt": run_pratt}[phase]
+    before = peak_rss()
+    best = None
+    tokens = nodes = 0
+    for _ in range(repeat):
+        start = time.time()
+        tokens, nodes = run(source)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    assert best is not None
+    best = max(best, 1e-9)
+    return {
+        "kind": kind,
+        "phase": phase,
+        "bytes": len(source),
+        "tokens": tokens,
+        "nodes": nodes,
+        "seconds": best,
+        "mb_per_s": len(source) / 1e6 / best,
+        "tokens_per_s": tokens / best,
+        "nodes_per_s": nodes / best,
+        "peak_mem_bytes": peak_rss() - before,
+    }
+
+
+def regressions(baseline, results, tolerance):
+    # type: (Dict[str, Any], List[Dict[str, Any]], float) -> List[str]
+    "NOT_RPYTHON"
+    old = dict(((r["kind"], r["phase"]), r) for r in baseline["results"])
+    found = []
+    for result in results:
+        before = old.get((result["kind"], result["phase"]))
+        if before is None:
+            continue
+        if result["mb_per_s"] < before["mb_per_s"] * (1 - tolerance):
+            found.append("%s %s: %.2f MB/s, was %.2f" % (
+                result["kind"], result["phase"], result["mb_per_s"], before["mb_per_s"]))
+    return found
+
+
+def environment():
+    # type: () -> Dict[str, Any]
+    "NOT_RPYTHON"
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=open(os.devnull, "w")).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "version": __version__,
+        "commit": commit,
+        "python": platform.python_implementation() + " " + platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def main():
+    # type: () -> None
+    "NOT_RPYTHON"
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--size", type=int, default=1 << 20,
+                           help="bytes of source per corpus")
+    argparser.add_argument("--repeat", type=int, default=3)
+    argparser.add_argument("--seed", type=int, default=0)
+    argparser.add_argument("--kinds", default=",".join(KINDS),
+                           help="comma-separated corpus kinds")
+    argparser.add_argument("--output", help="write results to this JSON file")
+    argparser.add_argument("--compare", help="JSON results of an earlier run")
+    argparser.add_argument("--tolerance", type=float, default=0.1,
+                           help="slowdown allowed by --compare, as a fraction")
+    argparser.add_argument("--child", nargs=3, metavar=("KIND", "PHASE", "PATH"),
+                           help=argparse.SUPPRESS)
+    args = argparser.parse_args()
+    if args.child:
+        kind, phase, path = args.child
+        print(json.dumps(measure(kind, phase, path, args.repeat)))
+        return
+    kinds = args.kinds.split(",")
+    for kind in kinds:
+        if kind not in KINDS:
+            argparser.error("unknown corpus kind %r; choose from %s" % (kind, ", ".join(KINDS)))
+    results = []  # type: List[Dict[str, Any]]
+    print("%-11s %-6s %9s %9s %11s %11s %10s" %
+          ("kind", "phase", "bytes", "MB/s", "tokens/s", "nodes/s", "peak MB"))
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for kind in kinds:
+            path = os.path.join(tmpdir, kind + ".R")
+            with open(path, "wb") as f:
+                f.write(generate(kind, args.size, args.seed))
+            for phase in PHASES:
+                output = subprocess.check_output([
+                    sys.executable, __file__, "--child", kind, phase, path,
+                    "--repeat", str(args.repeat)])
+                result = json.loads(output.splitlines()[-1])
+                results.append(result)
+                print("%-11s %-6s %9d %9.2f %11.0f %11.0f %10.1f" %
+                      (kind, phase, result["bytes"], result["mb_per_s"], result["tokens_per_s"],
+                       result["nodes_per_s"], result["peak_mem_bytes"] / 1e6))
+    finally:
+        shutil.rmtree(tmpdir)
+    if args.output:
+        report = {
+            "environment": environment(),
+            "settings": {"size": args.size, "repeat": args.repeat, "seed": args.seed},
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if args.compare:
+        with open(args.compare) as f:
+            found = regressions(json.load(f), results, args.tolerance)
+        for line in found:
+            print("regression: " + line)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Peak memory per million tokens: a list of Tokens vs a TokenBuffer.
+
+Usage: python benchmarks/bench_tokens.py [repetitions]
+
+Each representation is measured in a fresh subprocess, as the growth of the
+peak RSS while the token stream is built.
+"""
+from __future__ import print_function
+
+import resource
+import subprocess
+import sys
+
+from bench_lexer import SNIPPET
+from blackbeard.lexer import Lexer
+from blackbeard.tokenbuffer import TokenBuffer
+
+
+def peak_rss():
+    # type: () -> int
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(mode, reps):
+    # type: (str, int) -> None
+    "NOT_RPYTHON"
+    source = SNIPPET * reps
+    before = peak_rss()
+    lexer = Lexer(source, 1, {})
+    if mode == "list":
+        count = len(list(lexer.tokenize()))
+    else:
+        count = len(TokenBuffer.from_lexer(lexer))
+    grown = peak_rss() - before
+    print("%-6s %9d tokens %8.1f MB peak %8.1f MB per million tokens" %
+          (mode, count, grown / 1e6, grown / 1e6 / (count / 1e6)))
+
+
+def main():
+    # type: () -> None
+    "NOT_RPYTHON"
+    if len(sys.argv) > 2:
+        measure(sys.argv[2], int(sys.argv[1]))
+        return
+    reps = sys.argv[1] if len(sys.argv) > 1 else "5000"
+    for mode in ["list", "buffer"]:
+        subprocess.check_call([sys.executable, __file__, reps, mode])
+
+
+if __name__ == "__main__":
+    main()
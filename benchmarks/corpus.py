@@ -0,0 +1,157 @@
+"""Synthetic R corpora for the benchmarks.
+
+Usage: python benchmarks/corpus.py kind size [seed]
+
+Each kind stresses one part of the lexer and parser. Everything generated
+stays within the subset of R the parser currently accepts, and the same
+kind, size and seed always give the same bytes.
+"""
+from __future__ import print_function
+
+import random
+import sys
+
+from typing import Callable, Dict, List  # noqa
+
+OPERATORS = ["+", "-", "*", "/", "^", "%%", "<", "<=", "==", "!=",
+             ">=", ">", "&", "|", "&&", "||", ":", "~"]
+WORDS = ["alpha", "beta", "gamma", "delta", "total", "count", "value", "x",
+         "y", "z", "n", "data.frame", "my_var", "result", "i2"]
+
+
+def name(rng):
+    # type: (random.Random) -> str
+    return rng.choice(WORDS) + str(rng.randrange(100))
+
+
+def number(rng):
+    # type: (random.Random) -> str
+    return rng.choice([
+        str(rng.randrange(1000)),
+        "%dL" % rng.randrange(1 << 20),
+        "%.3f" % rng.random(),
+        "%de-%d" % (rng.randrange(1, 10), rng.randrange(1, 20)),
+        "0x%X" % rng.randrange(1 << 16),
+    ])
+
+
+def atom(rng):
+    # type: (random.Random) -> str
+    pick = rng.random()
+    if pick < 0.5:
+        return name(rng)
+    if pick < 0.85:
+        return number(rng)
+    if pick < 0.95:
+        return '"%s"' % rng.choice(WORDS)
+    return "NA"
+
+
+def expression(rng, depth):
+    # type: (random.Random, int) -> str
+    if depth <= 0 or rng.random() < 0.3:
+        return atom(rng)
+    left = expression(rng, depth - 1)
+    right = expression(rng, depth - 1)
+    if rng.random() < 0.3:
+        return "(%s %s %s)" % (left, rng.choice(OPERATORS), right)
+    return "%s %s %s" % (left, rng.choice(["+", "-", "*", "/"]), right)
+
+
+def nested(rng, out):
+    # type: (random.Random, List[str]) -> None
+    """Deeply nested braces and parentheses."""
+    depth = rng.randrange(10, 40)
+    for level in range(depth):
+        out.append("    " * level + "%s <- {\n" % name(rng))
+    expr = atom(rng)
+    for _ in range(depth):
+        expr = "(%s %s %s)" % (expr, rng.choice(OPERATORS[:5]), atom(rng))
+    out.append("    " * depth + expr + "\n")
+    for level in reversed(range(depth)):
+        out.append("    " * level + "}\n")
+
+
+def strings(rng, out):
+    # type: (random.Random, List[str]) -> None
+    """Long string literals, some with escaped quotes and newlines."""
+    quote = rng.choice("\"'")
+    parts = []
+    for _ in range(rng.randrange(20, 400)):
+        if rng.random() < 0.05:
+            parts.append("\\" + quote)
+        elif rng.random() < 0.02:
+            parts.append("\n")
+        else:
+            parts.append(rng.choice(WORDS))
+    out.append("%s <- %s%s%s\n" % (name(rng), quote, " ".join(parts), quote))
+
+
+def statements(rng, out):
+    # type: (random.Random, List[str]) -> None
+    """Many small statements, several to a line."""
+    line = []
+    for _ in range(rng.randrange(1, 5)):
+        line.append("%s %s %s" % (name(rng), rng.choice(["<-", "="]), atom(rng)))
+    out.append("; ".join(line) + "\n")
+
+
+def functions(rng, out):
+    # type: (random.Random, List[str]) -> None
+    """Function definitions with default arguments and bodies."""
+    formals = []
+    for _ in range(rng.randrange(0, 6)):
+        formal = name(rng)
+        if rng.random() < 0.4:
+            formal += " = " + atom(rng)
+        formals.append(formal)
+    out.append("%s <- function(%s) {\n" % (name(rng), ", ".join(formals)))
+    for _ in range(rng.randrange(1, 8)):
+        out.append("    %s <- %s\n" % (name(rng), expression(rng, 3)))
+    if rng.random() < 0.3:
+        out.append("    %s -> %s\n" % (expression(rng, 2), name(rng)))
+    out.append("    %s\n}\n" % expression(rng, 2))
+
+
+def comments(rng, out):
+    # type: (random.Random, List[str]) -> None
+    """Mostly comment lines, with the odd trailing comment."""
+    for _ in range(rng.randrange(2, 10)):
+        out.append("# %s\n" % " ".join(rng.choice(WORDS) for _ in range(rng.randrange(3, 15))))
+    out.append("%s <- %s  # %s\n" % (name(rng), expression(rng, 2), rng.choice(WORDS)))
+
+
+GENERATORS = {
+    "nested": nested,
+    "strings": strings,
+    "statements": statements,
+    "functions": functions,
+    "comments": comments,
+}  # type: Dict[str, Callable[[random.Random, List[str]], None]]
+
+KINDS = sorted(GENERATORS) + ["mixed"]
+
+
+def generate(kind, size, seed=0):
+    # type: (str, int, int) -> bytes
+    """Return at least size bytes of R source of the given kind; "mixed"
+    interleaves all the others."""
+    rng = random.Random("%s:%d" % (kind, seed))
+    kinds = sorted(GENERATORS) if kind == "mixed" else [kind]
+    out = []  # type: List[str]
+    length = 0
+    while length < size:
+        start = len(out)
+        GENERATORS[rng.choice(kinds)](rng, out)
+        length += sum(len(piece) for piece in out[start:])
+    return "".join(out).encode("ascii")
+
+
+def main():
+    # type: () -> None
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    sys.stdout.write(generate(sys.argv[1], int(sys.argv[2]), seed))
+
+
+if __name__ == "__main__":
+    main()
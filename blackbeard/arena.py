@@ -0,0 +1,453 @@
+"""A parsed tree stored as flat typed arrays.
+
+An Arena holds each node as one entry in a few parallel arrays: its kind, a
+flag (a value's NA), a kind-specific datum and the start of its children in
+one shared array of node indices. Children are appended as their parent is
+added, so a node's children run up to where the next node's start. Numbers,
+strings and operator names sit in constant pools and symbol names in a
+SymbolTable, each stored once.
+
+Nodes are added children first, and a node shared in the tree (ast.NA, or a
+literal the parser shared) is added once, so the root is the last node. A
+whole file costs a few dozen bytes per node and a handful of Python objects
+in all; arena.node() makes a view with the attributes of the ast class for
+code that wants one, and walk() and the index accessors visit nodes without
+making any.
+"""
+from array import array
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple  # noqa
+
+from blackbeard import ast
+from blackbeard.symtable import SymbolTable
+
+# Node kinds, and what a node's datum and children are.
+BLOCK = 0  # children: statements
+VECTOR = 1  # children: values
+INT = 2  # datum: index into ints
+FLOAT = 3  # datum: index into floats
+CHAR = 4  # datum: index into strings
+BOOL = 5  # datum: 0 or 1
+SYMBOL = 6  # datum: symbol id
+BINARY = 7  # datum: index into operators; children: left, right
+ASSIGN = 8  # children: target, value
+FORMALS = 9  # children: symbol and default for each formal, NO_NODE if none
+FUNCTION = 10  # children: formals, body
+
+NO_NODE = -1
+
+NODE_TYPES = [
+    ast.Block, ast.Vector, ast.IntValue, ast.FloatValue, ast.CharValue,
+    ast.BoolValue, ast.Symbol, ast.BinaryOperation, ast.Assign,
+    ast.FormalList, ast.Function,
+]
+
+
+class Arena(object):
+    def __init__(self, symtable=None):
+        # type: (Optional[SymbolTable]) -> None
+        self.kinds = array("B")
+        self.flags = array("B")
+        self.data = array("i")
+        # One more entry than there are nodes: node i's children are
+        # children[child_starts[i]:child_starts[i + 1]].
+        self.child_starts = array("i", [0])
+        self.children = array("i")
+        self.ints = array("i")
+        self.floats = array("d")
+        self.strings = []  # type: List[unicode]
+        self.operators = []  # type: List[bytes]
+        self.symtable = SymbolTable() if symtable is None else symtable
+
+    @staticmethod
+    def from_tree(tree, symtable=None):
+        # type: (ast.ASTNode, Optional[SymbolTable]) -> Arena
+        arena = Arena(symtable)
+        ArenaBuilder(arena).add(tree)
+        return arena
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.kinds)
+
+    @property
+    def root(self):
+        # type: () -> int
+        return len(self.kinds) - 1
+
+    def kind(self, i):
+        # type: (int) -> int
+        return self.kinds[i]
+
+    def child_count(self, i):
+        # type: (int) -> int
+        return self.child_starts[i + 1] - self.child_starts[i]
+
+    def child(self, i, k):
+        # type: (int, int) -> int
+        """The index of node i's kth child."""
+        assert 0 <= k < self.child_count(i)
+        return self.children[self.child_starts[i] + k]
+
+    def value(self, i):
+        # type: (int) -> object
+        """The value of an INT, FLOAT, CHAR or BOOL node."""
+        kind = self.kinds[i]
+        if kind == INT:
+            return self.ints[self.data[i]]
+        if kind == FLOAT:
+            return self.floats[self.data[i]]
+        if kind == CHAR:
+            return self.strings[self.data[i]]
+        assert kind == BOOL
+        return self.data[i] != 0
+
+    def na(self, i):
+        # type: (int) -> bool
+        return self.flags[i] != 0
+
+    def operator(self, i):
+        # type: (int) -> bytes
+        assert self.kinds[i] == BINARY
+        return self.operators[self.data[i]]
+
+    def symbol_name(self, i):
+        # type: (int) -> unicode
+        assert self.kinds[i] == SYMBOL
+        return self.symtable.name(self.data[i]).decode("utf-8")
+
+    def walk(self, i=-1):
+        # type: (int) -> Iterator[int]
+        """Yield the indices of node i (by default the root) and of every
+        node under it, parents before children. A shared node is visited
+        wherever it occurs."""
+        if i < 0:
+            i = self.root
+        stack = [i]
+        child_starts = self.child_starts
+        children = self.children
+        while stack:
+            i = stack.pop()
+            yield i
+            # Children are pushed last first, so they come out in order.
+            k = child_starts[i + 1] - 1
+            first = child_starts[i]
+            while k >= first:
+                child = children[k]
+                if child != NO_NODE:
+                    stack.append(child)
+                k -= 1
+
+    def node(self, i=-1):
+        # type: (int) -> NodeView
+        """A view of node i, by default the root."""
+        if i < 0:
+            i = self.root
+        return VIEWS[self.kinds[i]](self, i)
+
+    def to_tree(self):
+        # type: () -> ast.ASTNode
+        """Rebuild the tree as ast nodes, sharing the ones the arena shares,
+        with the Symbols of the arena's SymbolTable."""
+        nodes = [None] * len(self.kinds)  # type: List[Optional[ast.ASTNode]]
+        # Every node's children come before it.
+        for i in range(len(self.kinds)):
+            nodes[i] = self.make_node(i, nodes)
+        result = nodes[self.root]
+        assert result is not None
+        return result
+
+    def make_node(self, i, nodes):
+        # type: (int, Any) -> ast.ASTNode
+        # nodes maps the indices of node i's children to their ast nodes.
+        kind = self.kinds[i]
+        start = self.child_starts[i]
+        end = self.child_starts[i + 1]
+        children = [None if c == NO_NODE else nodes[c] for c in self.children[start:end]]
+        na = self.flags[i] != 0
+        if kind == BLOCK:
+            return ast.Block(children)
+        if kind == VECTOR:
+            vector = ast.Vector(children)
+            # The parser uses the one ast.NA for every NA; so does the tree.
+            if vector == ast.NA:
+                return ast.NA
+            return vector
+        if kind == INT:
+            return ast.IntValue(self.ints[self.data[i]], na)
+        if kind == FLOAT:
+            return ast.FloatValue(self.floats[self.data[i]], na)
+        if kind == CHAR:
+            return ast.CharValue(self.strings[self.data[i]], na)
+        if kind == BOOL:
+            return ast.BoolValue(self.data[i] != 0, na)
+        if kind == SYMBOL:
+            return self.symtable.symbol(self.data[i])
+        if kind == BINARY:
+            return ast.BinaryOperation(self.operators[self.data[i]], children[0], children[1])
+        if kind == ASSIGN:
+            return ast.Assign(children[0], children[1])
+        if kind == FORMALS:
+            formals = ast.FormalList()
+            for k in range(0, len(children), 2):
+                formals.append_formal(children[k], children[k + 1])
+            return formals
+        assert kind == FUNCTION
+        return ast.Function(children[0], children[1])
+
+
+class ArenaBuilder(object):
+    """Adds ast nodes to an arena, each distinct node and constant once."""
+    def __init__(self, arena):
+        # type: (Arena) -> None
+        self.arena = arena
+        self.indices = {}  # type: Dict[int, int]
+        # Kept alive so that the ids in indices stay unique.
+        self.added = []  # type: List[ast.ASTNode]
+        self.ints = {}  # type: Dict[int, int]
+        # Keyed by repr() so that 0.0 and -0.0 stay apart.
+        self.floats = {}  # type: Dict[str, int]
+        self.strings = {}  # type: Dict[unicode, int]
+        self.operators = {}  # type: Dict[bytes, int]
+
+    def add(self, tree):
+        # type: (ast.ASTNode) -> int
+        """Add tree, returning the index of its root."""
+        # An explicit stack, as a long chain of operators nests deeply. A
+        # node is pushed again with its children once they are pushed; the
+        # list is kept, as a Vector makes new Values each time it is asked.
+        stack = [(tree, None)]  # type: List[Tuple[ast.ASTNode, Any]]
+        while stack:
+            node, children = stack.pop()
+            if id(node) in self.indices:
+                continue
+            if children is None:
+                children = self.children(node)
+                stack.append((node, children))
+                for child in reversed(children):
+                    if child is not None and id(child) not in self.indices:
+                        stack.append((child, None))
+                continue
+            self.append(node, children)
+        return self.indices[id(tree)]
+
+    def children(self, node):
+        # type: (ast.ASTNode) -> List[Optional[ast.ASTNode]]
+        if isinstance(node, ast.Block):
+            return list(node.statements)
+        if isinstance(node, ast.Vector):
+            return list(node.values)
+        if isinstance(node, ast.BinaryOperation):
+            return [node.left, node.right]
+        if isinstance(node, ast.Assign):
+            return [node.target, node.value]
+        if isinstance(node, ast.FormalList):
+            result = []  # type: List[Optional[ast.ASTNode]]
+            for symbol, default in node.entries:
+                result.append(symbol)
+                result.append(default)
+            return result
+        if isinstance(node, ast.Function):
+            return [node.formals, node.body]
+        return []
+
+    def append(self, node, children):
+        # type: (ast.ASTNode, List[Optional[ast.ASTNode]]) -> None
+        arena = self.arena
+        kind, datum = self.kind_and_datum(node)
+        index = len(arena.kinds)
+        arena.kinds.append(kind)
+        arena.flags.append(1 if isinstance(node, ast.Value) and node.na else 0)
+        arena.data.append(datum)
+        for child in children:
+            arena.children.append(NO_NODE if child is None else self.indices[id(child)])
+        arena.child_starts.append(len(arena.children))
+        self.indices[id(node)] = index
+        self.added.append(node)
+
+    def kind_and_datum(self, node):
+        # type: (ast.ASTNode) -> Tuple[int, int]
+        if isinstance(node, ast.IntValue):
+            return INT, self.pooled(self.ints, node.value, node.value, self.arena.ints)
+        if isinstance(node, ast.FloatValue):
+            return FLOAT, self.pooled(self.floats, repr(node.value), node.value,
+                                      self.arena.floats)
+        if isinstance(node, ast.CharValue):
+            return CHAR, self.pooled(self.strings, node.value, node.value, self.arena.strings)
+        if isinstance(node, ast.BoolValue):
+            return BOOL, 1 if node.value else 0
+        if isinstance(node, ast.Symbol):
+            return SYMBOL, self.arena.symtable.intern(node.name.encode("utf-8"))
+        if isinstance(node, ast.BinaryOperation):
+            return BINARY, self.pooled(self.operators, node.operator, node.operator,
+                                       self.arena.operators)
+        for kind in [BLOCK, VECTOR, ASSIGN, FORMALS, FUNCTION]:
+            if type(node) is NODE_TYPES[kind]:
+                return kind, 0
+        raise TypeError("cannot store %r in an arena" % (node,))
+
+    def pooled(self, index, key, value, pool):
+        # type: (Dict, object, object, Any) -> int
+        i = index.get(key, -1)
+        if i < 0:
+            i = len(pool)
+            pool.append(value)
+            index[key] = i
+        return i
+
+
+class NodeView(object):
+    """A node of an arena, with the attributes of the ast class it stands
+    for. Views are made on demand and compare equal when they are views of
+    the same node."""
+    __slots__ = ("arena", "index")
+
+    def __init__(self, arena, index):
+        # type: (Arena, int) -> None
+        self.arena = arena
+        self.index = index
+
+    @property
+    def node_type(self):
+        # type: () -> type
+        return NODE_TYPES[self.arena.kinds[self.index]]
+
+    def child(self, k):
+        # type: (int) -> Optional[NodeView]
+        i = self.arena.child(self.index, k)
+        return None if i == NO_NODE else self.arena.node(i)
+
+    def child_views(self):
+        # type: () -> List[Optional[NodeView]]
+        return [self.child(k) for k in range(self.arena.child_count(self.index))]
+
+    def to_node(self):
+        # type: () -> ast.ASTNode
+        """The subtree under this node as ast nodes."""
+        arena = self.arena
+        nodes = {}  # type: Dict[int, ast.ASTNode]
+        for i in reversed(list(arena.walk(self.index))):
+            if i not in nodes:
+                nodes[i] = arena.make_node(i, nodes)
+        return nodes[self.index]
+
+    def __eq__(self, other):
+        # type: (object) -> bool
+        return (isinstance(other, NodeView) and self.arena is other.arena and
+                self.index == other.index)
+
+    def __ne__(self, other):
+        # type: (object) -> bool
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        # type: () -> int
+        return hash((id(self.arena), self.index))
+
+    def __repr__(self):
+        # type: () -> str
+        return repr(self.to_node())
+
+
+class BlockView(NodeView):
+    __slots__ = ()
+
+    @property
+    def statements(self):
+        # type: () -> List[Optional[NodeView]]
+        return self.child_views()
+
+
+class VectorView(NodeView):
+    __slots__ = ()
+
+    @property
+    def values(self):
+        # type: () -> List[Optional[NodeView]]
+        return self.child_views()
+
+
+class ValueView(NodeView):
+    __slots__ = ()
+
+    @property
+    def value(self):
+        # type: () -> object
+        return self.arena.value(self.index)
+
+    @property
+    def na(self):
+        # type: () -> bool
+        return self.arena.na(self.index)
+
+
+class SymbolView(NodeView):
+    __slots__ = ()
+
+    @property
+    def name(self):
+        # type: () -> unicode
+        return self.arena.symbol_name(self.index)
+
+
+class BinaryOperationView(NodeView):
+    __slots__ = ()
+
+    @property
+    def operator(self):
+        # type: () -> bytes
+        return self.arena.operator(self.index)
+
+    @property
+    def left(self):
+        # type: () -> Optional[NodeView]
+        return self.child(0)
+
+    @property
+    def right(self):
+        # type: () -> Optional[NodeView]
+        return self.child(1)
+
+
+class AssignView(NodeView):
+    __slots__ = ()
+
+    @property
+    def target(self):
+        # type: () -> Optional[NodeView]
+        return self.child(0)
+
+    @property
+    def value(self):
+        # type: () -> Optional[NodeView]
+        return self.child(1)
+
+
+class FormalListView(NodeView):
+    __slots__ = ()
+
+    @property
+    def entries(self):
+        # type: () -> List[Tuple[Optional[NodeView], Optional[NodeView]]]
+        views = self.child_views()
+        return [(views[k], views[k + 1]) for k in range(0, len(views), 2)]
+
+
+class FunctionView(NodeView):
+    __slots__ = ()
+
+    @property
+    def formals(self):
+        # type: () -> Optional[NodeView]
+        return self.child(0)
+
+    @property
+    def body(self):
+        # type: () -> Optional[NodeView]
+        return self.child(1)
+
+
+VIEWS = [
+    BlockView, VectorView, ValueView, ValueView, ValueView, ValueView,
+    SymbolView, BinaryOperationView, AssignView, FormalListView, FunctionView,
+]
@@ -1,13 +1,62 @@
+import struct
+
 from rply.token import BaseBox, Token  # noqa:F401
-from typing import Any, Optional, Tuple  # noqa:F401
+from typing import Any, Iterator, List, Optional, Tuple  # noqa:F401
 
 
 class ASTNode(BaseBox):
+    # Nodes keep their attributes in slots. BaseBox has no __slots__, so
+    # instances could still grow a __dict__, but as every attribute has a
+    # slot none is ever made. _fields lists the attributes, in the order
+    # equality compares them.
+    #
+    # _hash caches the node's structural hash once it is asked for. A node
+    # must not change once it or a tree holding it has been hashed; append()
+    # and the like forget only the node's own hash.
+    #
+    # _double_fields lists the fields holding doubles, which compare and
+    # hash bit for bit, so that 0.0 and -0.0 stay apart.
+    __slots__ = ("_hash",)
+    _fields = ()  # type: Tuple[str, ...]
+    _double_fields = ()  # type: Tuple[str, ...]
+
+    def __hash__(self):
+        # type: () -> int
+        h = getattr(self, "_hash", None)
+        if h is None:
+            h = structural_hash(self)
+        return h
+
     def __eq__(self, other):
         # type: (object) -> bool
+        if self is other:
+            return True
         if not isinstance(other, ASTNode):
             return NotImplemented
-        return type(self) is type(other) and self.__dict__ == other.__dict__
+        if type(self) is not type(other):
+            return False
+        # Hashes already known settle most inequalities without a walk, and
+        # children shared by hash-consing compare by identity.
+        h = getattr(self, "_hash", None)
+        other_h = getattr(other, "_hash", None)
+        if h is not None and other_h is not None and h != other_h:
+            return False
+        for field in self._fields:
+            mine = getattr(self, field)
+            theirs = getattr(other, field)
+            if field in self._double_fields:
+                mine = _double_key(mine)
+                theirs = _double_key(theirs)
+            if mine != theirs:
+                return False
+        return True
+
+    def __ne__(self, other):
+        # type: (object) -> bool
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
 
     def __repr__(self):
         # type: () -> bytes
@@ -15,6 +64,8 @@ class ASTNode(BaseBox):
 
 
 class Block(ASTNode):
+    __slots__ = _fields = ("statements",)
+
     def __init__(self, statements):
         # type: (List[ASTNode]) -> None
         self.statements = [s for s in statements if s]
@@ -28,11 +79,13 @@ class Block(ASTNode):
         # type: (Block) -> Block
         assert isinstance(other, Block)
         self.statements.extend(other.statements)
+        self._hash = None
         return self
 
     def append(self, statement):
         # type: (ASTNode) -> Block
         self.statements.append(statement)
+        self._hash = None
         return self
 
     def __repr__(self):
@@ -41,16 +94,175 @@ class Block(ASTNode):
 
 
 class Vector(ASTNode):
+    """A literal vector.
+
+    Its elements are kept without a Value each, in the typed list for the
+    vector's type: logicals, integers, doubles or characters, the others
+    being None. Translated, those lists hold the numbers themselves. na
+    (None when no element is NA) marks the NA elements. Elements keep their
+    value when NA, as the Values they come from do. values gives the
+    elements as Values, made when they are asked for. A vector whose values
+    are not all of one type keeps the Value objects themselves, in generic,
+    and has the type GENERIC.
+    """
+    __slots__ = _fields = ("type", "logicals", "integers", "doubles", "characters",
+                           "generic", "na")
+    _double_fields = ("doubles",)
+
+    # Values of type, in the order R's atomic types coerce to each other.
+    LOGICAL = 0
+    INTEGER = 1
+    DOUBLE = 2
+    CHARACTER = 3
+    GENERIC = 4
+
     def __init__(self, values):
         # type: (List[Value]) -> None
-        self.values = values
+        self.type = _common_type(values)
+        self.logicals = None  # type: Optional[List[bool]]
+        self.integers = None  # type: Optional[List[int]]
+        self.doubles = None  # type: Optional[List[float]]
+        self.characters = None  # type: Optional[List[unicode]]
+        self.generic = None  # type: Optional[List[Value]]
+        self.na = None  # type: Optional[List[bool]]
+        if self.type == Vector.GENERIC:
+            self.generic = list(values)
+            return
+        if self.type == Vector.LOGICAL:
+            self.logicals = []
+        elif self.type == Vector.INTEGER:
+            self.integers = []
+        elif self.type == Vector.DOUBLE:
+            self.doubles = []
+        else:
+            self.characters = []
+        na = [False] * len(values)
+        has_na = False
+        for i in range(len(values)):
+            value = values[i]
+            if isinstance(value, BoolValue):
+                self.logicals.append(value.value)
+            elif isinstance(value, IntValue):
+                self.integers.append(value.value)
+            elif isinstance(value, FloatValue):
+                self.doubles.append(value.value)
+            elif isinstance(value, CharValue):
+                self.characters.append(value.value)
+            if value.na:
+                na[i] = True
+                has_na = True
+        if has_na:
+            self.na = na
+
+    @staticmethod
+    def from_data(value_type, data, na=None):
+        # type: (int, List[Any], Optional[List[bool]]) -> Vector
+        """NOT_RPYTHON
+        A vector of value_type over data, a list as Vector keeps it, without
+        boxing its elements. na is taken as it is when any element is NA."""
+        assert value_type != Vector.GENERIC
+        vector = Vector([])
+        vector.type = value_type
+        vector.logicals = data if value_type == Vector.LOGICAL else None
+        vector.integers = data if value_type == Vector.INTEGER else None
+        vector.doubles = data if value_type == Vector.DOUBLE else None
+        vector.characters = data if value_type == Vector.CHARACTER else None
+        vector.na = na if na is not None and any(na) else None
+        return vector
+
+    @property
+    def values(self):
+        # type: () -> VectorValues
+        return VectorValues(self)
+
+    def length(self):
+        # type: () -> int
+        if self.type == Vector.LOGICAL:
+            return len(self.logicals)
+        if self.type == Vector.INTEGER:
+            return len(self.integers)
+        if self.type == Vector.DOUBLE:
+            return len(self.doubles)
+        if self.type == Vector.CHARACTER:
+            return len(self.characters)
+        return len(self.generic)
+
+    def is_na(self, i):
+        # type: (int) -> bool
+        if self.type == Vector.GENERIC:
+            return self.generic[i].na
+        return self.na is not None and self.na[i]
+
+    def element(self, i):
+        # type: (int) -> Value
+        """Element i, as a Value."""
+        na = self.is_na(i)
+        if self.type == Vector.LOGICAL:
+            value = self.logicals[i]
+            if na:
+                return NA_LOGICAL if not value else BoolValue(True, na=True)
+            return TRUE if value else FALSE
+        if self.type == Vector.INTEGER:
+            return IntValue(self.integers[i], na)
+        if self.type == Vector.DOUBLE:
+            return FloatValue(self.doubles[i], na)
+        if self.type == Vector.CHARACTER:
+            return CharValue(self.characters[i], na)
+        return self.generic[i]
 
     def __repr__(self):
         # type: () -> bytes
         return "ast.Vector(%s)" % (str(self.values))
 
 
+class VectorValues(object):
+    """A vector's elements as a read-only sequence of Values."""
+    __slots__ = ("vector",)
+
+    def __init__(self, vector):
+        # type: (Vector) -> None
+        self.vector = vector
+
+    def __len__(self):
+        # type: () -> int
+        return self.vector.length()
+
+    def __getitem__(self, i):
+        # type: (Any) -> Any
+        if isinstance(i, slice):
+            return [self.vector.element(k) for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("vector index out of range")
+        return self.vector.element(i)
+
+    def __iter__(self):
+        # type: () -> Iterator[Value]
+        for i in range(len(self)):
+            yield self.vector.element(i)
+
+    def __eq__(self, other):
+        # type: (object) -> bool
+        if not isinstance(other, (list, VectorValues)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        # type: (object) -> bool
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        # type: () -> bytes
+        return repr(list(self))
+
+
 class Value(ASTNode):
+    __slots__ = _fields = ("value", "na")
+
     def __init__(self, value, na=False):
         # type: (Any, bool) -> None
         raise NotImplementedError
@@ -61,6 +273,8 @@ class Value(ASTNode):
 
 
 class IntValue(Value):
+    __slots__ = ()
+
     def __init__(self, value, na=False):
         # type: (int, bool) -> None
         assert isinstance(value, int)
@@ -74,6 +288,8 @@ class IntValue(Value):
 
 
 class CharValue(Value):
+    __slots__ = ()
+
     def __init__(self, value, na=False):
         # type: (unicode, bool) -> None
         assert isinstance(value, unicode)
@@ -87,6 +303,9 @@ class CharValue(Value):
 
 
 class FloatValue(Value):
+    __slots__ = ()
+    _double_fields = ("value",)
+
     def __init__(self, value, na=False):
         # type: (float, bool) -> None
         assert isinstance(value, float)
@@ -100,6 +319,8 @@ class FloatValue(Value):
 
 
 class BoolValue(Value):
+    __slots__ = ()
+
     def __init__(self, value, na=False):
         # type: (bool, bool) -> None
         assert isinstance(value, bool)
@@ -113,6 +334,8 @@ class BoolValue(Value):
 
 
 class Symbol(ASTNode):
+    __slots__ = _fields = ("name",)
+
     def __init__(self, name):
         # type: (unicode) -> None
         self.name = name
@@ -123,6 +346,8 @@ class Symbol(ASTNode):
 
 
 class BinaryOperation(ASTNode):
+    __slots__ = _fields = ("operator", "left", "right")
+
     def __init__(self, operator, left, right):
         # type: (Token, ASTNode, ASTNode) -> None
         self.operator = operator
@@ -136,6 +361,8 @@ class BinaryOperation(ASTNode):
 
 
 class Assign(ASTNode):
+    __slots__ = _fields = ("target", "value")
+
     def __init__(self, target, value):
         # type: (ASTNode, ASTNode) -> None
         self.target = target
@@ -147,13 +374,17 @@ class Assign(ASTNode):
 
 
 class FormalList(ASTNode):
-    def __init__(self, entries=[]):
-        # type: (Symbol, List[Tuple[Symbol, Optional[ASTNode]]]) -> None
-        self.entries = entries
+    __slots__ = _fields = ("entries",)
+
+    def __init__(self, entries=None):
+        # type: (Optional[List[Tuple[Symbol, Optional[ASTNode]]]]) -> None
+        # Not a default of []: append_formal() would add to that shared list.
+        self.entries = [] if entries is None else entries
 
     def append_formal(self, symbol, value=None):
         # type: (Symbol, Optional[ASTNode]) -> FormalList
         self.entries.append((symbol, value))
+        self._hash = None
         return self
 
     def __repr__(self):
@@ -162,6 +393,8 @@ class FormalList(ASTNode):
 
 
 class Function(ASTNode):
+    __slots__ = _fields = ("formals", "body")
+
     def __init__(self, formals, body):
         # type: (FormalList, ASTNode) -> None
         self.formals = formals
@@ -170,3 +403,93 @@ class Function(ASTNode):
     def __repr__(self):
         # type: () -> bytes
         return "ast.Function(%s, %s)" % (str(self.formals), str(self.body))
+
+
+def _common_type(values):
+    # type: (List[Value]) -> int
+    """The Vector type of values, GENERIC unless they are of one type."""
+    if not values:
+        return Vector.LOGICAL
+    value_type = _value_type(values[0])
+    for value in values:
+        if _value_type(value) != value_type:
+            return Vector.GENERIC
+    return value_type
+
+
+def _value_type(value):
+    # type: (Value) -> int
+    if isinstance(value, BoolValue):
+        return Vector.LOGICAL
+    if isinstance(value, IntValue):
+        return Vector.INTEGER
+    if isinstance(value, FloatValue):
+        return Vector.DOUBLE
+    if isinstance(value, CharValue):
+        return Vector.CHARACTER
+    return Vector.GENERIC
+
+
+def structural_hash(node):
+    # type: (ASTNode) -> int
+    """node's hash, computed from its type and fields and cached in it and
+    every node under it. Nodes equal by == hash equally."""
+    # An explicit stack, as a long chain of operators nests deeply; a node
+    # is hashed once the children it holds have been.
+    stack = [node]
+    while stack:
+        top = stack[-1]
+        pending = len(stack)
+        for field in top._fields:
+            _push_unhashed(stack, getattr(top, field))
+        if len(stack) == pending:
+            stack.pop()
+            key = [type(top).__name__]
+            for field in top._fields:
+                value = getattr(top, field)
+                if field in top._double_fields:
+                    value = _double_key(value)
+                key.append(_hash_key(value))
+            top._hash = hash(tuple(key))
+    return node._hash
+
+
+def _push_unhashed(stack, value):
+    # type: (List[ASTNode], Any) -> None
+    if isinstance(value, ASTNode):
+        if getattr(value, "_hash", None) is None:
+            stack.append(value)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _push_unhashed(stack, item)
+
+
+def _hash_key(value):
+    # type: (Any) -> Any
+    if isinstance(value, ASTNode):
+        return value._hash
+    if isinstance(value, (list, tuple)):
+        return tuple([_hash_key(item) for item in value])
+    return value
+
+
+def _double_key(value):
+    # type: (Any) -> Optional[bytes]
+    """value, a double or a list of them (or None), as bytes that compare
+    equal only for the same bits."""
+    if value is None:
+        return None
+    if isinstance(value, float):
+        return struct.pack("<d", value)
+    return struct.pack("<%dd" % len(value), *value)
+
+
+# Shared instances of common literals. Nodes are not changed once the parser
+# has built them, except for the Blocks and FormalLists it is still growing,
+# so values and vectors can be shared.
+NA_LOGICAL = BoolValue(False, na=True)
+NA_INTEGER = IntValue(0, na=True)
+NA_REAL = FloatValue(0.0, na=True)
+TRUE = BoolValue(True)
+FALSE = BoolValue(False)
+NA = Vector([NA_LOGICAL])
@@ -0,0 +1,548 @@
+"""An on-disk cache of parsed trees, keyed by source text.
+
+Much like a .pyc file, an entry lets an unchanged source skip the lexer and
+parser: it is named for a SHA-1 of the parser version and the source, and
+holds the tree in the compact binary encoding written by encode(). The
+parser version covers this package's version, the encoding's FORMAT and
+the text of the modules that decide what tree a source parses to, so
+entries written by another parser are never found.
+
+Entries are written to a temporary file and renamed into place, so
+concurrent writers and readers only ever see whole entries. Reading an
+entry touches its modification time, and once the cache grows past
+max_bytes the least recently used entries are removed.
+"""
+import hashlib
+import os
+import time
+
+from rpython.rlib.listsort import make_timsort_class
+from rpython.rlib.rfloat import DTSF_ADD_DOT_0, formatd
+from rpython.rlib.objectmodel import we_are_translated
+from rpython.rlib.rarithmetic import intmask
+from typing import Any, Dict, List, Optional  # noqa
+
+from blackbeard import ast
+from blackbeard.symtable import SymbolTable
+from blackbeard.version import __version__
+
+# Bump whenever the encoding changes.
+FORMAT = 1
+MAGIC = "BBAST%d\n" % FORMAT
+
+SUFFIX = ".ast"
+TMP_SUFFIX = ".tmp"
+DEFAULT_MAX_BYTES = 256 << 20
+# Temporary files older than this were left by a writer that died.
+STALE_TMP_SECONDS = 600.0
+
+TAG_NONE = 0
+TAG_BLOCK = 1
+TAG_VECTOR = 2
+TAG_INT = 3
+TAG_FLOAT = 4
+TAG_CHAR = 5
+TAG_BOOL = 6
+TAG_SYMBOL = 7
+TAG_SYMBOL_REF = 8
+TAG_BINARY = 9
+TAG_ASSIGN = 10
+TAG_FORMALS = 11
+TAG_FUNCTION = 12
+
+
+class CorruptEntry(Exception):
+    pass
+
+
+def _parser_version():
+    # type: () -> str
+    "NOT_RPYTHON"
+    hasher = hashlib.sha1("%s:%d" % (__version__, FORMAT))
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in ["ast.py", "lexer.py", "parser.py", "pratt.py", "symtable.py"]:
+        with open(os.path.join(directory, name), "rb") as f:
+            hasher.update(f.read())
+    return hasher.hexdigest()
+
+
+PARSER_VERSION = _parser_version()
+
+
+def source_key(source):
+    # type: (Any) -> str
+    if we_are_translated():
+        # Imported here as it drags in the low-level type system.
+        from rpython.rlib import rsha
+        rhasher = rsha.new(PARSER_VERSION)
+        rhasher.update(source)
+        return rhasher.hexdigest()
+    # rsha is far too slow to run untranslated.
+    hasher = hashlib.sha1(PARSER_VERSION)
+    hasher.update(source)
+    return hasher.hexdigest()
+
+
+class Encoder(object):
+    def __init__(self):
+        # type: () -> None
+        self.pieces = []  # type: List[str]
+        self.symbols = {}  # type: Dict[unicode, int]
+
+    def write_uint(self, n):
+        # type: (int) -> None
+        assert n >= 0
+        while n >= 0x80:
+            self.pieces.append(chr((n & 0x7f) | 0x80))
+            n >>= 7
+        self.pieces.append(chr(n))
+
+    def write_int(self, n):
+        # type: (int) -> None
+        if n >= 0:
+            self.write_uint(n << 1)
+        else:
+            self.write_uint(((-1 - n) << 1) | 1)
+
+    def write_bytes(self, s):
+        # type: (str) -> None
+        self.write_uint(len(s))
+        self.pieces.append(s)
+
+    def write_float(self, x):
+        # type: (float) -> None
+        # repr() round-trips exactly, including infinities and -0.0. The
+        # rtyper has no repr() of a float, and formatd() gives the same text
+        # but is far too slow to run untranslated.
+        if we_are_translated():
+            self.write_bytes(formatd(x, "r", 0, DTSF_ADD_DOT_0))
+        else:
+            self.write_bytes(repr(x))
+
+    def node(self, node):
+        # type: (Optional[ast.ASTNode]) -> None
+        # An explicit stack, as a long chain of operators nests deeply. The
+        # nodes under a node are pushed last first, so they are written in
+        # order after it.
+        stack = [node]  # type: List[Optional[ast.ASTNode]]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                self.write_uint(TAG_NONE)
+            elif isinstance(node, ast.Block):
+                self.write_uint(TAG_BLOCK)
+                self.write_uint(len(node.statements))
+                for i in range(len(node.statements) - 1, -1, -1):
+                    stack.append(node.statements[i])
+            elif isinstance(node, ast.Vector):
+                self.write_uint(TAG_VECTOR)
+                self.write_uint(node.length())
+                for i in range(node.length()):
+                    self.value(node.element(i))
+            elif isinstance(node, ast.Value):
+                self.value(node)
+            elif isinstance(node, ast.Symbol):
+                self.symbol(node)
+            elif isinstance(node, ast.BinaryOperation):
+                self.write_uint(TAG_BINARY)
+                self.write_bytes(node.operator)
+                stack.append(node.right)
+                stack.append(node.left)
+            elif isinstance(node, ast.Assign):
+                self.write_uint(TAG_ASSIGN)
+                stack.append(node.value)
+                stack.append(node.target)
+            elif isinstance(node, ast.FormalList):
+                self.write_uint(TAG_FORMALS)
+                self.write_uint(len(node.entries))
+                for i in range(len(node.entries) - 1, -1, -1):
+                    symbol, value = node.entries[i]
+                    stack.append(value)
+                    stack.append(symbol)
+            elif isinstance(node, ast.Function):
+                self.write_uint(TAG_FUNCTION)
+                stack.append(node.body)
+                stack.append(node.formals)
+            else:
+                raise TypeError("cannot encode %s" % node.__class__.__name__)
+
+    def value(self, value):
+        # type: (ast.Value) -> None
+        if isinstance(value, ast.IntValue):
+            self.write_uint(TAG_INT)
+            self.write_uint(int(value.na))
+            self.write_int(value.value)
+        elif isinstance(value, ast.FloatValue):
+            self.write_uint(TAG_FLOAT)
+            self.write_uint(int(value.na))
+            self.write_float(value.value)
+        elif isinstance(value, ast.CharValue):
+            self.write_uint(TAG_CHAR)
+            self.write_uint(int(value.na))
+            self.write_bytes(value.value.encode("utf-8"))
+        else:
+            assert isinstance(value, ast.BoolValue)
+            self.write_uint(TAG_BOOL)
+            self.write_uint(int(value.na))
+            self.write_uint(int(value.value))
+
+    def symbol(self, symbol):
+        # type: (ast.Symbol) -> None
+        # Each name is written once; the decoder interns it again.
+        index = self.symbols.get(symbol.name, -1)
+        if index >= 0:
+            self.write_uint(TAG_SYMBOL_REF)
+            self.write_uint(index)
+        else:
+            self.symbols[symbol.name] = len(self.symbols)
+            self.write_uint(TAG_SYMBOL)
+            self.write_bytes(symbol.name.encode("utf-8"))
+
+
+class _Frame(object):
+    """A node being decoded: its tag, and the nodes under it read so far out
+    of the count it has."""
+    def __init__(self, tag, count, operator=""):
+        # type: (int, int, str) -> None
+        self.tag = tag
+        self.count = count
+        self.operator = operator
+        self.children = []  # type: List[Optional[ast.ASTNode]]
+
+
+class Decoder(object):
+    def __init__(self, data, pos, symtable):
+        # type: (str, int, SymbolTable) -> None
+        self.data = data
+        self.pos = pos
+        self.symtable = symtable
+        self.symbols = []  # type: List[ast.Symbol]
+
+    def read_byte(self):
+        # type: () -> int
+        if self.pos >= len(self.data):
+            raise CorruptEntry
+        ch = self.data[self.pos]
+        self.pos += 1
+        return ord(ch)
+
+    def read_uint(self):
+        # type: () -> int
+        n = 0
+        shift = 0
+        while True:
+            b = self.read_byte()
+            n |= (b & 0x7f) << shift
+            if b < 0x80:
+                return n
+            shift += 7
+            if shift > 63:
+                raise CorruptEntry
+
+    def read_int(self):
+        # type: () -> int
+        n = self.read_uint()
+        if n & 1:
+            return -1 - (n >> 1)
+        return n >> 1
+
+    def read_bytes(self):
+        # type: () -> str
+        length = self.read_uint()
+        start = self.pos
+        end = start + length
+        # A corrupt length can be big enough to wrap around.
+        if length < 0 or end > len(self.data):
+            raise CorruptEntry
+        self.pos = end
+        assert start >= 0
+        assert end >= 0
+        return self.data[start:end]
+
+    def read_float(self):
+        # type: () -> float
+        try:
+            return float(self.read_bytes())
+        except ValueError:
+            raise CorruptEntry
+
+    def node(self):
+        # type: () -> Optional[ast.ASTNode]
+        # Nodes holding others wait on a stack of frames until the nodes
+        # under them have been read, as a long chain of operators nests
+        # deeply.
+        frames = []  # type: List[_Frame]
+        while True:
+            tag = self.read_uint()
+            if tag == TAG_BLOCK:
+                frames.append(_Frame(tag, self.read_uint()))
+            elif tag == TAG_BINARY:
+                frames.append(_Frame(tag, 2, self.read_bytes()))
+            elif tag == TAG_ASSIGN or tag == TAG_FUNCTION:
+                frames.append(_Frame(tag, 2))
+            elif tag == TAG_FORMALS:
+                frames.append(_Frame(tag, 2 * self.read_uint()))
+            else:
+                node = self.leaf(tag)
+                if not frames:
+                    return node
+                frames[-1].children.append(node)
+            while frames and len(frames[-1].children) == frames[-1].count:
+                node = self.build(frames.pop())
+                if not frames:
+                    return node
+                frames[-1].children.append(node)
+
+    def leaf(self, tag):
+        # type: (int) -> Optional[ast.ASTNode]
+        if tag == TAG_NONE:
+            return None
+        elif tag == TAG_VECTOR:
+            count = self.read_uint()
+            values = []  # type: List[ast.Value]
+            for _ in range(count):
+                values.append(self.value(self.read_uint()))
+            return ast.Vector(values)
+        elif tag == TAG_SYMBOL or tag == TAG_SYMBOL_REF:
+            return self.symbol(tag)
+        return self.value(tag)
+
+    def value(self, tag):
+        # type: (int) -> ast.Value
+        if tag == TAG_INT:
+            na = self.read_uint() != 0
+            return ast.IntValue(self.read_int(), na)
+        elif tag == TAG_FLOAT:
+            na = self.read_uint() != 0
+            return ast.FloatValue(self.read_float(), na)
+        elif tag == TAG_CHAR:
+            na = self.read_uint() != 0
+            return ast.CharValue(self.read_bytes().decode("utf-8"), na)
+        elif tag == TAG_BOOL:
+            na = self.read_uint() != 0
+            return ast.BoolValue(self.read_uint() != 0, na)
+        raise CorruptEntry
+
+    def build(self, frame):
+        # type: (_Frame) -> ast.ASTNode
+        """The node frame stands for, once all the nodes under it are
+        read."""
+        children = frame.children
+        if frame.tag == TAG_FORMALS:
+            formals = ast.FormalList([])
+            for i in range(0, len(children), 2):
+                symbol = children[i]
+                if not isinstance(symbol, ast.Symbol):
+                    raise CorruptEntry
+                formals.append_formal(symbol, children[i + 1])
+            return formals
+        for child in children:
+            if child is None:
+                raise CorruptEntry
+        if frame.tag == TAG_BLOCK:
+            return ast.Block(children)
+        elif frame.tag == TAG_BINARY:
+            return ast.BinaryOperation(frame.operator, children[0], children[1])
+        elif frame.tag == TAG_ASSIGN:
+            return ast.Assign(target=children[0], value=children[1])
+        assert frame.tag == TAG_FUNCTION
+        formals = children[0]
+        if not isinstance(formals, ast.FormalList):
+            raise CorruptEntry
+        return ast.Function(formals, children[1])
+
+    def required_node(self):
+        # type: () -> ast.ASTNode
+        node = self.node()
+        if node is None:
+            raise CorruptEntry
+        return node
+
+    def symbol(self, tag):
+        # type: (int) -> ast.Symbol
+        if tag == TAG_SYMBOL_REF:
+            index = self.read_uint()
+            if index >= len(self.symbols):
+                raise CorruptEntry
+            return self.symbols[index]
+        symtable = self.symtable
+        symbol = symtable.symbol(symtable.intern(self.read_bytes()))
+        self.symbols.append(symbol)
+        return symbol
+
+
+def encode(node, source_length):
+    # type: (ast.ASTNode, int) -> str
+    encoder = Encoder()
+    encoder.pieces.append(MAGIC)
+    encoder.write_uint(source_length)
+    encoder.node(node)
+    return "".join(encoder.pieces)
+
+
+def decode(data, source_length, symtable):
+    # type: (str, int, SymbolTable) -> ast.ASTNode
+    """Decode what encode() wrote, interning symbols in symtable. Raises
+    CorruptEntry if data is not such an encoding of a source of
+    source_length bytes."""
+    if not data.startswith(MAGIC):
+        raise CorruptEntry
+    decoder = Decoder(data, len(MAGIC), symtable)
+    if decoder.read_uint() != source_length:
+        raise CorruptEntry
+    node = decoder.required_node()
+    if decoder.pos != len(data):
+        raise CorruptEntry
+    return node
+
+
+class _Entry(object):
+    def __init__(self, path, size, mtime):
+        # type: (str, int, float) -> None
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+
+
+def _older(a, b):
+    # type: (_Entry, _Entry) -> bool
+    return a.mtime < b.mtime
+
+
+_EntrySort = make_timsort_class(lt=_older)
+
+
+def _read_file(path):
+    # type: (str) -> str
+    fd = os.open(path, os.O_RDONLY, 0)
+    try:
+        chunks = []  # type: List[str]
+        while True:
+            data = os.read(fd, 65536)
+            if not data:
+                break
+            chunks.append(data)
+    finally:
+        os.close(fd)
+    return "".join(chunks)
+
+
+def _remove(path):
+    # type: (str) -> None
+    try:
+        os.unlink(path)
+    except OSError:
+        # Removed by another process already.
+        pass
+
+
+def _makedirs(directory):
+    # type: (str) -> None
+    # os.makedirs(), which RPython cannot annotate.
+    end = directory.rfind(os.sep)
+    if end > 0:
+        parent = directory[:end]
+        if not os.path.isdir(parent):
+            _makedirs(parent)
+    os.mkdir(directory, 0o777)
+
+
+class ASTCache(object):
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        # type: (str, int) -> None
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Bytes in the cache as of the last scan plus what this process has
+        # written since, or -1 before the first scan.
+        self.total = -1
+        self.writes = 0
+
+    def path(self, key):
+        # type: (str) -> str
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, source, symtable):
+        # type: (Any, SymbolTable) -> Optional[ast.ASTNode]
+        """The cached tree for source, with its symbols interned in
+        symtable, or None."""
+        path = self.path(source_key(source))
+        try:
+            data = _read_file(path)
+        except OSError:
+            return None
+        try:
+            node = decode(data, len(source), symtable)
+        except (CorruptEntry, UnicodeDecodeError):
+            _remove(path)
+            return None
+        try:
+            # Mark the entry as recently used.
+            os.utime(path, None)
+        except OSError:
+            pass
+        return node
+
+    def put(self, source, node):
+        # type: (Any, ast.ASTNode) -> None
+        data = encode(node, len(source))
+        key = source_key(source)
+        if not os.path.isdir(self.directory):
+            try:
+                _makedirs(self.directory)
+            except OSError:
+                # Lost a race to create it, or the cache is unusable.
+                if not os.path.isdir(self.directory):
+                    return
+        self.writes += 1
+        tmp = os.path.join(self.directory, "%s.%d.%d%s" % (key, os.getpid(), self.writes, TMP_SUFFIX))
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            try:
+                written = 0
+                while written < len(data):
+                    written += os.write(fd, data[written:])
+            finally:
+                os.close(fd)
+            os.rename(tmp, self.path(key))
+        except OSError:
+            _remove(tmp)
+            return
+        if self.total < 0:
+            self.evict()
+        else:
+            self.total += len(data)
+            if self.total > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        # type: () -> None
+        """Rescan the cache, removing the least recently used entries if it
+        holds more than max_bytes, down to nine tenths of that."""
+        entries = []  # type: List[_Entry]
+        total = 0
+        now = time.time()
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if name.endswith(TMP_SUFFIX):
+                if st.st_mtime < now - STALE_TMP_SECONDS:
+                    _remove(path)
+            elif name.endswith(SUFFIX):
+                entries.append(_Entry(path, intmask(st.st_size), st.st_mtime))
+                total += intmask(st.st_size)
+        if total > self.max_bytes:
+            _EntrySort(entries).sort()
+            limit = self.max_bytes // 10 * 9
+            for entry in entries:
+                if total <= limit:
+                    break
+                _remove(entry.path)
+                total -= entry.size
+        self.total = total
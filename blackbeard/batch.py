@@ -0,0 +1,152 @@
+"""NOT_RPYTHON
+
+Parse many files at once in a pool of worker processes, streaming a result
+for each file back as it finishes.
+
+The LR tables are built when blackbeard.parser is imported, before the pool
+starts, so forked workers share them instead of building their own.
+"""
+import multiprocessing
+import os
+import time
+
+from rply.errors import ParsingError
+from typing import Iterable, Iterator, List, Optional, Tuple  # noqa
+
+from blackbeard import ast
+from blackbeard.lexer import Lexer, LexerError
+from blackbeard.parser import Parser, parse
+from blackbeard.source import open_source
+
+SUFFIXES = (".R", ".r")
+
+
+class FileResult(object):
+    """The outcome of parsing one file: how many top-level statements it
+    holds, or why it failed, and how long parsing took."""
+    def __init__(self, path, size, seconds, statements=0, error=None):
+        # type: (str, int, float, int, Optional[str]) -> None
+        self.path = path
+        self.size = size
+        self.seconds = seconds
+        self.statements = statements
+        self.error = error
+
+    def __repr__(self):
+        # type: () -> str
+        if self.error is not None:
+            return "%s: %s" % (self.path, self.error)
+        return "%s: %d statements" % (self.path, self.statements)
+
+
+class Summary(object):
+    """Totals over a batch; seconds is wall-clock time, not the sum of the
+    files' parse times."""
+    def __init__(self):
+        # type: () -> None
+        self.files = 0
+        self.errors = 0
+        self.size = 0
+        self.statements = 0
+        self.seconds = 0.0
+
+    def add(self, result):
+        # type: (FileResult) -> None
+        self.files += 1
+        self.size += result.size
+        self.statements += result.statements
+        if result.error is not None:
+            self.errors += 1
+
+    def __repr__(self):
+        # type: () -> str
+        rate = self.size / self.seconds / (1 << 20) if self.seconds > 0 else 0.0
+        return "%d files, %d errors, %d bytes in %.2fs (%.2f MB/s, %.1f files/s)" % (
+            self.files, self.errors, self.size, self.seconds, rate,
+            self.files / self.seconds if self.seconds > 0 else 0.0)
+
+
+def find_sources(paths, suffixes=SUFFIXES):
+    # type: (Iterable[str], Tuple[str, ...]) -> Iterator[str]
+    """Yield each path that is a file, and the files under each directory
+    whose names end in one of suffixes, in sorted order."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.endswith(suffixes):
+                    yield os.path.join(dirpath, name)
+
+
+def parse_file(path, backend=Parser.LR, cache_dir=None):
+    # type: (str, int, Optional[str]) -> FileResult
+    start = time.time()
+    try:
+        source = open_source(path)
+    except (IOError, OSError) as e:
+        return FileResult(path, 0, time.time() - start, error=str(e))
+    try:
+        if cache_dir is not None:
+            from blackbeard.astcache import ASTCache
+            result = parse(source[:], backend, ASTCache(cache_dir))
+        else:
+            result = Parser(Lexer(source, 1, {}), backend).parse()
+    except LexerError as e:
+        error = "%d:%d: %s" % (e.pos.lineno, e.pos.colno, e.msg)
+    except ParsingError as e:
+        pos = e.getsourcepos()
+        if pos is None:
+            error = "parse error at end of file"
+        else:
+            error = "%d:%d: parse error" % (pos.lineno, pos.colno)
+    except Exception as e:
+        # Anything else wrong with one file, such as an identifier that is
+        # not UTF-8 or input the lexer does not support, is that file's
+        # error; it must not end the batch.
+        error = "%s: %s" % (e.__class__.__name__, e)
+    else:
+        assert isinstance(result, ast.Block)
+        return FileResult(path, len(source), time.time() - start,
+                          statements=len(result.statements))
+    return FileResult(path, len(source), time.time() - start, error=error)
+
+
+def _parse_file(args):
+    # type: (Tuple[str, int, Optional[str]]) -> FileResult
+    return parse_file(*args)
+
+
+def _size(path):
+    # type: (str) -> int
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def parse_files(paths, processes=None, backend=Parser.LR, cache_dir=None):
+    # type: (Iterable[str], Optional[int], int, Optional[str]) -> Iterator[FileResult]
+    """Parse each file in paths, yielding results in the order they finish.
+
+    Trees are not sent back from the workers; cache_dir, an astcache
+    directory, is where to keep them. With processes=1 the files are parsed
+    in this process.
+    """
+    paths = list(paths)
+    if processes == 1 or len(paths) <= 1:
+        for path in paths:
+            yield parse_file(path, backend, cache_dir)
+        return
+    # Start the largest files first so that one does not hold up the end of
+    # the batch.
+    paths.sort(key=_size, reverse=True)
+    pool = multiprocessing.Pool(processes)
+    try:
+        work = [(path, backend, cache_dir) for path in paths]
+        for result in pool.imap_unordered(_parse_file, work):
+            yield result
+    finally:
+        pool.terminate()
@@ -0,0 +1,356 @@
+"""Constant folding: replace binary operations on literal vectors by the
+vector R would compute for them.
+
+Only operations that give the same result in every environment and without
+a warning are folded, so that running the folded tree is indistinguishable
+from running the original one. Integer overflow (NA with a warning),
+character orderings (which depend on the locale) and operators that do not
+compute a value (":" could build a vector of any length, "~" and "?" are
+calls) are left for run time.
+"""
+import math
+
+from typing import Dict, List, Optional, Tuple  # noqa:F401
+
+from blackbeard import ast
+from blackbeard.lexer import INT_MAX
+
+# R's atomic types, in the order they coerce to each other.
+LOGICAL = ast.Vector.LOGICAL
+INTEGER = ast.Vector.INTEGER
+DOUBLE = ast.Vector.DOUBLE
+CHARACTER = ast.Vector.CHARACTER
+
+ARITHMETIC = ["+", "-", "*", "/", "^", "%%"]
+COMPARISON = ["<", "<=", "==", "!=", ">=", ">"]
+LOGIC = ["&", "|", "&&", "||"]
+
+# Results of logical operations: R's three-valued logic.
+FALSE = 0
+TRUE = 1
+NA = 2
+
+INF = float("inf")
+NAN = float("nan")
+DBL_EPSILON = 2.220446049250313e-16
+
+# What folding one operation removes from the tree: the BinaryOperation and
+# its two operand Vectors become one Vector. A vector's elements are not
+# nodes of their own.
+NODES_PER_FOLD = 2
+
+
+class ConstantFolder(object):
+    """Folds the binary operations of a tree whose operands are literal
+    one-element vectors, counting the nodes it eliminates.
+
+    Subtrees that are unchanged are returned as they are, so the folded tree
+    shares them with the original.
+    """
+    def __init__(self):
+        # type: () -> None
+        self.eliminated = 0
+
+    def fold(self, node):
+        # type: (ast.ASTNode) -> ast.ASTNode
+        # done maps each node seen to its folded form and the number of
+        # operations folded in it. An explicit stack, as a long chain of
+        # operators nests deeply; a node is folded after its children.
+        done = {}  # type: Dict[int, Tuple[ast.ASTNode, int]]
+        stack = [(node, False)]  # type: List[Tuple[ast.ASTNode, bool]]
+        while stack:
+            top, children_done = stack.pop()
+            if id(top) in done:
+                continue
+            if not children_done:
+                stack.append((top, True))
+                for child in _children(top):
+                    if id(child) not in done:
+                        stack.append((child, False))
+                continue
+            done[id(top)] = self.fold_node(top, done)
+        result, folds = done[id(node)]
+        self.eliminated += folds * NODES_PER_FOLD
+        return result
+
+    def fold_node(self, node, done):
+        # type: (ast.ASTNode, Dict[int, Tuple[ast.ASTNode, int]]) -> Tuple[ast.ASTNode, int]
+        if isinstance(node, ast.BinaryOperation):
+            left, left_folds = done[id(node.left)]
+            right, right_folds = done[id(node.right)]
+            folds = left_folds + right_folds
+            result = self.fold_operation(node.operator, left, right)
+            if result is not None:
+                return result, folds + 1
+            if left is node.left and right is node.right:
+                return node, folds
+            return ast.BinaryOperation(node.operator, left, right), folds
+        if isinstance(node, ast.Block):
+            folds = 0
+            statements = []  # type: List[ast.ASTNode]
+            for statement in node.statements:
+                folded, statement_folds = done[id(statement)]
+                statements.append(folded)
+                folds += statement_folds
+            for i in range(len(statements)):
+                if statements[i] is not node.statements[i]:
+                    return ast.Block(statements), folds
+            return node, folds
+        if isinstance(node, ast.Assign):
+            value, folds = done[id(node.value)]
+            if value is node.value:
+                return node, folds
+            return ast.Assign(node.target, value), folds
+        if isinstance(node, ast.Function):
+            changed = False
+            folds = 0
+            formals = ast.FormalList([])
+            for symbol, default in node.formals.entries:
+                if default is not None:
+                    folded, default_folds = done[id(default)]
+                    changed = changed or folded is not default
+                    folds += default_folds
+                    default = folded
+                formals.append_formal(symbol, default)
+            body, body_folds = done[id(node.body)]
+            folds += body_folds
+            if not changed and body is node.body:
+                return node, folds
+            if not changed:
+                formals = node.formals
+            return ast.Function(formals, body), folds
+        return node, 0
+
+    def fold_operation(self, operator, left, right):
+        # type: (str, ast.ASTNode, ast.ASTNode) -> Optional[ast.Vector]
+        """The vector left operator right evaluates to, or None if it is
+        not to be folded."""
+        if not isinstance(left, ast.Vector) or len(left.values) != 1:
+            return None
+        if not isinstance(right, ast.Vector) or len(right.values) != 1:
+            return None
+        x = left.values[0]
+        y = right.values[0]
+        if operator == "**":
+            # R reads ** as ^.
+            operator = "^"
+        value = None  # type: Optional[ast.Value]
+        if operator in ARITHMETIC:
+            value = arithmetic(operator, x, y)
+        elif operator in COMPARISON:
+            value = compare(operator, x, y)
+        elif operator in LOGIC:
+            value = logic(operator, x, y)
+        if value is None:
+            return None
+        return ast.Vector([value])
+
+
+def _children(node):
+    # type: (ast.ASTNode) -> List[ast.ASTNode]
+    # The nodes under node that folding can change.
+    if isinstance(node, ast.BinaryOperation):
+        return [node.left, node.right]
+    if isinstance(node, ast.Block):
+        return list(node.statements)
+    if isinstance(node, ast.Assign):
+        return [node.value]
+    if isinstance(node, ast.Function):
+        result = [default for _, default in node.formals.entries
+                  if default is not None]  # type: List[ast.ASTNode]
+        result.append(node.body)
+        return result
+    return []
+
+
+def fold_constants(tree):
+    # type: (ast.ASTNode) -> ast.ASTNode
+    return ConstantFolder().fold(tree)
+
+
+def type_of(value):
+    # type: (ast.Value) -> int
+    if isinstance(value, ast.BoolValue):
+        return LOGICAL
+    if isinstance(value, ast.IntValue):
+        return INTEGER
+    if isinstance(value, ast.FloatValue):
+        return DOUBLE
+    assert isinstance(value, ast.CharValue)
+    return CHARACTER
+
+
+def as_int(value):
+    # type: (ast.Value) -> int
+    if isinstance(value, ast.BoolValue):
+        return 1 if value.value else 0
+    assert isinstance(value, ast.IntValue)
+    return value.value
+
+
+def as_float(value):
+    # type: (ast.Value) -> float
+    if isinstance(value, ast.FloatValue):
+        return value.value
+    return float(as_int(value))
+
+
+def as_logical(value):
+    # type: (ast.Value) -> int
+    if value.na:
+        return NA
+    if isinstance(value, ast.FloatValue):
+        if math.isnan(value.value):
+            return NA
+        return TRUE if value.value != 0.0 else FALSE
+    return TRUE if as_int(value) != 0 else FALSE
+
+
+def make_logical(result):
+    # type: (int) -> ast.BoolValue
+    if result == NA:
+        return ast.NA_LOGICAL
+    return ast.TRUE if result == TRUE else ast.FALSE
+
+
+def arithmetic(operator, x, y):
+    # type: (str, ast.Value, ast.Value) -> Optional[ast.Value]
+    result_type = max(type_of(x), type_of(y), INTEGER)
+    if result_type == CHARACTER:
+        # "non-numeric argument to binary operator"
+        return None
+    if operator == "^":
+        # 1 ^ y and x ^ 0 are 1 even when the other side is NA.
+        if (not x.na and as_float(x) == 1.0) or (not y.na and as_float(y) == 0.0):
+            return ast.FloatValue(1.0)
+    if operator == "/" or operator == "^":
+        result_type = DOUBLE
+    if x.na or y.na:
+        if result_type == INTEGER:
+            return ast.NA_INTEGER
+        return ast.NA_REAL
+    if result_type == INTEGER:
+        a = as_int(x)
+        b = as_int(y)
+        if operator == "+":
+            r = a + b
+        elif operator == "-":
+            r = a - b
+        elif operator == "*":
+            r = a * b
+        else:
+            assert operator == "%%"
+            if b == 0:
+                return ast.NA_INTEGER
+            # Like R, the result takes the sign of the divisor.
+            r = a % b
+        if r > INT_MAX or r < -INT_MAX:
+            return None
+        return ast.IntValue(r)
+    result = double_arithmetic(operator, as_float(x), as_float(y))
+    if result is None:
+        return None
+    return ast.FloatValue(result)
+
+
+def double_arithmetic(operator, a, b):
+    # type: (str, float, float) -> Optional[float]
+    if operator == "+":
+        return a + b
+    if operator == "-":
+        return a - b
+    if operator == "*":
+        return a * b
+    if operator == "/":
+        if b == 0.0:
+            if a == 0.0 or math.isnan(a):
+                return NAN
+            return math.copysign(INF, a) * math.copysign(1.0, b)
+        return a / b
+    if math.isnan(a) or math.isnan(b) or math.isinf(a) or math.isinf(b):
+        return None
+    if operator == "^":
+        if a == 0.0:
+            return 0.0 if b > 0.0 else INF
+        try:
+            return math.pow(a, b)
+        except ValueError:
+            # A negative number to a fractional power.
+            return NAN
+        except OverflowError:
+            return None
+    assert operator == "%%"
+    return modulo(a, b)
+
+
+def modulo(a, b):
+    # type: (float, float) -> Optional[float]
+    # R's myfmod() for finite operands, which is not quite math.fmod().
+    if b == 0.0:
+        return NAN
+    if abs(b) * DBL_EPSILON > 1 and abs(a) <= abs(b):
+        if abs(a) == abs(b):
+            return 0.0
+        if (a < 0.0 and b > 0.0) or (b < 0.0 and a > 0.0):
+            return a + b
+        return a
+    q = a / b
+    if abs(q) * DBL_EPSILON > 1:
+        # "probable complete loss of accuracy in modulus"
+        return None
+    tmp = a - math.floor(q) * b
+    return tmp - math.floor(tmp / b) * b
+
+
+def compare(operator, x, y):
+    # type: (str, ast.Value, ast.Value) -> Optional[ast.Value]
+    x_type = type_of(x)
+    y_type = type_of(y)
+    if x_type == CHARACTER or y_type == CHARACTER:
+        # Numbers would be formatted as strings, and strings are ordered by
+        # the locale's collation; only equality of two strings is certain.
+        if x_type != y_type or (operator != "==" and operator != "!="):
+            return None
+        if x.na or y.na:
+            return make_logical(NA)
+        assert isinstance(x, ast.CharValue) and isinstance(y, ast.CharValue)
+        equal = x.value == y.value
+        return make_logical(TRUE if equal == (operator == "==") else FALSE)
+    if x.na or y.na:
+        return make_logical(NA)
+    a = as_float(x)
+    b = as_float(y)
+    if math.isnan(a) or math.isnan(b):
+        return make_logical(NA)
+    if operator == "<":
+        result = a < b
+    elif operator == "<=":
+        result = a <= b
+    elif operator == "==":
+        result = a == b
+    elif operator == "!=":
+        result = a != b
+    elif operator == ">=":
+        result = a >= b
+    else:
+        assert operator == ">"
+        result = a > b
+    return make_logical(TRUE if result else FALSE)
+
+
+def logic(operator, x, y):
+    # type: (str, ast.Value, ast.Value) -> Optional[ast.Value]
+    if type_of(x) == CHARACTER or type_of(y) == CHARACTER:
+        # "operations are possible only for numeric, logical or complex types"
+        return None
+    a = as_logical(x)
+    b = as_logical(y)
+    # On one-element vectors the scalar forms agree with the vectorised ones.
+    if operator == "&" or operator == "&&":
+        if a == FALSE or b == FALSE:
+            return make_logical(FALSE)
+        return make_logical(NA if a == NA or b == NA else TRUE)
+    assert operator == "|" or operator == "||"
+    if a == TRUE or b == TRUE:
+        return make_logical(TRUE)
+    return make_logical(NA if a == NA or b == NA else FALSE)
@@ -0,0 +1,104 @@
+"""Hash-consing: one shared instance of each distinct subtree.
+
+A NodeTable maps each node it is given to the first node it saw that is
+equal to it. A parser with a table interns every node as it builds it, after
+the node's children, so equal subtrees come out as the same object: they
+compare equal by identity, and hashing or comparing a node only looks at its
+own fields. One table can serve any number of parses, which then share
+subtrees between them too.
+
+Interned nodes are shared between trees, so a tree built with a table must
+not be changed afterwards.
+"""
+from typing import Any, Dict, List, Optional, Tuple  # noqa
+
+from blackbeard import ast
+
+
+class NodeTable(object):
+    def __init__(self):
+        # type: () -> None
+        self.nodes = {}  # type: Dict[ast.ASTNode, ast.ASTNode]
+        # How many times intern() returned an earlier, equal node.
+        self.shared = 0
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.nodes)
+
+    def intern(self, node):
+        # type: (ast.ASTNode) -> ast.ASTNode
+        existing = self.nodes.get(node, None)
+        if existing is None:
+            self.nodes[node] = node
+            return node
+        if existing is not node:
+            self.shared += 1
+        return existing
+
+    def share(self, tree):
+        # type: (ast.ASTNode) -> ast.ASTNode
+        """tree with each of its nodes replaced by the interned node equal
+        to it. Nodes whose children are interned already are interned as
+        they are; the others are rebuilt."""
+        done = {}  # type: Dict[int, ast.ASTNode]
+        # An explicit stack, as a long chain of operators nests deeply.
+        stack = [(tree, False)]  # type: List[Tuple[ast.ASTNode, bool]]
+        while stack:
+            node, children_done = stack.pop()
+            if id(node) in done:
+                continue
+            children = _children(node)
+            if not children_done:
+                stack.append((node, True))
+                for child in children:
+                    if id(child) not in done:
+                        stack.append((child, False))
+                continue
+            if all(done[id(child)] is child for child in children):
+                done[id(node)] = self.intern(node)
+            else:
+                done[id(node)] = self.intern(_rebuild(node, done))
+        return done[id(tree)]
+
+
+def _children(node):
+    # type: (ast.ASTNode) -> List[ast.ASTNode]
+    # The nodes a node holds, except a vector's values, which are not nodes
+    # of their own.
+    if isinstance(node, ast.Block):
+        return list(node.statements)
+    if isinstance(node, ast.BinaryOperation):
+        return [node.left, node.right]
+    if isinstance(node, ast.Assign):
+        return [node.target, node.value]
+    if isinstance(node, ast.FormalList):
+        result = []  # type: List[ast.ASTNode]
+        for symbol, default in node.entries:
+            result.append(symbol)
+            if default is not None:
+                result.append(default)
+        return result
+    if isinstance(node, ast.Function):
+        return [node.formals, node.body]
+    return []
+
+
+def _rebuild(node, done):
+    # type: (ast.ASTNode, Dict[int, ast.ASTNode]) -> ast.ASTNode
+    if isinstance(node, ast.Block):
+        return ast.Block([done[id(s)] for s in node.statements])
+    if isinstance(node, ast.BinaryOperation):
+        return ast.BinaryOperation(node.operator, done[id(node.left)], done[id(node.right)])
+    if isinstance(node, ast.Assign):
+        return ast.Assign(done[id(node.target)], done[id(node.value)])
+    if isinstance(node, ast.FormalList):
+        formals = ast.FormalList()
+        for symbol, default in node.entries:
+            formals.append_formal(done[id(symbol)],
+                                  None if default is None else done[id(default)])
+        return formals
+    assert isinstance(node, ast.Function)
+    formals = done[id(node.formals)]
+    assert isinstance(formals, ast.FormalList)
+    return ast.Function(formals, done[id(node.body)])
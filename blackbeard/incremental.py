@@ -0,0 +1,115 @@
+"""Re-parse a source after an edit, reusing the statements it left alone.
+
+A statement of the grammar never continues past a newline or semicolon
+outside brackets, so the top-level statements of a source are the runs of
+tokens between those separators. ParsedSource records where each one
+starts. After an edit, lexing restarts at the start of the statement the edit
+begins in and stops at the first statement start after the edit that was
+also a statement start before it: the text from there on is unchanged and
+is lexed from the same state, so it parses to the same statements, which
+are kept as the same objects.
+"""
+from rply import Token  # noqa:F401
+from typing import List, Tuple  # noqa
+
+from blackbeard import ast
+from blackbeard.lexer import Checkpoint, Lexer
+from blackbeard.parser import CLOSING, OPENING, Parser
+from blackbeard.symtable import SymbolTable  # noqa:F401
+
+
+class ParsedSource(object):
+    """A source, its tree, and the offset of the first token of each of the
+    tree's statements."""
+    def __init__(self, source, tree, starts, symtable, backend=Parser.LR):
+        # type: (bytes, ast.Block, List[int], SymbolTable, int) -> None
+        assert len(tree.statements) == len(starts)
+        self.source = source
+        self.tree = tree
+        self.starts = starts
+        self.symtable = symtable
+        self.backend = backend
+
+    @staticmethod
+    def parse(source, backend=Parser.LR):
+        # type: (bytes, int) -> ParsedSource
+        lexer = Lexer(source, 1, {})
+        statements, starts, _ = _parse_statements(lexer, backend, [], 0, 0)
+        return ParsedSource(source, ast.Block(statements), starts, lexer.symtable, backend)
+
+    def reparse(self, source, start, old_end, new_end):
+        # type: (bytes, int, int, int) -> ParsedSource
+        """Parse source, which is this source with the bytes [start:old_end]
+        replaced by what is now source[start:new_end].
+
+        Statements before and after the edited ones are reused as the same
+        objects. Errors are raised as parse() raises them, with positions in
+        the new source.
+        """
+        delta = new_end - old_end
+        # The statements starting strictly before the edit; the last of them
+        # may run into it, so lexing restarts where it starts.
+        first = _count_before(self.starts, start)
+        restart = 0
+        if first > 0:
+            first -= 1
+            restart = self.starts[first]
+        lexer = Lexer(source, 1, self.symtable)
+        lexer.restore(Checkpoint(restart, Lexer.EXPR_BEG, 0))
+        statements, starts, resume = _parse_statements(
+            lexer, self.backend, self.starts, new_end, delta)
+        old_statements = self.tree.statements
+        new_starts = self.starts[:first] + starts
+        for i in range(resume, len(self.starts)):
+            new_starts.append(self.starts[i] + delta)
+        tree = ast.Block(old_statements[:first] + statements + old_statements[resume:])
+        return ParsedSource(source, tree, new_starts, self.symtable, self.backend)
+
+
+def _parse_statements(lexer, backend, old_starts, new_end, delta):
+    # type: (Lexer, int, List[int], int, int) -> Tuple[List[ast.ASTNode], List[int], int]
+    # Parse from the lexer's position, which must be at the top level, up to
+    # the first statement start at or after new_end that was at an index of
+    # old_starts before the edit. Returns the statements, where they start,
+    # and that index, or len(old_starts) if lexing reached the end.
+    parser = Parser(lexer, backend)
+    tokens = []  # type: List[Token]
+    starts = []  # type: List[int]
+    resume = len(old_starts)
+    depth = 0
+    separated = True
+    for token in lexer.tokenize():
+        token_type = token.gettokentype()
+        if depth == 0 and (token_type == "NEWLINE" or token_type == "SEMICOLON"):
+            separated = True
+        elif depth == 0 and separated:
+            offset = lexer.token_start
+            if offset >= new_end:
+                i = _count_before(old_starts, offset - delta)
+                if i < len(old_starts) and old_starts[i] == offset - delta:
+                    resume = i
+                    break
+            starts.append(offset)
+            separated = False
+        if token_type in OPENING:
+            depth += 1
+        elif token_type in CLOSING:
+            depth -= 1
+        tokens.append(token)
+    result = parser.parse_tokens(iter(tokens))
+    assert isinstance(result, ast.Block)
+    assert len(result.statements) == len(starts)
+    return result.statements, starts, resume
+
+
+def _count_before(offsets, idx):
+    # type: (List[int], int) -> int
+    # How many of the sorted offsets are strictly before idx.
+    lo, hi = 0, len(offsets)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if offsets[mid] < idx:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
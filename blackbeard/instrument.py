@@ -0,0 +1,189 @@
+"""NOT_RPYTHON
+
+Opt-in profiling of the parser. A Parser given a ParserProfile parses
+through a copy of the LR parser (or of the Pratt parser's operator table)
+whose production callbacks are timed, and reads its tokens through a
+wrapper that counts them and times the lexer. A Parser without one runs
+exactly as before.
+
+The results can be written as JSON, or as collapsed stacks ("frame;frame
+microseconds" lines) for flamegraph.pl and compatible viewers.
+"""
+import copy
+import json
+import timeit
+
+from rply import Token  # noqa:F401
+from rply.parser import LRParser
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional  # noqa
+
+from blackbeard import ast  # noqa:F401
+from blackbeard.pratt import OperatorTable, PrattParser
+
+timer = timeit.default_timer
+
+
+class ProfiledTokens(object):
+    """A token iterator that counts the tokens of each type and adds the
+    time spent producing them to the profile's lexing time."""
+    def __init__(self, profile, tokens):
+        # type: (ParserProfile, Iterator[Token]) -> None
+        self.profile = profile
+        self.tokens = tokens
+
+    def __iter__(self):
+        # type: () -> ProfiledTokens
+        return self
+
+    def next(self):
+        # type: () -> Token
+        start = timer()
+        try:
+            token = self.tokens.next()
+        finally:
+            self.profile.lex_seconds += timer() - start
+        counts = self.profile.tokens
+        token_type = token.gettokentype()
+        counts[token_type] = counts.get(token_type, 0) + 1
+        return token
+
+
+class ParserProfile(object):
+    """Counts and times collected over any number of parses.
+
+    calls and seconds are keyed by grammar rule ("expr : expr PLUS expr"),
+    and functions maps each rule to the name of its production callback.
+    Time spent in neither the lexer nor a callback is the parser's own
+    shifting and table lookups.
+    """
+    def __init__(self):
+        # type: () -> None
+        self.calls = {}  # type: Dict[str, int]
+        self.seconds = {}  # type: Dict[str, float]
+        self.functions = {}  # type: Dict[str, str]
+        self.tokens = {}  # type: Dict[str, int]
+        self.parses = 0
+        self.parse_seconds = 0.0
+        self.lex_seconds = 0.0
+        self.lr_parser = None  # type: Optional[LRParser]
+        self.operators = None  # type: Optional[OperatorTable]
+
+    def parse_tokens(self, parser, tokens):
+        # type: (Any, Iterator[Token]) -> ast.ASTNode
+        """Parse tokens as parser.parse_tokens() does, recording what it
+        costs."""
+        from blackbeard.parser import LexerWrapper, Parser
+        profiled = ProfiledTokens(self, tokens)
+        start = timer()
+        try:
+            if parser.backend == Parser.PRATT:
+                return PrattParser(parser, self.profiled_operators(parser.operators),
+                                   profiled).parse()
+            lr_parser = self.profiled_lr_parser(parser.parser)
+            return lr_parser.parse(LexerWrapper(profiled), state=parser)
+        finally:
+            self.parse_seconds += timer() - start
+            self.parses += 1
+
+    def profiled_lr_parser(self, lr_parser):
+        # type: (LRParser) -> LRParser
+        if self.lr_parser is None:
+            table = copy.copy(lr_parser.lr_table)
+            table.grammar = copy.copy(table.grammar)
+            productions = []
+            for production in table.grammar.productions:
+                production = copy.copy(production)
+                if production.func is not None:
+                    rule = "%s : %s" % (production.name, " ".join(production.prod))
+                    production.func = self.timed(rule, production.func)
+                productions.append(production)
+            table.grammar.productions = productions
+            self.lr_parser = LRParser(table, lr_parser.error_handler)
+        return self.lr_parser
+
+    def profiled_operators(self, operators):
+        # type: (OperatorTable) -> OperatorTable
+        # The Pratt parser builds most nodes itself; only the callbacks it
+        # takes from the table can be timed.
+        if self.operators is None:
+            table = copy.copy(operators)
+            table.binary = dict(
+                (op, self.timed("expr : expr %s expr" % op, func))
+                for op, func in operators.binary.items())
+            table.atoms = dict(
+                (name, self.timed("expr : %s" % name, func))
+                for name, func in operators.atoms.items())
+            self.operators = table
+        return self.operators
+
+    def timed(self, rule, func):
+        # type: (str, Callable[[Any, List[Any]], Any]) -> Callable[[Any, List[Any]], Any]
+        self.functions[rule] = func.__name__
+        calls = self.calls
+        seconds = self.seconds
+
+        def production(state, p):
+            # type: (Any, List[Any]) -> Any
+            start = timer()
+            try:
+                return func(state, p)
+            finally:
+                seconds[rule] = seconds.get(rule, 0.0) + timer() - start
+                calls[rule] = calls.get(rule, 0) + 1
+        return production
+
+    @property
+    def reduce_seconds(self):
+        # type: () -> float
+        return sum(self.seconds.values())
+
+    def by_function(self):
+        # type: () -> Dict[str, Dict[str, Any]]
+        """Calls and seconds for each production callback, with the rules
+        it was called for."""
+        result = {}  # type: Dict[str, Dict[str, Any]]
+        for rule, calls in self.calls.items():
+            entry = result.setdefault(self.functions[rule], {
+                "calls": 0, "seconds": 0.0, "rules": {}})
+            entry["calls"] += calls
+            entry["seconds"] += self.seconds[rule]
+            entry["rules"][rule] = {"calls": calls, "seconds": self.seconds[rule]}
+        return result
+
+    def as_dict(self):
+        # type: () -> Dict[str, Any]
+        return {
+            "parses": self.parses,
+            "parse_seconds": self.parse_seconds,
+            "lex_seconds": self.lex_seconds,
+            "reduce_seconds": self.reduce_seconds,
+            "tokens": self.tokens,
+            "productions": self.by_function(),
+        }
+
+    def write_json(self, f):
+        # type: (IO[str]) -> None
+        json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+        f.write("\n")
+
+    def stacks(self):
+        # type: () -> List[str]
+        """Collapsed stacks, one line per frame with its own time in
+        microseconds."""
+        lines = ["parse;lex %d" % _micros(self.lex_seconds)]
+        for rule in sorted(self.calls):
+            lines.append("parse;reduce;%s;%s %d" % (
+                self.functions[rule], rule, _micros(self.seconds[rule])))
+        other = self.parse_seconds - self.lex_seconds - self.reduce_seconds
+        lines.append("parse %d" % _micros(max(other, 0.0)))
+        return lines
+
+    def write_stacks(self, f):
+        # type: (IO[str]) -> None
+        for line in self.stacks():
+            f.write(line + "\n")
+
+
+def _micros(seconds):
+    # type: (float) -> int
+    return int(round(seconds * 1e6))
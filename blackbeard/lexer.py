@@ -1,6 +1,9 @@
 from rply import Token
 from rply.token import SourcePosition
-from typing import Any, Iterator  # noqa
+from rpython.rlib.rstring import replace
+from typing import Any, Iterable, Iterator, Optional, Tuple  # noqa
+
+from blackbeard.symtable import SymbolTable
 
 
 class LexerError(Exception):
@@ -10,6 +13,379 @@ class LexerError(Exception):
         self.msg = "" if msg is None else msg
 
 
+# Types of a decoded NUM_CONST value; see SpanToken.decode_number.
+NUM_DOUBLE = 0
+NUM_INTEGER = 1
+
+INT_MAX = 2 ** 31 - 1
+
+
+class SpanToken(Token):
+    """A token that refers to its text by offsets into the lexer's source.
+
+    The text is only sliced out of the source (and, for quoted tokens,
+    unescaped) when it is first asked for. SYMBOL tokens also carry the id
+    their name was interned under in the lexer's SymbolTable, and NUM_CONST
+    tokens their decoded value.
+
+    Given a LineIndex instead of a source_pos, the position is worked out
+    from it the first time getsourcepos() is called. Like the positions the
+    lexer used to track by hand, it is that of the character just after the
+    token (after the closing quote, for quoted tokens).
+    """
+    def __init__(self, name, source, start, end, source_pos=None, quote=None, text=None,
+                 symbol_id=-1, lines=None):
+        # type: (bytes, bytes, int, int, Optional[SourcePosition], Optional[bytes], Optional[bytes], int, Optional[LineIndex]) -> None  # noqa:E501
+        self.name = name
+        self.source = source
+        self.start = start
+        self.end = end
+        self.source_pos = source_pos
+        self.lines = lines
+        self.quote = quote
+        self.text = text
+        self.symbol_id = symbol_id
+        self.num_type = NUM_DOUBLE
+        self.int_value = 0
+        self.float_value = 0.0
+
+    def getspan(self):
+        # type: () -> Tuple[int, int]
+        return (self.start, self.end)
+
+    def getstr(self):
+        # type: () -> bytes
+        if self.text is None:
+            start, end = self.start, self.end
+            assert start >= 0 and end >= start
+            text = self.source[start:end]
+            quote = self.quote
+            if quote is not None:
+                # str.replace() only takes single characters once translated.
+                text = replace(text, "\\" + quote, quote)
+            self.text = text
+        return self.text
+
+    def getsourcepos(self):
+        # type: () -> Optional[SourcePosition]
+        if self.source_pos is None and self.lines is not None:
+            idx = self.end if self.quote is None else self.end + 1
+            self.source_pos = self.lines.position(idx)
+        return self.source_pos
+
+    # rply's Token compares and prints its value attribute, which a SpanToken
+    # does not set: its text is made by getstr() when first asked for. Token
+    # subclasses must not turn value into a property either, as RPython
+    # could then not unify it with the plain attribute of rply's own tokens.
+    def __eq__(self, other):
+        # type: (object) -> bool
+        if not isinstance(other, Token):
+            return NotImplemented
+        return self.name == other.name and self.getstr() == other.getstr()
+
+    def __ne__(self, other):
+        # type: (object) -> bool
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        # type: () -> str
+        return "Token(%r, %r)" % (self.name, self.getstr())
+
+    def decode_number(self):
+        # type: () -> None
+        """Set num_type and the matching value from a NUM_CONST's text.
+
+        As in R, a literal is a double unless it has an L suffix and its value
+        is a whole number that fits in an R integer. Hex literals (0x...)
+        follow the same rule.
+        """
+        text = self.getstr()
+        suffixed = text.endswith("L")
+        if suffixed:
+            end = len(text) - 1
+            assert end >= 0
+            text = text[:end]
+        if text.startswith("0x") or text.startswith("0X"):
+            as_int = int(text[2:], 16)
+            value = float(as_int)
+        else:
+            # An exponent marker without digits ("1e", "1e+") is ignored.
+            end = len(text)
+            while text[end - 1] in "eE+-":
+                end -= 1
+            assert end > 0
+            value = float(text[:end])
+            as_int = -1
+            if suffixed and 0 <= value <= INT_MAX and value == int(value):
+                as_int = int(value)
+        self.float_value = value
+        if suffixed and 0 <= as_int <= INT_MAX and float(as_int) == value:
+            self.num_type = NUM_INTEGER
+            self.int_value = as_int
+
+    def rebase(self, source, delta, lines):
+        # type: (bytes, int, LineIndex) -> SpanToken
+        """Return a copy of this token moved by delta bytes into source,
+        which must hold the same text at that spot and be indexed by lines."""
+        return SpanToken(self.name, source, self.start + delta, self.end + delta,
+                         None, self.quote, self.text, self.symbol_id, lines)
+
+
+class Checkpoint(object):
+    """Lexer state at the start of a line, from which lexing can resume."""
+    def __init__(self, idx, state, paren_nest):
+        # type: (int, int, int) -> None
+        self.idx = idx
+        self.state = state
+        self.paren_nest = paren_nest
+
+    def same_state(self, other):
+        # type: (Checkpoint) -> bool
+        return (self.state == other.state and
+                self.paren_nest == other.paren_nest)
+
+    def rebase(self, delta):
+        # type: (int) -> Checkpoint
+        return Checkpoint(self.idx + delta, self.state, self.paren_nest)
+
+
+class LineIndex(object):
+    """Maps source offsets to line and column numbers.
+
+    The offsets at which lines start are found with one forward pass over
+    the source, made in pieces as later offsets are asked about, so the
+    lexer itself only has to track its offset. "\r\n", "\n" and a lone
+    "\r" each end a line.
+    """
+    def __init__(self, source, first_lineno=1):
+        # type: (Any, int) -> None
+        self.source = source
+        self.first_lineno = first_lineno
+        self.starts = [0]
+        # Every line break before this offset has been recorded.
+        self.scanned = 0
+
+    def scan(self, idx):
+        # type: (int) -> None
+        source = self.source
+        pos = self.scanned
+        lf = source.find("\n", pos, idx)
+        cr = source.find("\r", pos, idx)
+        while lf >= 0 or cr >= 0:
+            if cr < 0 or (lf >= 0 and lf < cr):
+                pos = lf + 1
+                assert pos >= 0
+                lf = source.find("\n", pos, idx)
+            else:
+                pos = cr + 1
+                assert pos >= 0
+                if source[pos:pos + 1] == "\n":
+                    pos += 1
+                    lf = source.find("\n", pos, idx)
+                cr = source.find("\r", pos, idx)
+            self.starts.append(pos)
+        self.scanned = max(pos, idx)
+
+    def line_of(self, idx):
+        # type: (int) -> int
+        """Index into starts of the line holding offset idx."""
+        if idx > self.scanned:
+            self.scan(idx)
+        starts = self.starts
+        lo, hi = 1, len(starts)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if starts[mid] <= idx:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1
+
+    def position(self, idx):
+        # type: (int) -> SourcePosition
+        line = self.line_of(idx)
+        return SourcePosition(idx, self.first_lineno + line,
+                              idx - self.starts[line] + 1)
+
+    def discard(self, idx):
+        # type: (int) -> None
+        """Forget the lines before the one holding offset idx, which may no
+        longer be asked about, so that a stream's index stays small."""
+        line = self.line_of(idx)
+        if line > 0:
+            del self.starts[:line]
+            self.first_lineno += line
+
+
+class Segment(object):
+    """A range of the tokens of a lexed text, with the checkpoints of the
+    lines they are on, as they appear in a later text.
+
+    delta is what the offsets of the tokens and checkpoints must be moved by
+    to be offsets in the later text. Unless same_lines is true, which means
+    that delta is 0 and every token is on the same line and column as when
+    it was lexed, tokens are read as copies moved into the later text.
+    """
+    def __init__(self, tokens, tok_lo, tok_hi, checkpoints, cp_lo, cp_hi, delta, same_lines):
+        # type: (List[Token], int, int, List[Checkpoint], int, int, int, bool) -> None
+        self.tokens = tokens
+        self.tok_lo = tok_lo
+        self.tok_hi = tok_hi
+        self.checkpoints = checkpoints
+        self.cp_lo = cp_lo
+        self.cp_hi = cp_hi
+        self.delta = delta
+        self.same_lines = same_lines
+
+    def slice(self, tok_lo, tok_hi, cp_lo, cp_hi, delta, same_lines):
+        # type: (int, int, int, int, int, bool) -> Segment
+        return Segment(self.tokens, tok_lo, tok_hi, self.checkpoints, cp_lo, cp_hi,
+                       self.delta + delta, self.same_lines and same_lines)
+
+
+class LexedTokens(object):
+    """The tokens of a source, and a Checkpoint at the start of each line,
+    kept as a list of Segments so that relex() can reuse the tokens of the
+    previous text without copying or moving them.
+
+    Each edit adds up to two segments; tokens are found by a binary search
+    over them.
+    """
+    def __init__(self, source, lines, segments):
+        # type: (Any, LineIndex, List[Segment]) -> None
+        self.source = source
+        self.lines = lines
+        self.segments = [seg for seg in segments
+                         if seg.tok_lo < seg.tok_hi or seg.cp_lo < seg.cp_hi]
+        # The number of tokens and checkpoints before each segment.
+        self.token_offsets = []  # type: List[int]
+        self.checkpoint_offsets = []  # type: List[int]
+        tokens = checkpoints = 0
+        for seg in self.segments:
+            self.token_offsets.append(tokens)
+            self.checkpoint_offsets.append(checkpoints)
+            tokens += seg.tok_hi - seg.tok_lo
+            checkpoints += seg.cp_hi - seg.cp_lo
+        self.token_count = tokens
+        self.checkpoint_count = checkpoints
+
+    def __len__(self):
+        # type: () -> int
+        return self.token_count
+
+    def token(self, i):
+        # type: (int) -> Token
+        n = _segment_of(self.token_offsets, i)
+        seg = self.segments[n]
+        return self.read_token(seg, seg.tok_lo + i - self.token_offsets[n])
+
+    def read_token(self, seg, k):
+        # type: (Segment, int) -> Token
+        token = seg.tokens[k]
+        if seg.same_lines:
+            return token
+        assert isinstance(token, SpanToken)
+        return token.rebase(self.source, seg.delta, self.lines)
+
+    def tokens(self):
+        # type: () -> Iterator[Token]
+        for seg in self.segments:
+            for k in range(seg.tok_lo, seg.tok_hi):
+                yield self.read_token(seg, k)
+
+    def checkpoint(self, j):
+        # type: (int) -> Checkpoint
+        n = _segment_of(self.checkpoint_offsets, j)
+        seg = self.segments[n]
+        checkpoint = seg.checkpoints[seg.cp_lo + j - self.checkpoint_offsets[n]]
+        if seg.delta == 0:
+            return checkpoint
+        return checkpoint.rebase(seg.delta)
+
+    def checkpoints(self):
+        # type: () -> List[Checkpoint]
+        return [self.checkpoint(j) for j in range(self.checkpoint_count)]
+
+    def last_checkpoint_before(self, idx):
+        # type: (int) -> int
+        """Index of the last checkpoint strictly before idx, or 0."""
+        lo, hi = 1, self.checkpoint_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.checkpoint(mid).idx < idx:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1
+
+    def find_checkpoint(self, idx):
+        # type: (int) -> int
+        """Index of the checkpoint at exactly idx, or -1."""
+        j = self.last_checkpoint_before(idx + 1)
+        if self.checkpoint(j).idx == idx:
+            return j
+        return -1
+
+    def first_token_from(self, idx):
+        # type: (int) -> int
+        """Index of the first token starting at or after idx."""
+        lo, hi = 0, self.token_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            n = _segment_of(self.token_offsets, mid)
+            seg = self.segments[n]
+            token = seg.tokens[seg.tok_lo + mid - self.token_offsets[n]]
+            assert isinstance(token, SpanToken)
+            if token.start + seg.delta < idx:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def head(self, tokens, checkpoints):
+        # type: (int, int) -> List[Segment]
+        """Segments holding the first tokens and checkpoints."""
+        result = []  # type: List[Segment]
+        for n in range(len(self.segments)):
+            seg = self.segments[n]
+            tok_hi = min(seg.tok_hi, seg.tok_lo + max(tokens - self.token_offsets[n], 0))
+            cp_hi = min(seg.cp_hi, seg.cp_lo + max(checkpoints - self.checkpoint_offsets[n], 0))
+            if tok_hi == seg.tok_lo and cp_hi == seg.cp_lo:
+                break
+            result.append(seg.slice(seg.tok_lo, tok_hi, seg.cp_lo, cp_hi, 0, True))
+        return result
+
+    def tail(self, tokens, checkpoints, delta, same_lines):
+        # type: (int, int, int, bool) -> List[Segment]
+        """Segments holding the tokens and checkpoints from the given
+        indices on, moved by delta."""
+        result = []  # type: List[Segment]
+        for n in range(len(self.segments)):
+            seg = self.segments[n]
+            tok_lo = max(seg.tok_lo, min(seg.tok_hi, seg.tok_lo + tokens - self.token_offsets[n]))
+            cp_lo = max(seg.cp_lo, min(seg.cp_hi, seg.cp_lo + checkpoints - self.checkpoint_offsets[n]))
+            if tok_lo < seg.tok_hi or cp_lo < seg.cp_hi:
+                result.append(seg.slice(tok_lo, seg.tok_hi, cp_lo, seg.cp_hi, delta, same_lines))
+        return result
+
+
+def _segment_of(offsets, i):
+    # type: (List[int], int) -> int
+    # Index of the segment holding item i, given how many items come before
+    # each segment.
+    lo, hi = 1, len(offsets)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if offsets[mid] <= i:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo - 1
+
+
 tokens = [
     "END_OF_INPUT", "ERROR",
     "STR_CONST", "NUM_CONST", "NULL_CONST", "SYMBOL", "FUNCTION",
@@ -47,18 +423,31 @@ class Lexer(object):
     EXPR_BEG = 0
     EXPR_ARG = 1
 
-    def __init__(self, source, initial_lineno, symtable):
-        # type: (bytes, int, Dict[Any, Any]) -> None
+    # What to do with comments: emit COMMENT tokens, drop them, or drop them
+    # from the token stream but record them in Lexer.comments.
+    COMMENTS_EMIT = 0
+    COMMENTS_SKIP = 1
+    COMMENTS_COLLECT = 2
+
+    def __init__(self, source, initial_lineno, symtable, comment_mode=COMMENTS_EMIT):
+        # type: (bytes, int, Any, int) -> None
         self.source = source
-        self.lineno = initial_lineno
-        self.symtable = symtable
-        self.current_value = []  # type: List[bytes]
+        self.lines = LineIndex(source, initial_lineno)
+        # A plain dict is used as the name -> id map of a new SymbolTable.
+        if isinstance(symtable, SymbolTable):
+            self.symtable = symtable
+        else:
+            self.symtable = SymbolTable(symtable)
         self.idx = 0
-        self.columno = 1
+        self.token_start = 0
         self.state = self.EXPR_BEG
         self.paren_nest = 0
         self.left_paren_begin = 0
         self.command_start = True
+        self.comment_mode = comment_mode
+        self.comments = []  # type: List[Token]
+        # When not None, a Checkpoint is appended at every line boundary.
+        self.checkpoints = None  # type: Optional[List[Checkpoint]]
 
     def peek(self):
         # type: () -> bytes
@@ -66,31 +455,28 @@ class Lexer(object):
         self.unread()
         return ch
 
-    def add(self, ch):
-        # type: (bytes) -> None
-        self.current_value.append(ch)
-
-    def clear(self):
-        # type: () -> None
-        del self.current_value[:]
-
     def current_pos(self):
         # type: () -> SourcePosition
-        return SourcePosition(self.idx, self.lineno, self.columno)
+        return self.lines.position(self.idx)
 
     def newline(self, ch):
         # type: (bytes) -> None
+        # Line numbers come from self.lines; only "\r\n" needs consuming.
         if ch == "\r" and self.peek() == "\n":
             self.read()
-        self.lineno += 1
-        self.columno = 1
 
     def emit(self, token):
         # type: (bytes) -> Token
         assert token in tokens
-        value = "".join(self.current_value)
-        self.clear()
-        return Token(token, value, self.current_pos())
+        return SpanToken(token, self.source, self.token_start, self.idx,
+                         lines=self.lines)
+
+    def emit_quoted(self, token, quote):
+        # type: (bytes, bytes) -> Token
+        # The span excludes the surrounding quotes.
+        assert token in tokens
+        return SpanToken(token, self.source, self.token_start + 1, self.idx - 1,
+                         quote=quote, lines=self.lines)
 
     def error(self, msg=None):
         # type: (bytes) -> None
@@ -103,7 +489,6 @@ class Lexer(object):
         except IndexError:
             ch = self.EOF
         self.idx += 1
-        self.columno += 1
         return ch
 
     def unread(self):
@@ -111,7 +496,6 @@ class Lexer(object):
         idx = self.idx - 1
         assert idx >= 0
         self.idx = idx
-        self.columno -= 1
 
     def tokenize(self):
         # type: () -> Iterator[Token]
@@ -119,410 +503,476 @@ class Lexer(object):
             ch = self.read()
             if ch == self.EOF:
                 break
-            if ch in " \t":
+            start = self.idx - 1
+            assert start >= 0
+            self.token_start = start
+            code = ord(ch)
+            handler = HANDLERS[code] if code < 256 else H_SYMBOL
+            if handler == H_BLANK:
+                # Most blanks are single spaces; only longer runs (such as
+                # indentation) are worth a scan.
+                if self.peek() in " \t":
+                    self.scan_run(BLANKS)
                 continue
-            elif ch == "#":
-                for token in self.comment(ch):
-                    yield token
-            elif ch in "\r\n":
-                self.newline(ch)
-                self.add("\n")
-                yield self.emit("NEWLINE")
-                self.state = self.EXPR_BEG
-            elif ch == "*":
-                for token in self.star(ch):
-                    yield token
-            elif ch == "!":
-                for token in self.exclamation(ch):
-                    yield token
-            elif ch == "=":
-                for token in self.equal(ch):
-                    yield token
-            elif ch == "<":
-                for token in self.less_than(ch):
-                    yield token
-            elif ch == ">":
-                for token in self.greater_than(ch):
-                    yield token
-            elif ch in ("'", '"'):
-                for token in self.string_quote(ch):
-                    yield token
-            elif ch == "?":
-                for token in self.question_mark(ch):
-                    yield token
-            elif ch == "&":
-                for token in self.ampersand(ch):
-                    yield token
-            elif ch == "|":
-                for token in self.pipe(ch):
-                    yield token
-            elif ch == "+":
-                for token in self.plus(ch):
-                    yield token
-            elif ch == "-":
-                for token in self.minus(ch):
-                    yield token
-            elif ch.isdigit():
-                for token in self.number(ch):
-                    yield token
-            elif ch == "(":
-                for token in self.left_paren(ch):
-                    yield token
-            elif ch == ")":
-                for token in self.right_paren(ch):
-                    yield token
-            elif ch == "{":
-                for token in self.left_brace(ch):
-                    yield token
-            elif ch == "}":
-                for token in self.right_brace(ch):
-                    yield token
-            elif ch == "[":
-                for token in self.left_square(ch):
-                    yield token
-            elif ch == "]":
-                for token in self.right_square(ch):
-                    yield token
-            elif ch == ":":
-                for token in self.colon(ch):
-                    yield token
-            elif ch == "/":
-                for token in self.slash(ch):
-                    yield token
-            elif ch == "^":
-                for token in self.caret(ch):
-                    yield token
-            elif ch == ";":
-                self.add(ch)
-                self.state = self.EXPR_BEG
-                yield self.emit("SEMICOLON")
-            elif ch == ",":
-                self.add(ch)
-                self.state = self.EXPR_BEG
-                yield self.emit("COMMA")
-            elif ch == "~":
-                self.add(ch)
-                self.state = self.EXPR_BEG
-                yield self.emit("TILDE")
-            elif ch == ".":
-                for token in self.dot(ch):
-                    yield token
-            elif ch == "\\":
-                ch2 = self.read()
-                if ch2 in "\r\n":
-                    self.newline(ch2)
-                    continue
-                raise NotImplementedError
-            elif ch == "%":
-                for token in self.percent(ch):
-                    yield token
-            elif ch == "$":
-                self.add(ch)
-                self.state = self.EXPR_BEG
-                yield self.emit("DOLLAR")
-            elif ch == "`":
-                for token in self.backtick(ch):
-                    yield token
-            else:
-                for token in self.symbol(ch):
-                    yield token
+            token = self.handle(handler, ch)
+            if token is not None:
+                yield token
+
+    def handle(self, handler, ch):
+        # type: (int, bytes) -> Optional[Token]
+        """Lex the token starting with ch, returning it, or None if it
+        produces none, using the handler HANDLERS gives for ch. RPython
+        turns this chain of comparisons into a switch."""
+        if handler == H_SYMBOL:
+            return self.symbol(ch)
+        elif handler == H_LINE_BREAK:
+            return self.line_break(ch)
+        elif handler == H_NUMBER:
+            return self.number(ch)
+        elif handler == H_LEFT_PAREN:
+            return self.left_paren(ch)
+        elif handler == H_RIGHT_PAREN:
+            return self.right_paren(ch)
+        elif handler == H_COMMA:
+            return self.comma(ch)
+        elif handler == H_STRING_QUOTE:
+            return self.string_quote(ch)
+        elif handler == H_LESS_THAN:
+            return self.less_than(ch)
+        elif handler == H_EQUAL:
+            return self.equal(ch)
+        elif handler == H_COMMENT:
+            return self.comment(ch)
+        elif handler == H_LEFT_BRACE:
+            return self.left_brace(ch)
+        elif handler == H_RIGHT_BRACE:
+            return self.right_brace(ch)
+        elif handler == H_PLUS:
+            return self.plus(ch)
+        elif handler == H_MINUS:
+            return self.minus(ch)
+        elif handler == H_STAR:
+            return self.star(ch)
+        elif handler == H_SLASH:
+            return self.slash(ch)
+        elif handler == H_LEFT_SQUARE:
+            return self.left_square(ch)
+        elif handler == H_RIGHT_SQUARE:
+            return self.right_square(ch)
+        elif handler == H_EXCLAMATION:
+            return self.exclamation(ch)
+        elif handler == H_GREATER_THAN:
+            return self.greater_than(ch)
+        elif handler == H_AMPERSAND:
+            return self.ampersand(ch)
+        elif handler == H_PIPE:
+            return self.pipe(ch)
+        elif handler == H_COLON:
+            return self.colon(ch)
+        elif handler == H_SEMICOLON:
+            return self.semicolon(ch)
+        elif handler == H_DOLLAR:
+            return self.dollar(ch)
+        elif handler == H_PERCENT:
+            return self.percent(ch)
+        elif handler == H_CARET:
+            return self.caret(ch)
+        elif handler == H_QUESTION_MARK:
+            return self.question_mark(ch)
+        elif handler == H_TILDE:
+            return self.tilde(ch)
+        elif handler == H_DOT:
+            return self.dot(ch)
+        elif handler == H_BACKTICK:
+            return self.backtick(ch)
+        assert handler == H_BACKSLASH
+        return self.backslash(ch)
+
+    def line_break(self, ch):
+        # type: (bytes) -> Optional[Token]
+        self.newline(ch)
+        token = SpanToken("NEWLINE", self.source, self.token_start, self.idx,
+                          text="\n", lines=self.lines)
+        self.state = self.EXPR_BEG
+        if self.checkpoints is not None:
+            self.checkpoints.append(self.checkpoint())
+        return token
+
+    def checkpoint(self):
+        # type: () -> Checkpoint
+        return Checkpoint(self.idx, self.state, self.paren_nest)
+
+    def restore(self, checkpoint):
+        # type: (Checkpoint) -> None
+        self.idx = checkpoint.idx
+        self.state = checkpoint.state
+        self.paren_nest = checkpoint.paren_nest
+
+    def tokenize_incremental(self):
+        # type: () -> LexedTokens
+        """Lex the whole source, keeping the line checkpoints that relex()
+        needs to re-lex it after an edit."""
+        self.checkpoints = [self.checkpoint()]
+        tokens = list(self.tokenize())
+        checkpoints = self.checkpoints
+        self.checkpoints = None
+        return LexedTokens(self.source, self.lines, [
+            Segment(tokens, 0, len(tokens), checkpoints, 0, len(checkpoints), 0, True)])
+
+    def tokenize_chunked(self):
+        # type: () -> Iterator[Token]
+        """NOT_RPYTHON
+
+        Lex a ChunkedSource, letting it drop what has been lexed; see
+        tokenize_stream().
+        """
+        source = self.source
+        for token in self.tokenize():
+            token.getstr()
+            token.getsourcepos()
+            # The lexer may step back one character after emitting a token.
+            source.discard(self.idx - 1)
+            if token.gettokentype() == "NEWLINE":
+                self.lines.discard(self.idx - 1)
+            yield token
+
+    def relex(self, old, start, old_end, new_end):
+        # type: (LexedTokens, int, int, int) -> LexedTokens
+        """Re-lex this lexer's source after an edit.
+
+        old came from tokenize_incremental() or relex() on the previous text
+        by a lexer sharing this one's symtable, whose bytes [start:old_end]
+        were replaced by what is now self.source[start:new_end]. Lexing
+        restarts at the last line boundary before the edit and stops at the
+        first line boundary after it where the lexer state matches the old
+        checkpoint; the old tokens from there on are reused. Those are not
+        visited: the result refers to them through segments that move them
+        to their new offsets when they are read, so the cost is that of the
+        lines lexed again, plus one step per segment.
+        """
+        delta = new_end - old_end
+        i = old.last_checkpoint_before(start)
+        resume = old.checkpoint(i)
+        self.restore(resume)
+        segments = old.head(old.first_token_from(resume.idx), i + 1)
+        tokens = []  # type: List[Token]
+        self.checkpoints = []
+        tail = []  # type: List[Segment]
+        for token in self.tokenize():
+            tokens.append(token)
+            if token.gettokentype() != "NEWLINE":
+                continue
+            checkpoint = self.checkpoints[-1]
+            if checkpoint.idx < new_end:
+                continue
+            j = old.find_checkpoint(checkpoint.idx - delta)
+            if j < 0 or not checkpoint.same_state(old.checkpoint(j)):
+                continue
+            same_lines = delta == 0 and not self.changes_lines(old.source, start, old_end, new_end)
+            tail = old.tail(old.first_token_from(old.checkpoint(j).idx), j + 1, delta, same_lines)
+            break
+        checkpoints = self.checkpoints
+        self.checkpoints = None
+        segments.append(Segment(tokens, 0, len(tokens), checkpoints, 0, len(checkpoints), 0, True))
+        return LexedTokens(self.source, self.lines, segments + tail)
+
+    def changes_lines(self, old_source, start, old_end, new_end):
+        # type: (Any, int, int, int) -> bool
+        # Whether a same-length edit replaced or added a line break, so that
+        # the text after it may now be on other lines.
+        for source, end in [(old_source, old_end), (self.source, new_end)]:
+            if source.find("\n", start, end) >= 0 or source.find("\r", start, end) >= 0:
+                return True
+        return False
+
+    def semicolon(self, ch):
+        # type: (bytes) -> Optional[Token]
+        self.state = self.EXPR_BEG
+        return self.emit("SEMICOLON")
+
+    def comma(self, ch):
+        # type: (bytes) -> Optional[Token]
+        self.state = self.EXPR_BEG
+        return self.emit("COMMA")
+
+    def tilde(self, ch):
+        # type: (bytes) -> Optional[Token]
+        self.state = self.EXPR_BEG
+        return self.emit("TILDE")
+
+    def dollar(self, ch):
+        # type: (bytes) -> Optional[Token]
+        self.state = self.EXPR_BEG
+        return self.emit("DOLLAR")
+
+    def backslash(self, ch):
+        # type: (bytes) -> Optional[Token]
+        # Only line continuations are supported; they produce no token.
+        ch2 = self.read()
+        if ch2 not in "\r\n":
+            raise NotImplementedError
+        self.newline(ch2)
+        return None
+
+    def scan_run(self, char_class):
+        # type: (List[bool]) -> None
+        """Advance past the run of characters in char_class starting at the
+        current position.
+
+        char_class has an entry for each byte, and a last one for every
+        character beyond them (from unicode sources).
+        """
+        source = self.source
+        i = self.idx
+        try:
+            while True:
+                code = ord(source[i])
+                if not char_class[code if code < 256 else 256]:
+                    break
+                i += 1
+        except IndexError:
+            pass
+        self.idx = i
 
     def comment(self, ch):
-        # type: (bytes) -> Iterator[Token]
-        while True:
-            self.add(ch)
-            ch = self.read()
-            if ch == self.EOF or ch in "\r\n":
-                self.unread()
-                yield self.emit("COMMENT")
-                break
+        # type: (bytes) -> Optional[Token]
+        self.scan_run(COMMENT_CHARS)
+        if self.comment_mode == self.COMMENTS_EMIT:
+            return self.emit("COMMENT")
+        elif self.comment_mode == self.COMMENTS_COLLECT:
+            self.comments.append(self.emit("COMMENT"))
+        return None
 
     def emit_symbol(self):
         # type: () -> Token
-        value = "".join(self.current_value)
+        value = self.source[self.token_start:self.idx]
         if value.upper() in reserved:
             return self.emit(value.upper())
         else:
-            return self.emit("SYMBOL")
+            return SpanToken("SYMBOL", self.source, self.token_start, self.idx,
+                             text=value, symbol_id=self.symtable.intern(value),
+                             lines=self.lines)
 
     def symbol(self, ch):
-        # type: (bytes) -> Iterator[Token]
-        if (ch.isalpha() or ord(ch) > 127):
-            self.add(ch)
-        else:
+        # type: (bytes) -> Optional[Token]
+        if not (ch.isalpha() or ord(ch) > 127):
             self.error("Unexpected character: %s" % ch)
-        while True:
-            ch = self.read()
-            if ch == self.EOF:
-                yield self.emit_symbol()
-                self.unread()
-                break
-            elif (ch.isalnum() or
-                  ch in "._" or
-                  ord(ch) > 127):
-                self.add(ch)
-            else:
-                self.unread()
-                yield self.emit_symbol()
-                self.state = self.EXPR_ARG
-                break
+        self.scan_run(SYMBOL_CHARS)
+        token = self.emit_symbol()
+        self.state = self.EXPR_ARG
+        return token
 
     def star(self, ch):
-        # type: (bytes) -> Iterator[Token]
+        # type: (bytes) -> Optional[Token]
         if self.state != self.EXPR_ARG:
             self.error("Unexpected *")
         self.state = self.EXPR_BEG
-        self.add(ch)
         ch2 = self.read()
         if ch2 == "*":
-            yield self.emit("POW")
+            return self.emit("POW")
         else:
             self.unread()
-            yield self.emit("MUL")
+            return self.emit("MUL")
 
     def exclamation(self, ch):
-        # type: (bytes) -> Iterator[Token]
-        self.add(ch)
+        # type: (bytes) -> Optional[Token]
         ch2 = self.read()
         if ch2 == "=":
-            self.add(ch2)
             self.state = self.EXPR_BEG
-            yield self.emit("NE")
+            return self.emit("NE")
         else:
             self.unread()
-            yield self.emit("NOT")
+            return self.emit("NOT")
 
     def equal(self, ch):
-        # type: (bytes) -> Iterator[Token]
+        # type: (bytes) -> Optional[Token]
         if self.state != self.EXPR_ARG:
             self.error("Unexpected =")
         self.state = self.EXPR_BEG
-        self.add(ch)
         ch2 = self.read()
         if ch2 == "=":
-            self.add(ch2)
-            yield self.emit("EQ")
+            return self.emit("EQ")
         else:
             self.unread()
-            yield self.emit("EQ_ASSIGN")
+            return self.emit("EQ_ASSIGN")
 
     def less_than(self, ch):
-        # type: (bytes) -> Iterator[Token]
+        # type: (bytes) -> Optional[Token]
         if self.state != self.EXPR_ARG:
             self.error("Unexpected <")
         self.state = self.EXPR_BEG
-        self.add(ch)
         ch2 = self.read()
         if ch2 == "=":
-            self.add(ch2)
-            yield self.emit("LE")
+            return self.emit("LE")
         elif ch2 == "-":
-            self.add(ch2)
-            yield self.emit("LEFT_ASSIGN")
+            return self.emit("LEFT_ASSIGN")
         else:
             self.unread()
-            yield self.emit("LT")
+            return self.emit("LT")
 
     def greater_than(self, ch):
-        # type: (bytes) -> Iterator[Token]
+        # type: (bytes) -> Optional[Token]
         if self.state != self.EXPR_ARG:
             self.error("Unexpected >")
         self.state = self.EXPR_BEG
-        self.add(ch)
         ch2 = self.read()
         if ch2 == "=":
-            self.add(ch2)
-            yield self.emit("GE")
+            return self.emit("GE")
         else:
             self.unread()
-            yield self.emit("GT")
+            return self.emit("GT")
 
     def string_quote(self, ch_begin):
-        # type: (bytes) -> Iterator[Token]
+        # type: (bytes) -> Optional[Token]
         self.state = self.EXPR_ARG
         while True:
             ch = self.read()
             if ch == self.EOF:
                 self.error("EOF in string literal")
             elif ch == ch_begin:
-                yield self.emit("STR_CONST")
-                break
+                return self.emit_quoted("STR_CONST", ch_begin)
             elif ch == "\\":
-                ch2 = self.peek()
-                if ch2 == ch_begin:
-                    ch = self.read()
-                self.add(ch)
-            else:
-                self.add(ch)
+                if self.peek() == ch_begin:
+                    self.read()
 
     def question_mark(self, ch):
-        # type: (bytes) -> Iterator[Token]
-        self.add(ch)
+        # type: (bytes) -> Optional[Token]
         if self.state == self.EXPR_ARG:
             self.state = self.EXPR_BEG
-            yield self.emit("QUESTION")
+            return self.emit("QUESTION")
         else:
-            yield self.emit("UQUESTION")
+            return self.emit("UQUESTION")
 
     def ampersand(self, ch):
-        # type: (bytes) -> Iterator[Token]
+        # type: (bytes) -> Optional[Token]
         if self.state != self.EXPR_ARG:
             self.error("Unexpected &")
         self.state = self.EXPR_BEG
-        self.add(ch)
         ch2 = self.read()
         if ch2 == "&":
-            self.add(ch2)
-            yield self.emit("AND2")
+            return self.emit("AND2")
         else:
             self.unread()
-            yield self.emit("AND")
+            return self.emit("AND")
 
     def pipe(self, ch):
-        # type: (bytes) -> Iterator[Token]
+        # type: (bytes) -> Optional[Token]
         if self.state != self.EXPR_ARG:
             self.error("Unexpected |")
         self.state = self.EXPR_BEG
-        self.add(ch)
         ch2 = self.read()
         if ch2 == "|":
-            self.add(ch2)
-            yield self.emit("OR2")
+            return self.emit("OR2")
         else:
             self.unread()
-            yield self.emit("OR")
+            return self.emit("OR")
 
     def plus(self, ch):
-        # type: (bytes) -> Iterator[Token]
-        self.add(ch)
+        # type: (bytes) -> Optional[Token]
         if self.state == self.EXPR_BEG:
-            yield self.emit("UPLUS")
+            return self.emit("UPLUS")
         else:
-            yield self.emit("PLUS")
             self.state = self.EXPR_BEG
+            return self.emit("PLUS")
 
     def minus(self, ch):
-        # type: (bytes) -> Iterator[Token]
-        self.add(ch)
+        # type: (bytes) -> Optional[Token]
         ch2 = self.read()
         if ch2 == ">":
-            self.add(ch2)
-            yield self.emit("RIGHT_ASSIGN")
+            return self.emit("RIGHT_ASSIGN")
         else:
             self.unread()
             if self.state == self.EXPR_BEG:
-                yield self.emit("UMINUS")
+                return self.emit("UMINUS")
             else:
-                yield self.emit("MINUS")
                 self.state = self.EXPR_BEG
+                return self.emit("MINUS")
 
     def number(self, ch):
-        # type: (bytes) -> Iterator[Token]
+        # type: (bytes) -> Optional[Token]
         self.state = self.EXPR_ARG
-        self.add(ch)
-        seen_decimal = False
-        seen_exponent = False
-        while True:
+        if ch == "0" and self.peek() in "xX":
+            self.read()
+            digits_start = self.idx
+            self.scan_run(HEX_DIGITS)
+            if self.idx == digits_start:
+                self.error("Hex literal without digits")
             ch = self.read()
-            if ch.isdigit():
-                self.add(ch)
-            elif ch == ".":
-                if seen_decimal:
-                    self.unread()
-                    yield self.emit("NUM_CONST")
-                    break
-                else:
-                    self.add(ch)
-                    seen_decimal = True
-            elif ch in "eE":
-                if seen_exponent:
-                    self.unread()
-                    yield self.emit("NUM_CONST")
-                    break
-                else:
-                    seen_exponent = True
-                    seen_decimal = True
-                    self.add(ch)
-                    ch2 = self.peek()
-                    if ch2 in "+-":
-                        self.add(ch2)
-                        self.read()
-            else:
-                if ch == "L":
-                    self.add(ch)
-                else:
-                    self.unread()
-                yield self.emit("NUM_CONST")
-                break
+        else:
+            self.scan_run(DIGITS)
+            ch = self.read()
+            if ch == ".":
+                self.scan_run(DIGITS)
+                ch = self.read()
+            if ch == "e" or ch == "E":
+                if self.peek() in "+-":
+                    self.read()
+                self.scan_run(DIGITS)
+                ch = self.read()
+        if ch != "L":
+            self.unread()
+        token = self.emit("NUM_CONST")
+        token.decode_number()
+        return token
 
     def left_paren(self, ch):
-        # type: (bytes) -> Iterator[Token]
-        self.add(ch)
+        # type: (bytes) -> Optional[Token]
         self.state = self.EXPR_BEG
-        yield self.emit("LPAREN")
+        return self.emit("LPAREN")
 
     def right_paren(self, ch):
-        # type: (bytes) -> Iterator[Token]
-        self.add(ch)
+        # type: (bytes) -> Optional[Token]
         self.state = self.EXPR_ARG
-        yield self.emit("RPAREN")
+        return self.emit("RPAREN")
 
     def left_brace(self, ch):
-        # type: (bytes) -> Iterator[Token]
-        self.add(ch)
+        # type: (bytes) -> Optional[Token]
         self.state = self.EXPR_BEG
-        yield self.emit("LBRACE")
+        return self.emit("LBRACE")
 
     def right_brace(self, ch):
-        # type: (bytes) -> Iterator[Token]
-        self.add(ch)
+        # type: (bytes) -> Optional[Token]
         self.state = self.EXPR_ARG
-        yield self.emit("RBRACE")
+        return self.emit("RBRACE")
 
     def left_square(self, ch):
-        # type: (bytes) -> Iterator[Token]
-        self.add(ch)
+        # type: (bytes) -> Optional[Token]
         self.state = self.EXPR_BEG
-        yield self.emit("LSQUARE")
+        return self.emit("LSQUARE")
 
     def right_square(self, ch):
-        # type: (bytes) -> Iterator[Token]
-        self.add(ch)
+        # type: (bytes) -> Optional[Token]
         self.state = self.EXPR_ARG
-        yield self.emit("RSQUARE")
+        return self.emit("RSQUARE")
 
     def colon(self, ch):
-        # type: (bytes) -> Iterator[Token]
+        # type: (bytes) -> Optional[Token]
         if self.state != self.EXPR_ARG:
             self.error("Unexpected :")
-        self.add(ch)
         self.state = self.EXPR_BEG
         ch2 = self.peek()
         if ch2 == "=":
-            self.add(ch2)
             self.read()
-            yield self.emit("COLON_ASSIGN")
+            return self.emit("COLON_ASSIGN")
         else:
-            yield self.emit("COLON")
+            return self.emit("COLON")
 
     def slash(self, ch):
-        # type: (bytes) -> Iterator[Token]
+        # type: (bytes) -> Optional[Token]
         if self.state != self.EXPR_ARG:
             self.error("Unexpected /")
         self.state = self.EXPR_BEG
-        self.add(ch)
-        yield self.emit("DIV")
+        return self.emit("DIV")
 
     def caret(self, ch):
-        # type: (bytes) -> Iterator[Token]
+        # type: (bytes) -> Optional[Token]
         if self.state != self.EXPR_ARG:
             self.error("Unexpected ^")
         self.state = self.EXPR_BEG
-        self.add(ch)
-        yield self.emit("POW")
+        return self.emit("POW")
 
     def dot(self, ch):
-        # type: (bytes) -> Iterator[Token]
+        # type: (bytes) -> Optional[Token]
         self.state = self.EXPR_BEG
         ch2 = self.read()
         if ch2 != ".":
@@ -530,57 +980,172 @@ class Lexer(object):
         ch3 = self.read()
         if ch3 != ".":
             self.error("Unexpected ..")
-        self.add("...")
-        yield self.emit("ELLIPSIS")
+        return self.emit("ELLIPSIS")
 
     def percent(self, ch):
-        # type: (bytes) -> Iterator[Token]
+        # type: (bytes) -> Optional[Token]
         if self.state != self.EXPR_ARG:
             self.error("Unexpected %")
         self.state = self.EXPR_BEG
-        self.add(ch)
         ch2 = self.read()
-        self.add(ch2)
         if ch2 == "%":
-            yield self.emit("MOD")
+            return self.emit("MOD")
         else:
             while True:
                 ch = self.read()
                 if ch == self.EOF:
                     self.error("EOF in infix operator")
-                self.add(ch)
                 if ch == "%":
-                    yield self.emit("INFIX")
-                    break
+                    return self.emit("INFIX")
 
     def backtick(self, ch_begin):
-        # type: (bytes) -> Iterator[Token]
+        # type: (bytes) -> Optional[Token]
         self.state = self.EXPR_ARG
         while True:
             ch = self.read()
             if ch == self.EOF:
                 self.error("EOF in quoted literal")
             elif ch == ch_begin:
-                yield self.emit("SYMBOL")
-                break
+                token = self.emit_quoted("SYMBOL", ch_begin)
+                token.symbol_id = self.symtable.intern(token.getstr())
+                return token
             elif ch == "\\":
-                ch2 = self.peek()
-                if ch2 == ch_begin:
-                    ch = self.read()
-                self.add(ch)
-            else:
-                self.add(ch)
+                if self.peek() == ch_begin:
+                    self.read()
+
+
+def _char_class(chars, wide=False):
+    # type: (bytes, bool) -> List[bool]
+    # An entry for each byte, then one for all characters beyond a byte:
+    # only symbols and comments take those in.
+    char_class = [False] * 256 + [wide]
+    for ch in chars:
+        char_class[ord(ch)] = True
+    return char_class
+
+
+BLANKS = _char_class(" \t")
+DIGITS = _char_class("0123456789")
+HEX_DIGITS = _char_class("0123456789abcdefABCDEF")
+SYMBOL_CHARS = _char_class(
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789._" +
+    "".join([chr(i) for i in range(128, 256)]), wide=True)
+COMMENT_CHARS = [True] * 257
+for _ch in "\0\r\n":
+    COMMENT_CHARS[ord(_ch)] = False
+
+
+# Codes for the Lexer method that handles a token starting with a given
+# byte; see Lexer.handle(). Blanks are skipped without producing a token.
+H_BLANK = 0
+H_SYMBOL = 1
+H_COMMENT = 2
+H_LINE_BREAK = 3
+H_STAR = 4
+H_EXCLAMATION = 5
+H_EQUAL = 6
+H_LESS_THAN = 7
+H_GREATER_THAN = 8
+H_STRING_QUOTE = 9
+H_QUESTION_MARK = 10
+H_AMPERSAND = 11
+H_PIPE = 12
+H_PLUS = 13
+H_MINUS = 14
+H_NUMBER = 15
+H_LEFT_PAREN = 16
+H_RIGHT_PAREN = 17
+H_LEFT_BRACE = 18
+H_RIGHT_BRACE = 19
+H_LEFT_SQUARE = 20
+H_RIGHT_SQUARE = 21
+H_COLON = 22
+H_SLASH = 23
+H_CARET = 24
+H_SEMICOLON = 25
+H_COMMA = 26
+H_TILDE = 27
+H_DOT = 28
+H_BACKSLASH = 29
+H_PERCENT = 30
+H_DOLLAR = 31
+H_BACKTICK = 32
+
+
+def _build_handler_table():
+    # type: () -> List[int]
+    "NOT_RPYTHON"
+    table = [H_SYMBOL] * 256
+    for chars, handler in [
+        (" \t", H_BLANK),
+        ("#", H_COMMENT),
+        ("\r\n", H_LINE_BREAK),
+        ("*", H_STAR),
+        ("!", H_EXCLAMATION),
+        ("=", H_EQUAL),
+        ("<", H_LESS_THAN),
+        (">", H_GREATER_THAN),
+        ("'\"", H_STRING_QUOTE),
+        ("?", H_QUESTION_MARK),
+        ("&", H_AMPERSAND),
+        ("|", H_PIPE),
+        ("+", H_PLUS),
+        ("-", H_MINUS),
+        ("0123456789", H_NUMBER),
+        ("(", H_LEFT_PAREN),
+        (")", H_RIGHT_PAREN),
+        ("{", H_LEFT_BRACE),
+        ("}", H_RIGHT_BRACE),
+        ("[", H_LEFT_SQUARE),
+        ("]", H_RIGHT_SQUARE),
+        (":", H_COLON),
+        ("/", H_SLASH),
+        ("^", H_CARET),
+        (";", H_SEMICOLON),
+        (",", H_COMMA),
+        ("~", H_TILDE),
+        (".", H_DOT),
+        ("\\", H_BACKSLASH),
+        ("%", H_PERCENT),
+        ("$", H_DOLLAR),
+        ("`", H_BACKTICK),
+    ]:
+        for ch in chars:
+            table[ord(ch)] = handler
+    return table
+
+
+HANDLERS = _build_handler_table()
+
+
+def tokenize_stream(chunks, initial_lineno=1):
+    # type: (Iterable[bytes], int) -> Iterator[Token]
+    """NOT_RPYTHON
+
+    Lex an iterator of byte chunks, holding only the current token's bytes
+    (plus about one chunk) in memory. Tokens may span chunk boundaries. Each
+    token's text is taken out of the window before it is yielded, since that
+    part of the input may then be dropped, and likewise its position.
+    """
+    from blackbeard.source import ChunkedSource
+    return Lexer(ChunkedSource(chunks), initial_lineno, {}).tokenize_chunked()
 
 
 def main():
     # type: () -> None
     "NOT_RPYTHON"
-    import pprint
+    import os
     import sys
-    buf = open(sys.argv[1]).read()
-    lexer = Lexer(buf, 1, {})
-    tokens = list(lexer.tokenize())
-    pprint.pprint(tokens)
+    from blackbeard.source import open_source
+    from blackbeard.tokenbuffer import TokenBuffer
+    if sys.argv[1] == "-":
+        # Stream standard input, printing tokens as they are lexed.
+        for token in tokenize_stream(iter(lambda: os.read(0, 65536), b"")):
+            print(repr(token))
+        return
+    lexer = Lexer(open_source(sys.argv[1]), 1, {})
+    for token in TokenBuffer.from_lexer(lexer).cursor():
+        print(repr(token))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,131 @@
+"""NOT_RPYTHON
+
+Parse one large source in parallel by splitting it at top-level statement
+boundaries and parsing the pieces in a process pool.
+"""
+import multiprocessing
+import re
+
+from rply.errors import ParsingError
+from rply.token import SourcePosition
+from typing import Any, List, Optional, Tuple  # noqa
+
+from blackbeard import ast
+from blackbeard.lexer import Lexer, LexerError, LineIndex
+from blackbeard.parser import Parser
+
+# Characters that can open or close a nesting level, a string, a comment or
+# an infix operator, or end a line. Everything else is skipped by the regex.
+_SPECIAL = re.compile(r"""[\r\n"'`#%(){}\[\]\\]""")
+_LINE_END = re.compile(r"[\r\n]")
+_QUOTE_OR_BACKSLASH = dict(
+    (quote, re.compile(re.escape(quote) + r"|\\")) for quote in "'\"`")
+
+
+def _skip_quoted(source, i, quote):
+    # type: (Any, int, bytes) -> int
+    # Mirrors Lexer.string_quote: a backslash only escapes the quote itself.
+    stop = _QUOTE_OR_BACKSLASH[quote]
+    while True:
+        m = stop.search(source, i)
+        if m is None:
+            return len(source)
+        if m.group() == quote:
+            return m.end()
+        i = m.end()
+        if source[i:i + 1] == quote:
+            i += 1
+
+
+def split_statements(source, chunk_size):
+    # type: (Any, int) -> List[Tuple[int, int, int]]
+    """Split source into (start, end, lineno) pieces of at least chunk_size
+    bytes that each end just after a line break outside any bracket, string,
+    comment or infix operator, so that each piece is a run of complete
+    top-level statements. lineno is the line the piece starts on.
+    """
+    lines = LineIndex(source)
+    pieces = []
+    start = 0
+    depth = 0
+    i = 0
+    while True:
+        m = _SPECIAL.search(source, i)
+        if m is None:
+            break
+        ch = m.group()
+        i = m.end()
+        if ch in "([{":
+            depth += 1
+        elif ch in ")]}":
+            depth -= 1
+        elif ch in "'\"`":
+            i = _skip_quoted(source, i, ch)
+        elif ch == "%":
+            j = source.find("%", i)
+            i = len(source) if j < 0 else j + 1
+        elif ch == "#":
+            m = _LINE_END.search(source, i)
+            i = len(source) if m is None else m.start()
+        elif ch == "\\":
+            # A line continuation is not a statement boundary.
+            ch = source[i:i + 1]
+            if ch == "\r" or ch == "\n":
+                i += 1
+                if ch == "\r" and source[i:i + 1] == "\n":
+                    i += 1
+        else:
+            if ch == "\r" and source[i:i + 1] == "\n":
+                i += 1
+            if depth == 0 and i - start >= chunk_size:
+                pieces.append((start, i, lines.position(start).lineno))
+                start = i
+    if start < len(source):
+        pieces.append((start, len(source), lines.position(start).lineno))
+    return pieces
+
+
+def _parse_piece(args):
+    # type: (Tuple[bytes, int, int]) -> Tuple[Optional[List[ast.ASTNode]], Optional[Tuple[Any, ...]]]
+    # Errors are sent back as plain tuples because the lexer and parser
+    # exceptions cannot be unpickled.
+    text, lineno, backend = args
+    try:
+        result = Parser(Lexer(text, lineno, {}), backend).parse()
+    except LexerError as e:
+        return None, ("lexer", e.msg, e.pos.idx, e.pos.lineno, e.pos.colno)
+    except ParsingError as e:
+        pos = e.getsourcepos()
+        if pos is None:
+            return None, ("parser", e.message, -1, -1, -1)
+        return None, ("parser", e.message, pos.idx, pos.lineno, pos.colno)
+    assert isinstance(result, ast.Block)
+    return result.statements, None
+
+
+def parse_parallel(source, processes=None, chunk_size=1 << 20, backend=Parser.LR):
+    # type: (Any, Optional[int], int, int) -> ast.Block
+    """Parse source like blackbeard.parser.parse, using a pool of processes
+    for sources that split into more than one piece.
+
+    Errors are raised as in a serial parse, with positions relative to the
+    whole source; the first failing piece wins.
+    """
+    pieces = split_statements(source, chunk_size)
+    if len(pieces) <= 1:
+        return Parser(Lexer(source, 1, {}), backend).parse()
+    pool = multiprocessing.Pool(processes)
+    try:
+        work = [(source[start:end], lineno, backend) for start, end, lineno in pieces]
+        statements = []  # type: List[ast.ASTNode]
+        for (start, _, _), (result, error) in zip(pieces, pool.imap(_parse_piece, work)):
+            if error is not None:
+                kind, msg, idx, lineno, colno = error
+                pos = None if idx < 0 else SourcePosition(start + idx, lineno, colno)
+                if kind == "lexer":
+                    raise LexerError(pos, msg)
+                raise ParsingError(msg, pos)
+            statements.extend(result)
+    finally:
+        pool.terminate()
+    return ast.Block(statements)
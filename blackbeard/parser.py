@@ -1,8 +1,13 @@
 from rply import ParserGenerator, Token  # noqa:F401
-from typing import Iterator, Union  # noqa:F401
+from typing import Any, Dict, Iterator, List, Optional, Union  # noqa:F401
 
 from blackbeard import ast
-from blackbeard.lexer import Lexer
+from blackbeard.lexer import NUM_INTEGER, Lexer, SpanToken
+from blackbeard.pratt import OperatorTable, PrattParser
+
+# Outside these brackets, a newline or semicolon always ends a statement.
+OPENING = ["LPAREN", "LBRACE", "LSQUARE"]
+CLOSING = ["RPAREN", "RBRACE", "RSQUARE"]
 
 
 class LexerWrapper(object):
@@ -13,20 +18,111 @@ class LexerWrapper(object):
     def next(self):
         # type: () -> Token
         try:
-            return self.lexer.next()
+            token = self.lexer.next()
+            # The grammar has no COMMENT terminal.
+            while token.gettokentype() == "COMMENT":
+                token = self.lexer.next()
+            return token
         except StopIteration:
             return None
 
 
 class Parser(object):
-    def __init__(self, lexer):
-        # type: (Lexer) -> None
+    # Parsing backends: rply's LR parser, or the hand-written PrattParser.
+    LR = 0
+    PRATT = 1
+
+    def __init__(self, lexer, backend=LR, profile=None, nodes=None):
+        # type: (Lexer, int, Any, Any) -> None
         self.lexer = lexer
+        self.backend = backend
+        # An instrument.ParserProfile to record parses in, or None.
+        self.profile = profile
+        # A hashcons.NodeTable to intern every node in, or None.
+        self.nodes = nodes
+        # Every occurrence of a literal, or of an operator, in one call to
+        # parse_tokens() shares a node or string. The lexer never makes a
+        # negative or NaN number, so float keys are safe.
+        self.int_literals = {}  # type: Dict[int, ast.Vector]
+        self.float_literals = {}  # type: Dict[float, ast.Vector]
+        self.str_literals = {}  # type: Dict[bytes, ast.Vector]
+        self.operator_names = {}  # type: Dict[bytes, bytes]
+        # The parser has no use for COMMENT tokens; a lexer asked to collect
+        # comments for tooling keeps doing so.
+        if lexer.comment_mode == Lexer.COMMENTS_EMIT:
+            lexer.comment_mode = Lexer.COMMENTS_SKIP
 
     def parse(self):
         # type: () -> ast.ASTNode
-        l = LexerWrapper(self.lexer.tokenize())
-        return self.parser.parse(l, state=self)
+        return self.parse_tokens(self.lexer.tokenize())
+
+    def parse_tokens(self, tokens):
+        # type: (Iterator[Token]) -> ast.ASTNode
+        """Parse tokens produced by this parser's lexer, for example from a
+        TokenBuffer cursor."""
+        # Start each parse with empty literal tables, so that a parser
+        # reused for every statement of a stream does not keep them all.
+        self.int_literals = {}
+        self.float_literals = {}
+        self.str_literals = {}
+        self.operator_names = {}
+        if self.profile is not None:
+            result = self.profile.parse_tokens(self, tokens)
+        elif self.backend == self.PRATT:
+            result = PrattParser(self, self.operators, tokens).parse()
+        else:
+            result = self.parser.parse(LexerWrapper(tokens), state=self)
+        return self.share(result)
+
+    def parse_statements(self, tokens):
+        # type: (Iterator[Token]) -> Iterator[ast.ASTNode]
+        """Parse tokens one top-level statement at a time, yielding each
+        as soon as the newline or semicolon ending it has been read, and
+        keeping only that statement's tokens. Errors are raised as
+        parse_tokens() raises them, once the statements before them have
+        been yielded."""
+        statement = []  # type: List[Token]
+        depth = 0
+        for token in tokens:
+            token_type = token.gettokentype()
+            if token_type == "COMMENT":
+                continue
+            # The separator is parsed with the statement, so that an
+            # unfinished one fails on it, as in a whole parse.
+            statement.append(token)
+            if token_type in OPENING:
+                depth += 1
+            elif token_type in CLOSING:
+                depth -= 1
+            elif depth == 0 and (token_type == "NEWLINE" or token_type == "SEMICOLON"):
+                if len(statement) > 1:
+                    for node in self.parse_statement(statement):
+                        yield node
+                statement = []
+        if statement:
+            for node in self.parse_statement(statement):
+                yield node
+
+    def parse_statement(self, tokens):
+        # type: (List[Token]) -> List[ast.ASTNode]
+        block = self.parse_tokens(iter(tokens))
+        assert isinstance(block, ast.Block)
+        return block.statements
+
+    def symbol(self, token):
+        # type: (Token) -> ast.Symbol
+        assert isinstance(token, SpanToken)
+        symbol = self.share(self.lexer.symtable.symbol(token.symbol_id))
+        assert isinstance(symbol, ast.Symbol)
+        return symbol
+
+    def share(self, node):
+        # type: (ast.ASTNode) -> ast.ASTNode
+        """node, or the node equal to it in this parser's NodeTable. Nodes
+        are shared once complete, after their children."""
+        if self.nodes is None:
+            return node
+        return self.nodes.intern(node)
 
     # R grammar:
     # https://github.com/wch/r-source/blob/af7f52f70101960861e5d995d3a4bec010bc89e6/src/main/gram.y
@@ -54,7 +150,11 @@ class Parser(object):
             ("left", ["UPLUS", "UMINUS"]),
             ("right", ["POW"]),
             ("nonassoc", ["LPAREN", "LSQUARE"]),
-        ]
+        ],
+        # rply keeps the built LR tables in its user cache directory, in a
+        # file named for this id and a hash of the grammar, and rebuilds
+        # them when the grammar changes.
+        cache_id="blackbeard",
     )
 
     @pg.production("exprlist : ")
@@ -88,7 +188,7 @@ class Parser(object):
         # type: (List) -> ast.FormalList
         value = p[2] if len(p) > 1 else None
         return ast.FormalList([
-            (ast.Symbol(p[0].getstr().decode("utf-8")), value)
+            (self.symbol(p[0]), value)
         ])
 
     @pg.production("formlist : formlist COMMA SYMBOL")
@@ -97,7 +197,7 @@ class Parser(object):
         # type: (List) -> ast.FormalList
         value = p[4] if len(p) > 3 else None
         return p[0].append_formal(
-            ast.Symbol(p[2].getstr().decode("utf-8")),
+            self.symbol(p[2]),
             value
         )
 
@@ -114,34 +214,45 @@ class Parser(object):
     @pg.production("equal_assign : expr EQ_ASSIGN expr_or_assign")
     def equal_assign_expression(self, p):
         # type: (List[Union[ast.ASTNode, Token]]) -> ast.Assign
-        return ast.Assign(target=p[0], value=p[2])
+        return self.share(ast.Assign(target=p[0], value=p[2]))
 
     @pg.production("expr : NUM_CONST")
     def expr_num_const(self, p):
         # type: (List[Token]) -> ast.Vector
-        # TODO: support L, I extensions
-        return ast.Vector([
-            ast.FloatValue(float(p[0].getstr()))
-        ])
+        # TODO: support the I extension
+        token = p[0]
+        assert isinstance(token, SpanToken)
+        if token.num_type == NUM_INTEGER:
+            vector = self.int_literals.get(token.int_value, None)
+            if vector is None:
+                vector = self.share(ast.Vector([ast.IntValue(token.int_value)]))
+                self.int_literals[token.int_value] = vector
+            return vector
+        vector = self.float_literals.get(token.float_value, None)
+        if vector is None:
+            vector = self.share(ast.Vector([ast.FloatValue(token.float_value)]))
+            self.float_literals[token.float_value] = vector
+        return vector
 
     @pg.production("expr : STR_CONST")
     def expr_str_const(self, p):
         # type: (List[Token]) -> ast.Vector
-        return ast.Vector([
-            ast.CharValue(p[0].getstr().decode("utf-8"))
-        ])
+        text = p[0].getstr()
+        vector = self.str_literals.get(text, None)
+        if vector is None:
+            vector = self.share(ast.Vector([ast.CharValue(text.decode("utf-8"))]))
+            self.str_literals[text] = vector
+        return vector
 
     @pg.production("expr : NA")
     def expr_na(self, p):
         # type: (List[Token]) -> ast.Vector
-        return ast.Vector([
-            ast.BoolValue(False, na=True)
-        ])
+        return self.share(ast.NA)
 
     @pg.production("expr : SYMBOL")
     def simple_expr(self, p):
         # type: (List[Token]) -> ast.Symbol
-        return ast.Symbol(p[0].getstr().decode("utf-8"))
+        return self.symbol(p[0])
 
     @pg.production("expr : expr COLON expr")
     @pg.production("expr : expr PLUS expr")
@@ -165,30 +276,31 @@ class Parser(object):
     @pg.production("expr : expr OR2 expr")
     def expr_binary_op(self, p):
         # type: (List[Union[ast.ASTNode, Token]]) -> ast.BinaryOperation
-        return ast.BinaryOperation(
-            p[1].getstr(),
+        name = p[1].getstr()
+        return self.share(ast.BinaryOperation(
+            self.operator_names.setdefault(name, name),
             p[0],
-            p[2])
+            p[2]))
 
     @pg.production("expr : expr LEFT_ASSIGN expr")
     def expr_left_assign(self, p):
         # type: (List[Union[ast.ASTNode, Token]]) -> ast.Assign
-        return ast.Assign(target=p[0], value=p[2])
+        return self.share(ast.Assign(target=p[0], value=p[2]))
 
     @pg.production("expr : expr RIGHT_ASSIGN expr")
     def expr_right_assign(self, p):
         # type: (List[Union[ast.ASTNode, Token]]) -> ast.Assign
-        return ast.Assign(target=p[2], value=p[0])
+        return self.share(ast.Assign(target=p[2], value=p[0]))
 
     @pg.production("expr : FUNCTION LPAREN formlist RPAREN expr_or_assign")
     def expr_function_definition(self, p):
         # type: (List[ast.ASTNode]) -> ast.Function
-        return ast.Function(p[2], p[4])
+        return self.share(ast.Function(self.share(p[2]), p[4]))
 
     @pg.production("expr : LBRACE exprlist RBRACE")
     def expr_from_exprlist(self, p):
         # type: (List[Union[ast.Block, Token]]) -> ast.Block
-        return p[1]
+        return self.share(p[1])
 
     @pg.production("expr : LPAREN expr_or_assign RPAREN")
     def expr_from_parens(self, p):
@@ -231,25 +343,142 @@ class Parser(object):
         # type: (List[Token]) -> None
         return None
 
-    parser = pg.build()
+    try:
+        parser = pg.build()
+    except (IOError, OSError):
+        # The cache directory is not writable; build without it.
+        pg.cache_id = None
+        parser = pg.build()
 
+    operators = OperatorTable(pg)
 
-def parse(source):
-    # type: (bytes) -> ast.ASTNode
+
+def parse(source, backend=Parser.LR, cache=None, nodes=None):
+    # type: (bytes, int, Any, Any) -> ast.ASTNode
+    """Parse source, looking the tree up in and adding it to cache, an
+    astcache.ASTCache, if one is given, and interning its nodes in nodes, a
+    hashcons.NodeTable, if one is given."""
     lexer = Lexer(source, 1, {})
-    parser = Parser(lexer)
-    return parser.parse()
+    if cache is not None:
+        result = cache.get(source, lexer.symtable)
+        if result is not None:
+            return result if nodes is None else nodes.share(result)
+    parser = Parser(lexer, backend, nodes=nodes)
+    result = parser.parse()
+    if cache is not None:
+        cache.put(source, result)
+    return result
+
+
+def parse_stream(chunks, backend=Parser.LR):
+    # type: (Iterator[bytes], int) -> Iterator[ast.ASTNode]
+    """NOT_RPYTHON
+
+    Parse an iterator of byte chunks, yielding each top-level statement as
+    soon as it is complete. Only about one chunk of input and the tokens of
+    the current statement are held at a time.
+    """
+    from blackbeard.source import ChunkedSource
+    lexer = Lexer(ChunkedSource(chunks), 1, {})
+    parser = Parser(lexer, backend)
+    return parser.parse_statements(lexer.tokenize_chunked())
 
 
 def main():
     # type: () -> None
     "NOT_RPYTHON"
+    import argparse
+    import os
     import pdb
-    import pprint
     import sys
-    buf = open(sys.argv[1]).read()
-    lexer = Lexer(buf, 1, {})
-    parser = Parser(lexer)
-    if "--pdb" in sys.argv:
+    from blackbeard.source import open_source
+    argparser = argparse.ArgumentParser(prog="bbparse")
+    argparser.add_argument(
+        "path", nargs="+",
+        help="a file to print the tree of; with several files or a directory, "
+        "report on each R file")
+    argparser.add_argument("--pdb", action="store_true")
+    argparser.add_argument(
+        "-j", "--jobs", type=int, default=None,
+        help="parse pieces of the file, or the files of a batch, in this many "
+        "processes (default: 1 for a file, one per CPU for a batch)")
+    argparser.add_argument(
+        "--backend", choices=["lr", "pratt"], default="lr",
+        help="parse with rply's LR parser or the Pratt parser")
+    argparser.add_argument(
+        "--cache-dir", help="look parsed trees up in and add them to this directory")
+    argparser.add_argument(
+        "--fold", action="store_true",
+        help="fold operations on constants in the tree that is printed")
+    argparser.add_argument(
+        "--profile-json", metavar="PATH",
+        help="write the time spent in each production and the lexer as JSON")
+    argparser.add_argument(
+        "--profile-stacks", metavar="PATH",
+        help="write the same as collapsed stacks for flamegraph.pl")
+    argparser.add_argument(
+        "--hash-cons", action="store_true",
+        help="share one node between equal subtrees of the tree that is printed")
+    args = argparser.parse_args()
+    backend = Parser.PRATT if args.backend == "pratt" else Parser.LR
+    batch = len(args.path) > 1 or os.path.isdir(args.path[0])
+    profiling = args.profile_json or args.profile_stacks
+    parallel = args.jobs is not None and args.jobs > 1
+    if profiling and (batch or parallel or args.cache_dir):
+        argparser.error("--profile-json and --profile-stacks profile one file "
+                        "parsed in this process, without --jobs or --cache-dir")
+    if parallel and args.cache_dir and not batch:
+        argparser.error("--jobs and --cache-dir cannot be combined for one file")
+    if batch:
+        sys.exit(main_batch(args.path, args.jobs, backend, args.cache_dir))
+    source = open_source(args.path[0])
+    if args.pdb:
         pdb.set_trace()
-    pprint.pprint(parser.parse().as_dict())
+    profile = None
+    if profiling:
+        from blackbeard.instrument import ParserProfile
+        profile = ParserProfile()
+        result = Parser(Lexer(source, 1, {}), backend, profile).parse()
+    elif parallel:
+        from blackbeard.parallel import parse_parallel
+        result = parse_parallel(source, processes=args.jobs, backend=backend)
+    elif args.cache_dir:
+        from blackbeard.astcache import ASTCache
+        result = parse(source, backend, ASTCache(args.cache_dir))
+    else:
+        result = Parser(Lexer(source, 1, {}), backend).parse()
+    if args.fold:
+        from blackbeard.fold import ConstantFolder
+        folder = ConstantFolder()
+        result = folder.fold(result)
+        sys.stderr.write("folding eliminated %d nodes\n" % folder.eliminated)
+    if args.hash_cons:
+        from blackbeard.hashcons import NodeTable
+        table = NodeTable()
+        result = table.share(result)
+        sys.stderr.write("hash-consing kept %d distinct nodes\n" % len(table))
+    print(repr(result))
+    if profile is not None and args.profile_json:
+        with open(args.profile_json, "w") as f:
+            profile.write_json(f)
+    if profile is not None and args.profile_stacks:
+        with open(args.profile_stacks, "w") as f:
+            profile.write_stacks(f)
+
+
+def main_batch(paths, jobs, backend, cache_dir):
+    # type: (List[str], Optional[int], int, Optional[str]) -> int
+    """NOT_RPYTHON
+    Print each file's result as it finishes, then totals, and return the
+    exit status."""
+    import sys
+    import time
+    from blackbeard.batch import Summary, find_sources, parse_files
+    summary = Summary()
+    start = time.time()
+    for result in parse_files(find_sources(paths), jobs, backend, cache_dir):
+        print(repr(result))
+        summary.add(result)
+    summary.seconds = time.time() - start
+    sys.stderr.write("%r\n" % summary)
+    return 1 if summary.errors else 0
@@ -0,0 +1,207 @@
+"""A precedence-climbing (Pratt) parser for the grammar in blackbeard.parser.
+
+Rather than driving rply's LR tables, which call a production for every
+reduction, this parser reads tokens with one token of lookahead and builds
+the tree directly. The binary operators, their precedence and the
+single-token expressions are taken from the ParserGenerator itself, and the
+same production methods build their nodes, so both parsers produce equal
+trees and reject the same input.
+"""
+from rply import ParserGenerator, Token  # noqa:F401
+from rply.errors import ParsingError
+from typing import Any, Callable, Dict, Iterator, List, Optional  # noqa:F401
+
+from blackbeard import ast
+
+LEFT = 0
+RIGHT = 1
+
+# When an operator meets another of the same level, rply reduces unless
+# they are right-associative; "nonassoc" does not make the LR parser reject
+# a chain like "a < b < c", so it groups to the left here too.
+ASSOCIATIVITY = {"left": LEFT, "right": RIGHT, "nonassoc": LEFT}
+
+
+class OperatorTable(object):
+    """The parts of a ParserGenerator's grammar that the Pratt parser reads
+    from a table: binary "expr : expr OP expr" productions with the level
+    and associativity rply resolves their conflicts with, and "expr : TOKEN"
+    productions."""
+    def __init__(self, pg):
+        # type: (ParserGenerator) -> None
+        "NOT_RPYTHON"
+        precedence = {}
+        for level, (assoc, names) in enumerate(pg.precedence, 1):
+            for name in names:
+                precedence[name] = (level, ASSOCIATIVITY[assoc])
+        self.binary = {}  # type: Dict[str, Callable[[Any, List[Any]], ast.ASTNode]]
+        self.levels = {}  # type: Dict[str, int]
+        self.assoc = {}  # type: Dict[str, int]
+        self.atoms = {}  # type: Dict[str, Callable[[Any, List[Any]], ast.ASTNode]]
+        for name, syms, func, prec_name in pg.productions:
+            if name != "expr":
+                continue
+            if len(syms) == 3 and syms[0] == "expr" and syms[2] == "expr":
+                op = syms[1]
+                # Like rply, default to the precedence of the operator. Every
+                # binary operator needs one; levels start at 1.
+                level, assoc = precedence[prec_name or op]
+                self.binary[op] = func
+                self.levels[op] = level
+                self.assoc[op] = assoc
+            elif len(syms) == 1 and syms[0] in pg.tokens:
+                self.atoms[syms[0]] = func
+
+
+class PrattParser(object):
+    def __init__(self, state, table, tokens):
+        # type: (Any, OperatorTable, Iterator[Token]) -> None
+        # state is passed to the production methods, as rply does.
+        self.state = state
+        self.table = table
+        self.tokens = tokens
+        self.token = None  # type: Optional[Token]
+        self.type = "$end"
+        self.advance()
+
+    def advance(self):
+        # type: () -> Token
+        """Move to the next token, returning the current one."""
+        token = self.token
+        try:
+            next_token = self.tokens.next()
+            # The grammar has no COMMENT terminal.
+            while next_token.gettokentype() == "COMMENT":
+                next_token = self.tokens.next()
+        except StopIteration:
+            self.token = None
+            self.type = "$end"
+        else:
+            self.token = next_token
+            self.type = next_token.gettokentype()
+        return token
+
+    def error(self):
+        # type: () -> ParsingError
+        pos = None if self.token is None else self.token.getsourcepos()
+        return ParsingError(None, pos)
+
+    def expect(self, token_type):
+        # type: (str) -> Token
+        if self.type != token_type:
+            raise self.error()
+        return self.advance()
+
+    def parse(self):
+        # type: () -> ast.Block
+        return self.exprlist("$end")
+
+    def exprlist(self, end):
+        # type: (str) -> ast.Block
+        """Statements separated by newlines or semicolons, up to the end
+        token, which is left unread."""
+        statements = []  # type: List[ast.ASTNode]
+        separated = True
+        while True:
+            if self.type == "NEWLINE" or self.type == "SEMICOLON":
+                self.advance()
+                separated = True
+            elif self.type == end:
+                return ast.Block(statements)
+            elif not separated:
+                raise self.error()
+            else:
+                statements.append(self.expr_or_assign())
+                separated = False
+
+    def expr_or_assign(self):
+        # type: () -> ast.ASTNode
+        # "=" is only allowed where a whole statement is, and binds looser
+        # than any operator.
+        expr = self.expr(0)
+        if self.type == "EQ_ASSIGN":
+            self.advance()
+            return self.state.share(ast.Assign(target=expr, value=self.expr_or_assign()))
+        return expr
+
+    def expr(self, min_level):
+        # type: (int) -> ast.ASTNode
+        """An expression whose binary operators all bind at min_level or
+        tighter."""
+        table = self.table
+        left = self.operand()
+        while True:
+            op = self.type
+            level = table.levels.get(op, 0)
+            if level == 0 or level < min_level:
+                return left
+            token = self.advance()
+            if table.assoc[op] == RIGHT:
+                right = self.right_operand(level)
+            else:
+                right = self.expr(level + 1)
+            left = table.binary[op](self.state, [left, token, right])
+
+    def right_operand(self, level):
+        # type: (int) -> ast.ASTNode
+        """The right operand of a right-associative operator at level: the
+        rest of a chain like "b ^ c ^ d", grouped to the right. The chain
+        is read in a loop, not by recursing for each operator, as a long one
+        would exhaust the Python stack."""
+        table = self.table
+        operands = [self.expr(level + 1)]
+        tokens = []  # type: List[Token]
+        while table.levels.get(self.type, 0) == level:
+            tokens.append(self.advance())
+            operands.append(self.expr(level + 1))
+        right = operands.pop()
+        while tokens:
+            token = tokens.pop()
+            func = table.binary[token.gettokentype()]
+            right = func(self.state, [operands.pop(), token, right])
+        return right
+
+    def operand(self):
+        # type: () -> ast.ASTNode
+        func = self.table.atoms.get(self.type, None)
+        if func is not None:
+            return func(self.state, [self.advance()])
+        if self.type == "LPAREN":
+            self.advance()
+            expr = self.expr_or_assign()
+            self.expect("RPAREN")
+            return expr
+        if self.type == "LBRACE":
+            self.advance()
+            block = self.exprlist("RBRACE")
+            self.advance()
+            return self.state.share(block)
+        if self.type == "FUNCTION":
+            self.advance()
+            self.expect("LPAREN")
+            formals = self.state.share(self.formlist())
+            assert isinstance(formals, ast.FormalList)
+            self.expect("RPAREN")
+            # The body takes in every operator that follows it.
+            return self.state.share(ast.Function(formals, self.expr_or_assign()))
+        raise self.error()
+
+    def formlist(self):
+        # type: () -> ast.FormalList
+        formals = ast.FormalList([])
+        # As in the LR grammar, a comma may follow an empty list.
+        if self.type == "SYMBOL":
+            self.formal(formals)
+        while self.type == "COMMA":
+            self.advance()
+            self.formal(formals)
+        return formals
+
+    def formal(self, formals):
+        # type: (ast.FormalList) -> None
+        symbol = self.state.symbol(self.expect("SYMBOL"))
+        value = None  # type: Optional[ast.ASTNode]
+        if self.type == "EQ_ASSIGN":
+            self.advance()
+            value = self.expr(0)
+        formals.append_formal(symbol, value)
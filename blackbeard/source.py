@@ -0,0 +1,107 @@
+"""Source buffers the Lexer can index into without copying the input.
+
+The Lexer only needs ``source[i]`` to return a one-character string (raising
+IndexError past the end), ``source[start:end]`` to return a string and
+``source.find(sub, start, end)`` to search a range, as on strings. Plain
+strings and mmap objects already behave that way; memoryviews slice to
+memoryviews, so they are wrapped in MemoryViewSource. ChunkedSource pulls an
+iterator of byte chunks into a sliding window on demand.
+"""
+import mmap
+import os
+
+from typing import Any, Iterable  # noqa
+
+
+class MemoryViewSource(object):
+    def __init__(self, view):
+        # type: (memoryview) -> None
+        self.view = view
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.view)
+
+    def __getitem__(self, key):
+        # type: (Any) -> bytes
+        if isinstance(key, slice):
+            return self.view[key].tobytes()
+        return self.view[key]
+
+    def find(self, sub, start, end):
+        # type: (bytes, int, int) -> int
+        i = self.view[start:end].tobytes().find(sub)
+        return i if i < 0 else start + i
+
+
+class ChunkedSource(object):
+    """Indexes into a stream of byte chunks by absolute offset.
+
+    Only the bytes from the last discard() point onwards are kept once the
+    next chunk is pulled from the iterator, so memory is bounded by the chunk
+    size plus the length of the token being lexed.
+    """
+    def __init__(self, chunks):
+        # type: (Iterable[bytes]) -> None
+        self.chunks = iter(chunks)
+        self.buf = b""
+        self.offset = 0  # absolute offset of buf[0]
+        self.keep = 0  # absolute offset of the oldest byte still needed
+        self.exhausted = False
+
+    def fill(self):
+        # type: () -> bool
+        for chunk in self.chunks:
+            if chunk:
+                self.buf = self.buf[self.keep - self.offset:] + chunk
+                self.offset = self.keep
+                return True
+        self.exhausted = True
+        return False
+
+    def discard(self, idx):
+        # type: (int) -> None
+        """Allow everything before absolute offset idx to be dropped."""
+        if idx > self.keep:
+            self.keep = idx
+
+    def __getitem__(self, key):
+        # type: (Any) -> bytes
+        if isinstance(key, slice):
+            assert key.start >= self.offset
+            while not self.exhausted and key.stop - self.offset > len(self.buf):
+                self.fill()
+            return self.buf[key.start - self.offset:key.stop - self.offset]
+        i = key - self.offset
+        assert i >= 0
+        while i >= len(self.buf):
+            if self.exhausted or not self.fill():
+                raise IndexError(key)
+            i = key - self.offset
+        return self.buf[i]
+
+    def find(self, sub, start, end):
+        # type: (bytes, int, int) -> int
+        while not self.exhausted and end - self.offset > len(self.buf):
+            self.fill()
+        assert start >= self.offset
+        i = self.buf.find(sub, start - self.offset, end - self.offset)
+        return i if i < 0 else self.offset + i
+
+
+def as_source(buf):
+    # type: (Any) -> Any
+    "NOT_RPYTHON"
+    if isinstance(buf, memoryview):
+        return MemoryViewSource(buf)
+    return buf
+
+
+def open_source(path):
+    # type: (str) -> Any
+    "NOT_RPYTHON"
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # mmap refuses to map empty files.
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
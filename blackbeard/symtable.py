@@ -0,0 +1,41 @@
+from typing import Dict, List, Optional  # noqa
+
+from blackbeard import ast
+
+
+class SymbolTable(object):
+    """Interns identifiers, giving each a stable integer id and one shared
+    ast.Symbol."""
+    def __init__(self, ids=None):
+        # type: (Optional[Dict[bytes, int]]) -> None
+        self.ids = {} if ids is None else ids  # type: Dict[bytes, int]
+        self.names = [None] * len(self.ids)  # type: List[bytes]
+        for name, symbol_id in self.ids.items():
+            self.names[symbol_id] = name
+        self.symbols = [None] * len(self.ids)  # type: List[Optional[ast.Symbol]]
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.names)
+
+    def intern(self, name):
+        # type: (bytes) -> int
+        symbol_id = self.ids.get(name, -1)
+        if symbol_id < 0:
+            symbol_id = len(self.names)
+            self.ids[name] = symbol_id
+            self.names.append(name)
+            self.symbols.append(None)
+        return symbol_id
+
+    def name(self, symbol_id):
+        # type: (int) -> bytes
+        return self.names[symbol_id]
+
+    def symbol(self, symbol_id):
+        # type: (int) -> ast.Symbol
+        symbol = self.symbols[symbol_id]
+        if symbol is None:
+            symbol = ast.Symbol(self.names[symbol_id].decode("utf-8"))
+            self.symbols[symbol_id] = symbol
+        return symbol
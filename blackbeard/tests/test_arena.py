@@ -0,0 +1,88 @@
+from blackbeard import ast
+from blackbeard.arena import BINARY, FUNCTION, NO_NODE, SYMBOL, Arena
+from blackbeard.parser import parse
+from blackbeard.symtable import SymbolTable
+
+SOURCE = b"""x <- 1L + 2.5 * y
+f <- function(a, b = 'q', c) { a %% b == NA; 0.5 }
+z <- x < 'q'; 0x1F
+"""
+
+
+class TestArena(object):
+    def test_round_trip(self):
+        for source in [SOURCE, b"", b"1", b"function() NA", b"'\\u00e9' + 1e300"]:
+            tree = parse(source)
+            assert Arena.from_tree(tree).to_tree() == tree
+
+    def test_negative_zero_is_kept(self):
+        tree = parse(b"0.0; 1 - 1")
+        tree.statements[1] = ast.Vector([ast.FloatValue(-0.0)])
+        values = [s.values[0].value for s in Arena.from_tree(tree).to_tree().statements]
+        assert repr(values) == "[0.0, -0.0]"
+
+    def test_shared_nodes_are_stored_once(self):
+        tree = parse(b"x <- NA; y <- NA + 1 * 1")
+        arena = Arena.from_tree(tree)
+        nodes = list(arena.walk())
+        assert len(set(nodes)) < len(nodes)
+        rebuilt = arena.to_tree()
+        assert rebuilt.statements[0].value is ast.NA
+        assert rebuilt.statements[0].value is rebuilt.statements[1].value.left
+        assert rebuilt.statements[0].target is not rebuilt.statements[1].target
+
+    def test_pools(self):
+        arena = Arena.from_tree(parse(b"a <- 'q' + 'q' + 1L + 1L + a"))
+        assert list(arena.ints) == [1]
+        assert arena.strings == [u"q"]
+        assert arena.operators == ["+"]
+        assert len(arena.symtable) == 1
+
+    def test_symbols_use_the_symbol_table(self):
+        symtable = SymbolTable()
+        symtable.intern(b"before")
+        arena = Arena.from_tree(parse(b"x + x"), symtable)
+        tree = arena.to_tree()
+        plus = tree.statements[0]
+        assert plus.left is plus.right is symtable.symbol(symtable.intern(b"x"))
+
+    def test_views(self):
+        arena = Arena.from_tree(parse(SOURCE))
+        block = arena.node()
+        assert block.node_type is ast.Block
+        assign, f, z, hex_ = block.statements
+        assert assign.target.name == u"x"
+        plus = assign.value
+        assert plus.operator == "+"
+        assert plus.left.values[0].value == 1 and not plus.left.values[0].na
+        assert plus.right.right.name == u"y"
+        function = f.value
+        assert [(s.name, d) for s, d in function.formals.entries][0] == (u"a", None)
+        assert function.formals.entries[1][1].values[0].value == u"q"
+        comparison = function.body.statements[0]
+        assert comparison.operator == "==" and comparison.right.values[0].na
+        assert hex_.values[0].value == 31
+        assert z.value.to_node() == parse(b"x < 'q'").statements[0]
+        assert block.to_node() == parse(SOURCE)
+        assert arena.node(plus.index) == plus and plus != assign.value.left
+
+    def test_index_traversal(self):
+        arena = Arena.from_tree(parse(SOURCE))
+        kinds = [arena.kind(i) for i in arena.walk()]
+        assert kinds.count(FUNCTION) == 1
+        assert kinds.count(BINARY) == 5
+        names = [arena.symbol_name(i) for i in arena.walk() if arena.kind(i) == SYMBOL]
+        assert names == [u"x", u"y", u"f", u"a", u"b", u"c", u"a", u"b", u"z", u"x"]
+        formals = arena.child(arena.child(arena.child(arena.root, 1), 1), 0)
+        assert arena.child_count(formals) == 6
+        assert arena.child(formals, 1) == NO_NODE
+        assert arena.child(formals, 5) == NO_NODE
+
+    def test_deep_trees(self):
+        source = b" + ".join([b"x"] * 5000)
+        tree = parse(source)
+        arena = Arena.from_tree(tree)
+        assert len(list(arena.walk())) == 10000
+        # Comparing the trees would recurse; compare their arenas instead.
+        again = Arena.from_tree(arena.to_tree())
+        assert again.kinds == arena.kinds and again.children == arena.children
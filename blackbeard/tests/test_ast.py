@@ -0,0 +1,117 @@
+from blackbeard import ast
+from blackbeard.parser import parse
+
+
+class TestAST(object):
+    def test_nodes_have_no_dict(self):
+        tree = parse(b"f <- function(x, y = 'a') x + 1L * 2.5 == NA")
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            assert not hasattr(node, "__dict__") or not node.__dict__
+            for field in node._fields:
+                value = getattr(node, field)
+                if isinstance(value, list):
+                    stack.extend(v for v in value if isinstance(v, ast.ASTNode))
+                    stack.extend(v for entry in value if isinstance(entry, tuple)
+                                 for v in entry if isinstance(v, ast.ASTNode))
+                elif isinstance(value, ast.ASTNode):
+                    stack.append(value)
+
+    def test_equality(self):
+        assert ast.IntValue(1) == ast.IntValue(1)
+        assert ast.IntValue(1) != ast.IntValue(1, na=True)
+        assert ast.IntValue(1) != ast.FloatValue(1.0)
+        assert not ast.Vector([ast.IntValue(1)]) != ast.Vector([ast.IntValue(1)])
+        assert parse(b"a + b") == parse(b"a + b")
+        assert parse(b"a + b") != parse(b"a - b")
+
+    def test_shared_literals(self):
+        tree = parse(b"x <- NA; y <- NA + 1 * 1; z <- 'a' == 'a'")
+        x, y, z = [statement.value for statement in tree.statements]
+        assert x is ast.NA and y.left is ast.NA
+        assert y.right.left is y.right.right
+        assert z.left is z.right
+        assert parse(b"1") == parse(b"1") and parse(b"1") is not parse(b"1")
+
+    def test_formal_lists_are_not_shared(self):
+        parse(b"function(, a) a")
+        assert parse(b"function() 1").statements[0].formals.entries == []
+
+    def test_vectors_are_unboxed(self):
+        values = [ast.FloatValue(1.5), ast.FloatValue(0.0, na=True), ast.FloatValue(-0.0)]
+        vector = ast.Vector(values)
+        assert vector.type == ast.Vector.DOUBLE
+        assert vector.doubles == [1.5, 0.0, -0.0] and vector.integers is None
+        assert vector.na == [False, True, False]
+        assert vector.values == values and len(vector.values) == 3
+        assert list(vector.values) == values and vector.values[-1] == values[2]
+        assert vector.values[1:] == values[1:]
+        assert [vector.is_na(i) for i in range(3)] == [False, True, False]
+        assert repr(vector) == "ast.Vector(%s)" % values
+
+    def test_vector_types(self):
+        ints = ast.Vector([ast.IntValue(1), ast.IntValue(2)])
+        assert ints.type == ast.Vector.INTEGER and ints.na is None
+        assert ints.integers == [1, 2]
+        chars = ast.Vector([ast.CharValue(u"a"), ast.CharValue(u"b", na=True)])
+        assert chars.type == ast.Vector.CHARACTER and chars.characters == [u"a", u"b"]
+        assert chars.values[1] == ast.CharValue(u"b", na=True)
+        logicals = ast.Vector([ast.TRUE, ast.NA_LOGICAL, ast.FALSE])
+        assert logicals.type == ast.Vector.LOGICAL
+        assert logicals.logicals == [True, False, False]
+        assert logicals.values[0] is ast.TRUE and logicals.values[1] is ast.NA_LOGICAL
+        assert ast.Vector([]).values == []
+
+    def test_vectors_fall_back_to_values(self):
+        mixed = [ast.IntValue(1), ast.FloatValue(1.0)]
+        assert ast.Vector(mixed).type == ast.Vector.GENERIC
+        assert ast.Vector(mixed).values == mixed
+        assert ast.Vector(mixed).generic == mixed
+        assert ast.Vector([ast.IntValue(2 ** 40)]).integers == [2 ** 40]
+
+    def test_vector_from_data(self):
+        data = [float(i) for i in range(1000)]
+        vector = ast.Vector.from_data(ast.Vector.DOUBLE, data, [False] * 1000)
+        assert vector.doubles is data and vector.na is None
+        assert vector.values[999] == ast.FloatValue(999.0)
+        assert vector == ast.Vector([ast.FloatValue(float(i)) for i in range(1000)])
+        na = [False] * 1000
+        na[0] = True
+        assert ast.Vector.from_data(ast.Vector.DOUBLE, data, na).values[0].na
+
+    def test_structural_hash(self):
+        assert hash(parse(b"a + 1 * 'x'")) == hash(parse(b"a + 1 * 'x'"))
+        assert hash(parse(b"a + b")) != hash(parse(b"b + a"))
+        assert hash(ast.IntValue(1)) != hash(ast.FloatValue(1.0))
+        assert hash(ast.FloatValue(0.0)) != hash(ast.FloatValue(-0.0))
+        assert hash(ast.Vector([ast.FloatValue(0.0)])) != hash(ast.Vector([ast.FloatValue(-0.0)]))
+        assert len(set([parse(b"f <- function(x) x"), parse(b"f <- function(x) x")])) == 1
+
+    def test_doubles_compare_bit_for_bit(self):
+        assert ast.FloatValue(0.0) != ast.FloatValue(-0.0)
+        assert ast.Vector([ast.FloatValue(0.0)]) != ast.Vector([ast.FloatValue(-0.0)])
+        nan = float("nan")
+        assert ast.FloatValue(nan) == ast.FloatValue(nan)
+        assert ast.Vector([ast.FloatValue(nan)]) == ast.Vector([ast.FloatValue(nan)])
+
+    def test_hash_is_cached(self):
+        tree = parse(b"x <- y + 1")
+        assert getattr(tree, "_hash", None) is None
+        h = hash(tree)
+        assert tree._hash == h and tree.statements[0].value._hash is not None
+        tree.append(parse(b"z").statements[0])
+        assert hash(tree) != h and hash(tree) == hash(parse(b"x <- y + 1; z"))
+
+    def test_deep_trees_hash(self):
+        source = b" + ".join([b"x"] * 5000)
+        assert hash(parse(source)) == hash(parse(source))
+
+    def test_known_hashes_settle_inequality(self):
+        a = parse(b"x + 1")
+        b = parse(b"x + 2")
+        hash(a), hash(b)
+        # Equality stops at the root, whose hashes differ, so it never
+        # reaches this.
+        b.statements[0].right = None
+        assert a != b
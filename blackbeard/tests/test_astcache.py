@@ -0,0 +1,126 @@
+# coding=utf-8
+import os
+
+import pytest
+
+from blackbeard import ast
+from blackbeard.astcache import (
+    SUFFIX, TMP_SUFFIX, ASTCache, CorruptEntry, decode, encode, source_key)
+from blackbeard.parser import Parser, parse
+from blackbeard.symtable import SymbolTable
+
+SOURCE = b"""\
+f <- function(x, y = 2L, z) {
+    s <- 'caf\xc3\xa9'; \xc3\xa9t\xc3\xa9 = NA
+    x * 1.5e-3 + y ^ 0x1F -> w
+}
+f = z %% 7 < 3 || z ~ y ? x
+"""
+
+
+class TestEncoding(object):
+    def test_round_trip(self):
+        tree = parse(SOURCE)
+        assert decode(encode(tree, len(SOURCE)), len(SOURCE), SymbolTable()) == tree
+
+    def test_values(self):
+        tree = ast.Block([ast.Vector([
+            ast.IntValue(-5), ast.IntValue(2 ** 31 - 1, na=True),
+            ast.FloatValue(float("inf")), ast.FloatValue(-0.0), ast.FloatValue(0.1),
+            ast.BoolValue(True), ast.CharValue(u"☃", na=True),
+        ])])
+        assert decode(encode(tree, 0), 0, SymbolTable()) == tree
+
+    def test_symbols_are_interned(self):
+        symtable = SymbolTable()
+        tree = decode(encode(parse(b"x <- x + y"), 10), 10, symtable)
+        assign = tree.statements[0]
+        assert assign.target is assign.value.left
+        assert assign.target is symtable.symbol(symtable.intern(b"x"))
+
+    def test_deep_trees(self, tmpdir):
+        source = b"a" + b" + 1" * 3000 + b"\nb <- 2" + b" ^ 2" * 3000
+        tree = parse(source)
+        data = encode(tree, len(source))
+        decoded = decode(data, len(source), SymbolTable())
+        # Comparing the trees would recurse; compare their encodings.
+        assert encode(decoded, len(source)) == data
+        assert hash(decoded) == hash(tree)
+        cached = parse(source, cache=ASTCache(str(tmpdir)))
+        assert encode(cached, len(source)) == data
+        assert encode(parse(source, cache=ASTCache(str(tmpdir))), len(source)) == data
+
+    def test_corrupt_data(self):
+        data = encode(parse(SOURCE), len(SOURCE))
+        for bad in [b"", data[:-1], data + b"\0", b"X" + data[1:]]:
+            with pytest.raises(CorruptEntry):
+                decode(bad, len(SOURCE), SymbolTable())
+        with pytest.raises(CorruptEntry):
+            decode(data, len(SOURCE) + 1, SymbolTable())
+
+
+class TestASTCache(object):
+    def test_hit_skips_the_parser(self, tmpdir, monkeypatch):
+        cache = ASTCache(str(tmpdir))
+        tree = parse(SOURCE, cache=cache)
+        assert tree == parse(SOURCE)
+
+        def fail(self):
+            raise AssertionError("parsed despite a cached tree")
+        monkeypatch.setattr(Parser, "parse", fail)
+        assert parse(SOURCE, cache=ASTCache(str(tmpdir))) == tree
+        with pytest.raises(AssertionError):
+            parse(SOURCE + b"1\n", cache=cache)
+
+    def test_keys_depend_on_source(self):
+        assert source_key(b"a") == source_key(b"a")
+        assert source_key(b"a") != source_key(b"b")
+
+    def test_corrupt_entry_is_a_miss(self, tmpdir):
+        cache = ASTCache(str(tmpdir))
+        parse(SOURCE, cache=cache)
+        path = cache.path(source_key(SOURCE))
+        with open(path, "wb") as f:
+            f.write(b"garbage")
+        assert cache.get(SOURCE, SymbolTable()) is None
+        assert not os.path.exists(path)
+
+    def test_least_recently_used_entries_are_evicted(self, tmpdir):
+        sources = [b"x%d <- %d\n" % (i, i) for i in range(6)]
+        cache = ASTCache(str(tmpdir))
+        for i, source in enumerate(sources):
+            cache.put(source, parse(source))
+            os.utime(cache.path(source_key(source)), (1000 + i, 1000 + i))
+        size = os.path.getsize(cache.path(source_key(sources[0])))
+        # Reading the oldest entry makes it the most recently used.
+        assert cache.get(sources[0], SymbolTable()) is not None
+        # Eviction goes down to nine tenths of the bound, leaving four entries.
+        cache.max_bytes = size * 5
+        cache.evict()
+        assert cache.total == size * 4
+        kept = [cache.get(source, SymbolTable()) is not None for source in sources]
+        assert kept == [True, False, False, True, True, True]
+
+    def test_concurrent_writers(self, tmpdir):
+        tree = parse(SOURCE)
+        # Two processes' caches writing the same entry leave one whole file.
+        first, second = ASTCache(str(tmpdir)), ASTCache(str(tmpdir))
+        first.put(SOURCE, tree)
+        second.put(SOURCE, tree)
+        assert os.listdir(str(tmpdir)) == [source_key(SOURCE) + SUFFIX]
+        assert first.get(SOURCE, SymbolTable()) == tree
+
+    def test_stale_temporary_files_are_removed(self, tmpdir):
+        stale = tmpdir.join("abc.1.1" + TMP_SUFFIX)
+        stale.write("partial")
+        os.utime(str(stale), (1000, 1000))
+        fresh = tmpdir.join("abc.2.1" + TMP_SUFFIX)
+        fresh.write("partial")
+        ASTCache(str(tmpdir)).evict()
+        assert not stale.check()
+        assert fresh.check()
+
+    def test_missing_directory_is_created(self, tmpdir):
+        cache = ASTCache(str(tmpdir.join("a", "b")))
+        parse(SOURCE, cache=cache)
+        assert cache.get(SOURCE, SymbolTable()) == parse(SOURCE)
@@ -0,0 +1,70 @@
+import os
+
+from blackbeard.batch import Summary, find_sources, parse_file, parse_files
+
+
+def make_tree(tmpdir):
+    tmpdir.join("a.R").write(b"x <- 1\ny <- 2\n")
+    tmpdir.join("notes.txt").write(b"not R")
+    sub = tmpdir.mkdir("sub")
+    sub.join("b.r").write(b"f <- function(x) {\n    x + 1\n}\n")
+    sub.join("bad.R").write(b"x <- (1\n")
+    sub.join("empty.R").write(b"")
+    return [str(tmpdir.join(name)) for name in ["a.R", "sub/b.r", "sub/bad.R", "sub/empty.R"]]
+
+
+class TestBatch(object):
+    def test_find_sources(self, tmpdir):
+        expected = make_tree(tmpdir)
+        assert list(find_sources([str(tmpdir)])) == expected
+        # Files named explicitly are kept whatever their suffix.
+        notes = str(tmpdir.join("notes.txt"))
+        assert list(find_sources([notes, str(tmpdir.join("sub"))])) == [notes] + expected[1:]
+
+    def test_parse_file(self, tmpdir):
+        paths = make_tree(tmpdir)
+        result = parse_file(paths[0])
+        assert (result.statements, result.size, result.error) == (2, 14, None)
+        assert parse_file(paths[2]).error == "2:1: parse error"
+        assert parse_file(paths[3]).statements == 0
+        assert parse_file(str(tmpdir.join("missing.R"))).error is not None
+
+    def test_cache(self, tmpdir):
+        path = make_tree(tmpdir)[1]
+        cache_dir = str(tmpdir.join("cache"))
+        assert parse_file(path, cache_dir=cache_dir).statements == 1
+        assert len(os.listdir(cache_dir)) == 1
+        assert parse_file(path, cache_dir=cache_dir).statements == 1
+
+    def test_pool_matches_serial(self, tmpdir):
+        paths = make_tree(tmpdir) * 3
+        serial = [repr(result) for result in parse_files(paths, processes=1)]
+        pooled = [repr(result) for result in parse_files(paths, processes=2)]
+        assert sorted(pooled) == sorted(serial)
+        assert serial[:4] == [
+            "%s: 2 statements" % paths[0],
+            "%s: 1 statements" % paths[1],
+            "%s: 2:1: parse error" % paths[2],
+            "%s: 0 statements" % paths[3],
+        ]
+
+    def test_unexpected_errors_are_reported(self, tmpdir):
+        paths = make_tree(tmpdir)
+        latin1 = tmpdir.join("latin1.R")
+        latin1.write_binary(b"caf\xe9 <- 1\n")
+        backslash = tmpdir.join("backslash.R")
+        backslash.write_binary(b"x <- 1 \\ 2\n")
+        paths[2:2] = [str(latin1), str(backslash)]
+        for processes in [1, 2]:
+            results = dict((r.path, r) for r in parse_files(paths, processes=processes))
+            assert len(results) == 6
+            assert results[str(latin1)].error.startswith("UnicodeDecodeError: ")
+            assert results[str(backslash)].error.startswith("NotImplementedError")
+            assert results[paths[0]].statements == 2 and results[paths[1]].statements == 1
+
+    def test_summary(self, tmpdir):
+        summary = Summary()
+        for result in parse_files(make_tree(tmpdir), processes=2):
+            summary.add(result)
+        assert (summary.files, summary.errors, summary.statements) == (4, 1, 3)
+        assert summary.size == 14 + 31 + 8
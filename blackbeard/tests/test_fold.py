@@ -0,0 +1,113 @@
+import math
+
+from blackbeard import ast
+from blackbeard.fold import ConstantFolder, fold_constants
+from blackbeard.parser import parse
+
+
+def count_nodes(node):
+    # Every node of the tree, as often as it occurs; a vector's elements
+    # are not nodes.
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        if isinstance(node, ast.Vector):
+            continue
+        for field in node._fields:
+            value = getattr(node, field)
+            if isinstance(value, list):
+                stack.extend(v for v in value if isinstance(v, ast.ASTNode))
+                stack.extend(v for entry in value if isinstance(entry, tuple)
+                             for v in entry if isinstance(v, ast.ASTNode))
+            elif isinstance(value, ast.ASTNode):
+                stack.append(value)
+    return count
+
+
+def folded(source):
+    tree = parse(source)
+    assert isinstance(tree, ast.Block)
+    return fold_constants(tree).statements[0]
+
+
+def value(source):
+    result = folded(source)
+    assert isinstance(result, ast.Vector), source
+    return result.values[0]
+
+
+class TestFold(object):
+    def test_integers(self):
+        assert value("60L * 60L * 24L") == ast.IntValue(86400)
+        assert value("7L %% (0L - 3L)") == ast.IntValue(-2)
+        assert value("5L %% 0L") == ast.IntValue(0, na=True)
+        # Integers stay integers, except under / and ^.
+        assert value("1L + 2L") == ast.IntValue(3)
+        assert value("1L / 2L") == ast.FloatValue(0.5)
+        assert value("2L ^ 10L") == ast.FloatValue(1024.0)
+
+    def test_doubles(self):
+        assert value("60 * 60 * 24") == ast.FloatValue(86400.0)
+        assert value("1L + 0.5") == ast.FloatValue(1.5)
+        assert value("2 ^ 10") == ast.FloatValue(1024.0)
+        assert value("2 ** 10") == ast.FloatValue(1024.0)
+        assert value("NA ** 0") == ast.FloatValue(1.0)
+        assert value("5.5 %% 2") == ast.FloatValue(1.5)
+        assert value("1 / 0") == ast.FloatValue(float("inf"))
+        assert value("0 ^ 0 - 1") == ast.FloatValue(0.0)
+        assert math.isnan(value("0 / 0").value)
+        assert math.isnan(value("5 %% 0").value)
+
+    def test_na_propagation(self):
+        assert value("NA + 1L") == ast.IntValue(0, na=True)
+        assert value("NA * 2.5") == ast.FloatValue(0.0, na=True)
+        assert value("NA < 1") == ast.BoolValue(False, na=True)
+        assert value("(0 / 0) == 1") == ast.BoolValue(False, na=True)
+        # ... except where R defines the result whatever the NA stands for.
+        assert value("NA ^ 0") == ast.FloatValue(1.0)
+        assert value("1 ^ NA") == ast.FloatValue(1.0)
+        assert value("NA & 0") == ast.BoolValue(False)
+        assert value("NA || 2") == ast.BoolValue(True)
+        assert value("NA && 1") == ast.BoolValue(False, na=True)
+
+    def test_comparison_and_logic(self):
+        assert value("1L < 1.5") == ast.BoolValue(True)
+        assert value("2 == 2L") == ast.BoolValue(True)
+        assert value("'a' != 'b'") == ast.BoolValue(True)
+        assert value("(1 < 2) + (3 > 2)") == ast.IntValue(2)
+        assert value("0 | 1 > 2") == ast.BoolValue(False)
+
+    def test_left_alone(self):
+        for source in ["1L + 2147483647L", "'a' + 1", "'a' < 'b'", "'1' == 1",
+                       "1:3", "1 ~ 2", "x + 1", "'a' & 1"]:
+            tree = parse(source)
+            assert fold_constants(tree) is tree, source
+
+    def test_partial_fold(self):
+        assert folded("x * 60 * 60") == parse("x * 60 * 60").statements[0]
+        assert folded("x * (60 * 60)") == parse("x * 3600").statements[0]
+        assert folded("f <- function(a = 2 ^ 3) a + 1 * 2") == \
+            parse("f <- function(a = 8) a + 2").statements[0]
+
+    def test_counts_eliminated_nodes(self):
+        folder = ConstantFolder()
+        tree = parse("x <- 60 * 60 * 24\ny <- x + 1")
+        result = folder.fold(tree)
+        assert folder.eliminated == 4
+        assert result.statements[1] is tree.statements[1]
+        for source in ["x <- 60 * 60 * 24", "f <- function(a = 2 ^ 3) a + 1 * 2",
+                       "(1 < 2) + (3 > 2); x * (60 * 60)"]:
+            folder = ConstantFolder()
+            tree = parse(source)
+            result = folder.fold(tree)
+            assert count_nodes(tree) - count_nodes(result) == folder.eliminated, source
+
+    def test_deep_chains(self):
+        source = b"a" + b" + 1" * 3000
+        tree = parse(source)
+        assert fold_constants(tree) is tree
+        folder = ConstantFolder()
+        assert folder.fold(parse(b"1" + b" + 1" * 3000)) == parse(b"3001")
+        assert folder.eliminated == 3000 * 2
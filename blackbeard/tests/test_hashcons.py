@@ -0,0 +1,49 @@
+from blackbeard import ast
+from blackbeard.fold import ConstantFolder
+from blackbeard.hashcons import NodeTable
+from blackbeard.parser import Parser, parse
+
+SOURCE = b"""f <- function(x, y = 1) { x + y * 2 }
+g <- function(x, y = 1) { x + y * 2 }
+x + y * 2; NA; NA == x
+"""
+
+
+class TestHashCons(object):
+    def test_parser_shares_equal_subtrees(self):
+        for backend in [Parser.LR, Parser.PRATT]:
+            table = NodeTable()
+            tree = parse(SOURCE, backend, nodes=table)
+            f, g, expr, na, comparison = tree.statements
+            assert f.value is g.value
+            assert f.value.body.statements[0] is expr
+            assert na is ast.NA and comparison.left is na
+            assert tree == parse(SOURCE)
+            assert table.shared > 0
+
+    def test_parses_share_through_a_table(self):
+        table = NodeTable()
+        first = parse(SOURCE, nodes=table)
+        count = len(table)
+        assert parse(SOURCE, Parser.PRATT, nodes=table) is first
+        assert len(table) == count
+
+    def test_share_existing_tree(self):
+        table = NodeTable()
+        tree = parse(SOURCE)
+        shared = table.share(tree)
+        assert shared == tree and shared is not tree
+        assert shared.statements[0].value is shared.statements[1].value
+        assert table.share(parse(SOURCE)) is shared
+        assert parse(SOURCE, nodes=table) is shared
+
+    def test_negative_zero_is_kept(self):
+        tree = ConstantFolder().fold(parse(b"y <- (0 - 1) * 0\nx <- 0"))
+        y, x = NodeTable().share(tree).statements
+        assert repr(y.value.values[0].value) == "-0.0"
+        assert repr(x.value.values[0].value) == "0.0"
+
+    def test_share_deep_tree(self):
+        source = b" + ".join([b"x"] * 5000)
+        table = NodeTable()
+        assert table.share(parse(source)) is parse(source, nodes=table)
@@ -0,0 +1,87 @@
+import random
+
+from pytest import raises
+from rply.errors import ParsingError
+
+from blackbeard.incremental import ParsedSource
+from blackbeard.lexer import LexerError
+from blackbeard.parser import Parser, parse
+
+SOURCE = (
+    b"a <- 1\n"
+    b"f <- function(x, y = 2) {\n"
+    b"    x + y # a comment\n"
+    b"\n"
+    b"    x * y\n"
+    b"}\n"
+    b"s <- 'a string\nover two lines'; t <- 2\n"
+    b"# comment\n"
+    b"u = (a + 2)\n"
+    b"v <- 3\n"
+)
+
+# Replacements to make at random spots, including ones that open or close a
+# string, a comment or a bracket and so change how the rest is lexed.
+INSERTIONS = [b"", b"x", b" + 1", b"\n", b";", b"'", b"#", b"{", b"}", b"(", b")", b"y <- 2\n"]
+
+
+def edit(parsed, start, old_end, text):
+    source = parsed.source[:start] + text + parsed.source[old_end:]
+    return source, parsed.reparse(source, start, old_end, start + len(text))
+
+
+class TestIncremental(object):
+    def test_parse(self):
+        parsed = ParsedSource.parse(SOURCE)
+        assert parsed.tree == parse(SOURCE)
+        assert [SOURCE[i:i + 2] for i in parsed.starts] == [
+            b"a ", b"f ", b"s ", b"t ", b"u ", b"v "]
+
+    def test_untouched_statements_are_reused(self):
+        parsed = ParsedSource.parse(SOURCE)
+        start = SOURCE.index(b"x * y")
+        source, reparsed = edit(parsed, start, start + 1, b"z")
+        assert reparsed.tree == parse(source)
+        old, new = parsed.tree.statements, reparsed.tree.statements
+        assert new[1] is not old[1]
+        assert [new[i] is old[i] for i in [0, 2, 3, 4, 5]] == [True] * 5
+        assert reparsed.tree is not parsed.tree
+
+    def test_edit_joining_statements(self):
+        parsed = ParsedSource.parse(SOURCE)
+        start = SOURCE.index(b"; t")
+        source, reparsed = edit(parsed, start, start + 1, b" +")
+        assert reparsed.tree == parse(source)
+        assert len(reparsed.tree.statements) == 5
+        assert reparsed.tree.statements[3] is parsed.tree.statements[4]
+
+    def test_random_edits(self):
+        rng = random.Random(0)
+        for backend in [Parser.LR, Parser.PRATT]:
+            parsed = ParsedSource.parse(SOURCE, backend)
+            for _ in range(300):
+                start = rng.randrange(len(parsed.source) + 1)
+                old_end = min(len(parsed.source), start + rng.randrange(4))
+                source, reparsed = None, None
+                try:
+                    source, reparsed = edit(parsed, start, old_end, rng.choice(INSERTIONS))
+                except (ParsingError, LexerError):
+                    continue
+                assert reparsed.tree == parse(source), source
+                assert len(reparsed.starts) == len(reparsed.tree.statements)
+                parsed = reparsed
+
+    def test_errors(self):
+        parsed = ParsedSource.parse(SOURCE)
+        start = SOURCE.index(b"v <- 3")
+        with raises(ParsingError) as e:
+            edit(parsed, start, start + 1, b"{v")
+        assert e.value.getsourcepos() is None
+        with raises(ParsingError) as e:
+            edit(parsed, start, start + 1, b"(v")
+        assert e.value.getsourcepos().idx == len(SOURCE) + 1
+        with raises(ParsingError) as e:
+            edit(parsed, 1, 1, b" b")
+        assert e.value.getsourcepos().lineno == 1
+        # A failed edit leaves the previous parse usable.
+        assert edit(parsed, 0, 1, b"b")[1].tree.statements[1] is parsed.tree.statements[1]
@@ -0,0 +1,72 @@
+import json
+from StringIO import StringIO
+
+from blackbeard.instrument import ParserProfile
+from blackbeard.lexer import Lexer
+from blackbeard.parser import Parser, parse
+
+SOURCE = b"f <- function(x, y = 2) {\n    x + y * 3  # comment\n}\nz = 'a'; f\n"
+
+
+def profiled(source, backend=Parser.LR, profile=None):
+    profile = profile or ParserProfile()
+    result = Parser(Lexer(source, 1, {}), backend, profile).parse()
+    assert result == parse(source)
+    return profile
+
+
+class TestInstrument(object):
+    def test_counts(self):
+        profile = profiled(SOURCE)
+        functions = profile.by_function()
+        assert functions["expr_binary_op"]["calls"] == 2
+        assert sorted(functions["expr_binary_op"]["rules"]) == [
+            "expr : expr MUL expr", "expr : expr PLUS expr"]
+        assert functions["formlist_extend"]["calls"] == 1
+        assert functions["exprlist_extend"]["calls"] == 3
+        assert profile.tokens["SYMBOL"] == 7
+        assert profile.tokens["NEWLINE"] == 4
+        assert profile.parses == 1
+
+    def test_times(self):
+        profile = profiled(SOURCE * 20)
+        assert profile.lex_seconds > 0 and profile.reduce_seconds > 0
+        assert profile.lex_seconds + profile.reduce_seconds <= profile.parse_seconds
+
+    def test_accumulates(self):
+        profile = profiled(SOURCE)
+        profiled(SOURCE, profile=profile)
+        assert profile.parses == 2
+        assert profile.by_function()["expr_binary_op"]["calls"] == 4
+
+    def test_pratt(self):
+        profile = profiled(SOURCE, Parser.PRATT)
+        assert profile.by_function()["expr_binary_op"]["calls"] == 2
+        assert profile.tokens["SYMBOL"] == 7
+
+    def test_unprofiled_parser_is_untouched(self):
+        parser = Parser(Lexer(SOURCE, 1, {}))
+        profiled(SOURCE)
+        assert parser.profile is None
+        for production in parser.parser.lr_table.grammar.productions:
+            assert production.func is None or production.func.__name__ != "production"
+
+    def test_json(self):
+        f = StringIO()
+        profiled(SOURCE).write_json(f)
+        data = json.loads(f.getvalue())
+        assert data["parses"] == 1
+        assert data["productions"]["expr_binary_op"]["rules"]["expr : expr PLUS expr"]["calls"] == 1
+        assert data["tokens"]["NEWLINE"] == 4
+
+    def test_stacks(self):
+        f = StringIO()
+        profiled(SOURCE).write_stacks(f)
+        lines = f.getvalue().splitlines()
+        assert lines[0].startswith("parse;lex ")
+        assert "parse;reduce;expr_binary_op;expr : expr PLUS expr" in [
+            line.rsplit(" ", 1)[0] for line in lines]
+        for line in lines:
+            stack, micros = line.rsplit(" ", 1)
+            assert int(micros) >= 0
+            assert stack.split(";")[0] == "parse"
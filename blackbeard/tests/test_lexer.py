@@ -1,9 +1,11 @@
+# coding=utf-8
 from __future__ import unicode_literals
 
 from rply import Token
 from pytest import raises
 
-from blackbeard.lexer import Lexer, LexerError
+from blackbeard.lexer import Lexer, LexerError, LineIndex
+from blackbeard.symtable import SymbolTable
 
 
 class TestLexer(object):
@@ -30,6 +32,20 @@ class TestLexer(object):
             self.do(source),
             ["SYMBOL", "PLUS", "SYMBOL", "COMMENT"])
 
+    def test_comment_modes(self):
+        source = "a # first\n# second\nb"
+        lexer = Lexer(source, 1, {}, Lexer.COMMENTS_SKIP)
+        assert self.has_tokens(
+            list(lexer.tokenize()),
+            ["SYMBOL", "NEWLINE", "NEWLINE", "SYMBOL"])
+        assert lexer.comments == []
+        lexer = Lexer(source, 1, {}, Lexer.COMMENTS_COLLECT)
+        assert len(list(lexer.tokenize())) == 4
+        assert [(c.getstr(), c.getspan(), c.getsourcepos().lineno) for c in lexer.comments] == [
+            ("# first", (2, 9), 1),
+            ("# second", (10, 18), 2),
+        ]
+
     def test_symbol(self):
         assert self.do("foo") == [Token("SYMBOL", "foo")]
         assert self.do("foo bar") == [
@@ -164,6 +180,20 @@ class TestLexer(object):
         with raises(LexerError):
             self.do("1.23.4")
 
+    def test_number_runs(self):
+        assert self.do("1.5e+3L") == [Token("NUM_CONST", "1.5e+3L")]
+        assert self.do("12.") == [Token("NUM_CONST", "12.")]
+        assert self.do("12e") == [Token("NUM_CONST", "12e")]
+        assert self.do("7 # seven") == [Token("NUM_CONST", "7"), Token("COMMENT", "# seven")]
+        with raises(LexerError):
+            self.do("10e5.5")
+
+    def test_hex_number(self):
+        assert self.do("0x1F") == [Token("NUM_CONST", "0x1F")]
+        assert self.do("0Xa0L") == [Token("NUM_CONST", "0Xa0L")]
+        with raises(LexerError):
+            self.do("0x")
+
     def test_parens(self):
         assert self.has_tokens(
             self.do("3 * (-a + 2)"),
@@ -267,3 +297,151 @@ class TestLexer(object):
         lexer = Lexer("a\n", 1, {})
         list(lexer.tokenize())
         assert lexer.state == lexer.EXPR_BEG
+
+    def test_line_continuation(self):
+        assert self.has_tokens(
+            self.do("a +\\\nb"),
+            ["SYMBOL", "PLUS", "SYMBOL"])
+
+    def test_non_ascii_symbol(self):
+        assert self.do("été") == [Token("SYMBOL", "été")]
+        assert self.do("π") == [Token("SYMBOL", "π")]
+
+    def test_non_ascii_after_blanks_and_digits(self):
+        # Blank and digit runs stop at characters beyond a byte, which start
+        # symbols of their own.
+        assert self.do("x  π <- 1") == [
+            Token("SYMBOL", "x"), Token("SYMBOL", "π"), Token("LEFT_ASSIGN", "<-"),
+            Token("NUM_CONST", "1")]
+        assert self.do("1π") == [Token("NUM_CONST", "1"), Token("SYMBOL", "π")]
+        assert self.do("0x1Fπ") == [Token("NUM_CONST", "0x1F"), Token("SYMBOL", "π")]
+        assert self.do("1.5e3π") == [Token("NUM_CONST", "1.5e3"), Token("SYMBOL", "π")]
+        assert self.do("x # π comment") == [Token("SYMBOL", "x"), Token("COMMENT", "# π comment")]
+
+    def test_symbols_are_interned(self):
+        ids = {}
+        result = list(Lexer("foo + bar * foo + `foo`", 1, ids).tokenize())
+        symbols = [t for t in result if t.gettokentype() == "SYMBOL"]
+        assert [t.symbol_id for t in symbols] == [0, 1, 0, 0]
+        assert ids == {"foo": 0, "bar": 1}
+
+    def test_token_spans(self):
+        source = "foo <- 'it\\'s'\n"
+        result = self.do(source)
+        assert [t.getspan() for t in result] == [(0, 3), (4, 6), (8, 13), (14, 15)]
+        assert [t.getstr() for t in result] == ["foo", "<-", "it's", "\n"]
+        assert source[8:13] == "it\\'s"
+
+    def test_positions(self):
+        lexer = Lexer("a <- 'x\ny'\r\nb\r  c", 1, {})
+        assert [(t.getstr(), t.getsourcepos().lineno, t.getsourcepos().colno)
+                for t in lexer.tokenize()] == [
+            ("a", 1, 2), ("<-", 1, 5), ("x\ny", 2, 3), ("\n", 3, 1),
+            ("b", 3, 2), ("\n", 4, 1), ("c", 4, 4)]
+
+    def test_error_position(self):
+        with raises(LexerError) as e:
+            list(Lexer("a\n\nb <- 0x", 10, {}).tokenize())
+        assert (e.value.pos.idx, e.value.pos.lineno, e.value.pos.colno) == (10, 12, 8)
+
+    def test_line_index(self):
+        lines = LineIndex("ab\ncd\r\n\re", 3)
+        positions = [lines.position(i) for i in range(10)]
+        assert [(p.lineno, p.colno) for p in positions] == [
+            (3, 1), (3, 2), (3, 3), (4, 1), (4, 2), (4, 3), (4, 4),
+            (5, 1), (6, 1), (6, 2)]
+        # Lines found while answering a later offset serve earlier ones.
+        assert lines.position(1).lineno == 3
+        lines.discard(8)
+        assert lines.starts == [8]
+        assert [(p.lineno, p.colno) for p in map(lines.position, [8, 9])] == [(6, 1), (6, 2)]
+
+
+class TestRelex(object):
+    SOURCE = (
+        "a <- 1\n"
+        "f <- function(x) {\n"
+        "    x + 2 # add two\n"
+        "}\n"
+        "b <- 'multi\nline'\n"
+        "c <- a %in% b\n"
+    )
+
+    def describe(self, token):
+        pos = token.getsourcepos()
+        return (token.gettokentype(), token.getstr(), token.getspan(),
+                pos.idx, pos.lineno, pos.colno)
+
+    def edit(self, source, start, end, replacement, old=None):
+        symtable = SymbolTable()
+        if old is None:
+            old = Lexer(source, 1, symtable).tokenize_incremental()
+        new_source = source[:start] + replacement + source[end:]
+        lexer = Lexer(new_source, 1, symtable)
+        result = lexer.relex(old, start, end, start + len(replacement))
+        expected = Lexer(new_source, 1, {}).tokenize_incremental()
+        assert [self.describe(t) for t in result.tokens()] == \
+            [self.describe(t) for t in expected.tokens()]
+        assert [(c.idx, c.state, c.paren_nest) for c in result.checkpoints()] == \
+            [(c.idx, c.state, c.paren_nest) for c in expected.checkpoints()]
+        assert [self.describe(result.token(i)) for i in range(len(result))] == \
+            [self.describe(t) for t in expected.tokens()]
+        return old, result
+
+    def last(self, lexed):
+        return lexed.token(len(lexed) - 1)
+
+    def test_same_length_edit_reuses_tail(self):
+        old, result = self.edit(self.SOURCE, 0, 1, "z")
+        assert self.last(result) is self.last(old)
+
+    def test_same_length_edit_adding_a_line(self):
+        start = self.SOURCE.index("x + 2") + 1
+        old, result = self.edit(self.SOURCE, start, start + 1, "\n")
+        assert self.last(result) is not self.last(old)
+
+    def test_inserted_lines(self):
+        old, result = self.edit(self.SOURCE, 7, 7, "q <- 3\nr <- 4\n")
+        assert self.last(result) is not self.last(old)
+
+    def test_deleted_lines(self):
+        start = self.SOURCE.index("f <-")
+        end = self.SOURCE.index("b <-")
+        self.edit(self.SOURCE, start, end, "")
+
+    def test_edit_inside_string(self):
+        start = self.SOURCE.index("line'")
+        self.edit(self.SOURCE, start, start, "more\n")
+
+    def test_edit_adds_multiline_string(self):
+        start = self.SOURCE.index("x + 2")
+        self.edit(self.SOURCE, start, start, "'\n\n' +")
+
+    def test_edit_joins_line_breaks(self):
+        source = b"a <- 1\rb\nc <- 2\n"
+        start = source.index(b"b")
+        self.edit(source, start, start + 1, b"")
+
+    def test_edit_opens_unterminated_string(self):
+        old = Lexer(self.SOURCE, 1, {}).tokenize_incremental()
+        start = self.SOURCE.index("x + 2")
+        new_source = self.SOURCE[:start] + '"' + self.SOURCE[start:]
+        with raises(LexerError):
+            Lexer(new_source, 1, {}).relex(old, start, start, start + 1)
+
+    def test_repeated_edits(self):
+        # Each edit re-lexes only a few lines; the tokens after them are
+        # the original ones, moved by every edit since.
+        source = self.SOURCE * 20
+        lexed = Lexer(source, 1, {}).tokenize_incremental()
+        first = lexed.token(len(lexed) - 1)
+        for k in range(10):
+            start = source.index(b"c <- a", k * len(self.SOURCE))
+            _, lexed = self.edit(source, start, start, b"z", lexed)
+            source = source[:start] + b"z" + source[start:]
+            assert len(lexed.segments) <= 2 * k + 3
+        assert lexed.segments[-1].tokens[-1] is first
+
+    def test_edit_at_start_and_end(self):
+        self.edit(self.SOURCE, 0, 0, "# header\n")
+        self.edit(self.SOURCE, len(self.SOURCE), len(self.SOURCE), "d <- 5\n")
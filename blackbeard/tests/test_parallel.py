@@ -0,0 +1,49 @@
+from pytest import raises
+from rply.errors import ParsingError
+
+from blackbeard.lexer import Lexer
+from blackbeard.parallel import parse_parallel, split_statements
+from blackbeard.parser import parse
+
+
+SOURCE = (
+    b"a <- 1\n"
+    b"f <- function(x, y = 2) {\n"
+    b"    x + y # comment with a quote ' and a {\n"
+    b"}\n"
+    b"s <- 'a string\nwith {a newline'\r\n"
+    b"t = `odd }` %% s\n"
+    b"u <- a +\\\n"
+    b"    2\n"
+    b"{\n    b <- 3\n}\n"
+) * 5
+
+
+class TestParallel(object):
+    def test_pieces_cover_source(self):
+        pieces = split_statements(SOURCE, 1)
+        assert pieces[0][0] == 0
+        assert pieces[-1][1] == len(SOURCE)
+        for (_, end, _), (start, _, _) in zip(pieces, pieces[1:]):
+            assert end == start
+
+    def test_pieces_start_on_statement_boundaries(self):
+        starts = [(start, lineno) for start, _, lineno in split_statements(SOURCE, 1)]
+        assert [lineno for _, lineno in starts[:7]] == [1, 2, 5, 7, 8, 10, 13]
+        for start, lineno in starts:
+            lexer = Lexer(SOURCE[:start], 1, {})
+            assert len(list(lexer.tokenize())) == 0 or SOURCE[start - 1] == b"\n"
+            assert SOURCE[:start].count(b"\n") + 1 == lineno
+
+    def test_matches_serial_parse(self):
+        assert parse_parallel(SOURCE, processes=2, chunk_size=64) == parse(SOURCE)
+
+    def test_small_source_is_parsed_serially(self):
+        assert split_statements(SOURCE, len(SOURCE)) == [(0, len(SOURCE), 1)]
+        assert parse_parallel(SOURCE, processes=2) == parse(SOURCE)
+
+    def test_errors_report_absolute_positions(self):
+        source = SOURCE + b"x <- (1\n" + SOURCE
+        with raises(ParsingError) as e:
+            parse_parallel(source, processes=2, chunk_size=64)
+        assert e.value.getsourcepos().idx == len(SOURCE) + 8
@@ -2,8 +2,11 @@
 import pytest  # noqa:F401
 from textwrap import dedent
 
+from rply.errors import ParsingError
+
 from blackbeard import ast
-from blackbeard.parser import parse
+from blackbeard.lexer import Lexer
+from blackbeard.parser import Parser, parse, parse_stream
 
 
 class TestParser(object):
@@ -101,3 +104,93 @@ class TestParser(object):
         assert parse(u"👺 = 5".encode("utf-8")) == ast.Block([
             ast.Assign(ast.Symbol(u"👺"), ast.Vector([ast.FloatValue(5.)]))
         ])
+
+    def test_symbols_are_shared(self):
+        result = parse("x + x * y")
+        operation = result.statements[0]
+        assert operation.left is operation.right.left
+        assert operation.left is not operation.right.right
+
+    def test_comments(self):
+        assert parse("a # first\n# second\nb") == ast.Block([
+            ast.Symbol("a"),
+            ast.Symbol("b"),
+        ])
+        lexer = Lexer("x <- 1 # one", 1, {}, Lexer.COMMENTS_COLLECT)
+        assert Parser(lexer).parse() == parse("x <- 1")
+        assert [c.getstr() for c in lexer.comments] == ["# one"]
+
+    def test_numeric_literals(self):
+        assert parse("3L") == ast.Block([ast.Vector([ast.IntValue(3)])])
+        assert parse("1e3L") == ast.Block([ast.Vector([ast.IntValue(1000)])])
+        assert parse("1.5L") == ast.Block([ast.Vector([ast.FloatValue(1.5)])])
+        assert parse("3000000000L") == ast.Block([ast.Vector([ast.FloatValue(3e9)])])
+        assert parse("0x1F") == ast.Block([ast.Vector([ast.FloatValue(31.)])])
+        assert parse("0x1fL") == ast.Block([ast.Vector([ast.IntValue(31)])])
+        assert parse("12e") == ast.Block([ast.Vector([ast.FloatValue(12.)])])
+        assert parse("1e400L") == ast.Block([ast.Vector([ast.FloatValue(float("inf"))])])
+
+    def test_cached_tables_match_a_fresh_build(self, monkeypatch):
+        monkeypatch.setattr(Parser.pg, "cache_id", None)
+        fresh = Parser.pg.build().lr_table
+        cached = Parser.parser.lr_table
+        assert cached.lr_action == fresh.lr_action
+        assert cached.lr_goto == fresh.lr_goto
+        assert cached.default_reductions == fresh.default_reductions
+
+
+class TestParseStream(object):
+    SOURCE = (
+        b"a <- 1; b <- 'two\nlines'\n"
+        b"# a comment\n"
+        b"\n"
+        b"f <- function(x, y = 2) {\n"
+        b"    x + y\n"
+        b"}\n"
+        b"(a = 1)\n"
+        b"b"
+    )
+
+    def chunks(self, size, log):
+        for i in range(0, len(self.SOURCE), size):
+            log.append(i + size)
+            yield self.SOURCE[i:i + size]
+
+    def test_matches_parse(self):
+        expected = parse(self.SOURCE).statements
+        for size in [1, 3, 7, 1000]:
+            assert list(parse_stream(self.chunks(size, []))) == expected
+        pratt = parse_stream(self.chunks(5, []), Parser.PRATT)
+        assert list(pratt) == expected
+
+    def test_statements_come_as_they_end(self):
+        log = []
+        stream = parse_stream(self.chunks(1, log))
+        next(stream)
+        assert log[-1] == self.SOURCE.index(b";") + 1
+        next(stream)
+        assert log[-1] == self.SOURCE.index(b"'\n") + 2
+        assert len(list(stream)) == 3
+
+    def test_literals_are_not_kept(self):
+        source = b"".join(b"x%d <- %d + %d.5 + '%d'\n" % (i, i, i, i) for i in range(50))
+        lexer = Lexer(source, 1, {})
+        parser = Parser(lexer)
+        statements = list(parser.parse_statements(lexer.tokenize()))
+        assert statements == parse(source).statements
+        assert len(parser.int_literals) + len(parser.float_literals) <= 2
+        assert len(parser.str_literals) <= 1
+
+    def test_errors(self):
+        for source in [b"a\nb +\nc", b"a\nf(x)", b"a\n{b", b"a\nb }"]:
+            with pytest.raises(ParsingError) as expected:
+                parse(source)
+            stream = parse_stream(iter([source]))
+            assert next(stream) == parse(b"a").statements[0]
+            with pytest.raises(ParsingError) as e:
+                list(stream)
+            pos, expected_pos = e.value.getsourcepos(), expected.value.getsourcepos()
+            if expected_pos is None:
+                assert pos is None
+            else:
+                assert (pos.idx, pos.lineno) == (expected_pos.idx, expected_pos.lineno)
@@ -0,0 +1,124 @@
+import random
+
+from rply.errors import ParsingError
+
+from blackbeard.lexer import Lexer, LexerError
+from blackbeard.parser import Parser, parse
+from blackbeard.tokenbuffer import TokenBuffer
+
+SOURCES = [
+    "",
+    "\n;\n",
+    "3; 'a'\nNA\nx",
+    "1 + 2 * 3 - 4 / 5 %% 6",
+    "2 ^ 3 ^ 4",
+    "1:3:5",
+    "a - b - c",
+    "a ~ b ? c ~ d",
+    "a <- b <- c",
+    "a -> b -> c",
+    "a <- b -> c",
+    "a = b = c",
+    "a <- b = c + 1",
+    "a < b & c >= d | e == f && g != h || i <= j",
+    "a < b < c",
+    "a == b != c",
+    "(a = 1)",
+    "((a + b) * c)",
+    "{}",
+    "{a; b\n\nc}",
+    "x <- {\n    y <- 1\n    z = 2\n}",
+    "f <- function() 1",
+    "f <- function(x, y = 2, z) x + y * z",
+    "f <- function(x) x = 2",
+    "g = function(a = b <- c) { a }",
+    "a * function(x) x + 1",
+    "function(, a) a",
+    "a # comment\n# another\nb",
+]
+
+ERRORS = [
+    "a b",
+    "(a\n)",
+    "a +",
+    "{a",
+    "a }",
+    "function(x = 1 = 2) x",
+    "function(x)\nx",
+    "f(x)",
+    "-1",
+    "a %in% b",
+]
+
+OPERATORS = [
+    "+", "-", "*", "/", "^", "%%", ":", "~", "?", "<", "<=", "==", "!=",
+    ">=", ">", "&", "&&", "|", "||", "<-", "->",
+]
+
+# Fragments for random token sequences, most of which are not valid R.
+FRAGMENTS = [
+    "a", "b", "1", "2L", "'s'", "NA", "+", "-", "*", "/", "^", "%%", ":",
+    "~", "?", "<", "<=", "==", "!=", ">=", ">", "&", "&&", "|", "||", "<-",
+    "->", "=", "(", ")", "{", "}", "function(x)", "function(x, y = 1)",
+    "function(, z)", "\n", ";", ",",
+]
+
+
+def expression(rng, depth):
+    if depth == 0:
+        return rng.choice(["a", "b", "1", "'s'", "NA"])
+    if rng.random() < 0.1:
+        return "(%s)" % expression(rng, depth - 1)
+    if rng.random() < 0.05:
+        return "function(x) %s" % expression(rng, depth - 1)
+    return "%s %s %s" % (expression(rng, depth - 1), rng.choice(OPERATORS),
+                         expression(rng, rng.randrange(depth)))
+
+
+def outcome(source, backend):
+    # The tree, or where parsing failed.
+    try:
+        return parse(source, backend)
+    except ParsingError as e:
+        pos = e.getsourcepos()
+        return ("error", None if pos is None else pos.idx)
+    except LexerError as e:
+        return ("lexer error", e.pos.idx)
+
+
+class TestPratt(object):
+    def test_same_trees(self):
+        for source in SOURCES:
+            assert parse(source, Parser.PRATT) == parse(source), source
+
+    def test_long_chains(self):
+        for op in [b" + ", b" ^ ", b" <- ", b" -> "]:
+            source = b"a" + (op + b"a") * 3000
+            lr = parse(source)
+            pratt = parse(source, Parser.PRATT)
+            # Comparing the trees would recurse; their hashes do not.
+            assert hash(pratt) == hash(lr), op
+
+    def test_same_errors(self):
+        for source in ERRORS:
+            expected = outcome(source, Parser.LR)
+            assert expected[0] == "error"
+            assert outcome(source, Parser.PRATT) == expected, source
+
+    def test_random_expressions(self):
+        rng = random.Random(0)
+        for _ in range(500):
+            source = expression(rng, 4)
+            assert outcome(source, Parser.PRATT) == outcome(source, Parser.LR), source
+
+    def test_random_token_sequences(self):
+        rng = random.Random(0)
+        for _ in range(2000):
+            source = " ".join(rng.choice(FRAGMENTS) for _ in range(rng.randrange(1, 12)))
+            assert outcome(source, Parser.PRATT) == outcome(source, Parser.LR), source
+
+    def test_token_buffer(self):
+        source = SOURCES[-1]
+        buf = TokenBuffer.from_lexer(Lexer(source, 1, {}))
+        parser = Parser(Lexer(source, 1, buf.symtable), Parser.PRATT)
+        assert parser.parse_tokens(buf.cursor()) == parse(source)
@@ -0,0 +1,66 @@
+import mmap
+
+from pytest import raises
+
+from blackbeard.lexer import Lexer, tokenize_stream
+from blackbeard.source import ChunkedSource, MemoryViewSource, as_source, open_source
+
+
+SOURCE = b"foo <- function(x) { 'a string' %in% x }\n# done\n"
+
+
+def lex(source):
+    return [(t.gettokentype(), t.getstr()) for t in Lexer(source, 1, {}).tokenize()]
+
+
+class TestSource(object):
+    def test_open_source_maps_file(self, tmpdir):
+        path = tmpdir.join("script.r")
+        path.write(SOURCE, mode="wb")
+        source = open_source(str(path))
+        assert isinstance(source, mmap.mmap)
+        assert lex(source) == lex(SOURCE)
+
+    def test_open_source_empty_file(self, tmpdir):
+        path = tmpdir.join("empty.r")
+        path.write(b"", mode="wb")
+        assert lex(open_source(str(path))) == []
+
+    def test_memoryview(self):
+        source = as_source(memoryview(SOURCE))
+        assert isinstance(source, MemoryViewSource)
+        assert source[0:3] == b"foo"
+        assert lex(source) == lex(SOURCE)
+
+    def test_as_source_passes_strings_through(self):
+        assert as_source(SOURCE) is SOURCE
+
+
+class TestChunkedSource(object):
+    SOURCE = (
+        b"x <- 'a string\\' that spans chunks' %in% y\r\n"
+        b"`quoted sym` <- 1.5e-10 + 12L # trailing comment\r\n"
+        b"f(...)\n"
+    )
+
+    def chunked(self, size):
+        return [self.SOURCE[i:i + size] for i in range(0, len(self.SOURCE), size)]
+
+    def test_tokens_across_chunk_boundaries(self):
+        def describe(t):
+            pos = t.getsourcepos()
+            return (t.gettokentype(), t.getstr(), t.getspan(), pos.lineno, pos.colno)
+        expected = [describe(t) for t in Lexer(self.SOURCE, 1, {}).tokenize()]
+        for size in [1, 2, 3, 5, 7, 64]:
+            result = [describe(t) for t in tokenize_stream(iter(self.chunked(size)))]
+            assert result == expected
+
+    def test_window_is_bounded(self):
+        source = ChunkedSource(iter([b"abc", b"", b"def", b"ghi"]))
+        assert source[4] == b"e"
+        source.discard(4)
+        assert source[7] == b"h"
+        assert source.offset == 4
+        assert source.buf == b"efghi"
+        with raises(IndexError):
+            source[9]
@@ -0,0 +1,41 @@
+from blackbeard.lexer import Lexer
+from blackbeard.parser import Parser, parse
+from blackbeard.tokenbuffer import TokenBuffer
+
+
+SOURCE = (
+    b"f <- function(x, y = 2) {\r\n"
+    b"    'it\\'s' # comment\n"
+    b"    `odd name` + x * y\n"
+    b"}\n"
+)
+
+
+def describe(token):
+    pos = token.getsourcepos()
+    return (token.gettokentype(), token.getstr(), token.getspan(),
+            pos.idx, pos.lineno, pos.colno, token.symbol_id)
+
+
+class TestTokenBuffer(object):
+    def test_round_trip(self):
+        expected = [describe(t) for t in Lexer(SOURCE, 1, {}).tokenize()]
+        buf = TokenBuffer.from_lexer(Lexer(SOURCE, 1, {}))
+        assert len(buf) == len(expected)
+        assert [describe(buf.token(i)) for i in range(len(buf))] == expected
+        assert [describe(t) for t in buf.cursor()] == expected
+
+    def test_cursor_peek(self):
+        cursor = TokenBuffer.from_lexer(Lexer(b"a + b", 1, {})).cursor()
+        assert cursor.peektype() == "SYMBOL"
+        cursor.next()
+        assert cursor.peektype() == "PLUS"
+        cursor.next()
+        cursor.next()
+        assert cursor.peektype() is None
+
+    def test_parse_from_cursor(self):
+        source = b"x <- function(a) { a + 1 }\ny = x"
+        lexer = Lexer(source, 1, {})
+        buf = TokenBuffer.from_lexer(lexer)
+        assert Parser(lexer).parse_tokens(buf.cursor()) == parse(source)
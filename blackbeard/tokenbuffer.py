@@ -0,0 +1,105 @@
+"""Compact storage for a lexed token stream.
+
+A TokenBuffer keeps each token as one entry in a handful of parallel typed
+arrays rather than as a SpanToken plus SourcePosition object, and recreates
+Token objects only when one is asked for. Line and column numbers are not
+stored at all; they come from the source's LineIndex.
+"""
+from array import array
+
+from rply import Token  # noqa:F401
+from typing import Iterator, Optional  # noqa
+
+from blackbeard.lexer import Lexer, LineIndex, SpanToken, tokens
+from blackbeard.symtable import SymbolTable  # noqa:F401
+
+TOKEN_IDS = dict((name, i) for i, name in enumerate(tokens))
+
+# Values of TokenBuffer.quotes; the quote character itself is not needed
+# beyond knowing which one to unescape.
+UNQUOTED = 0
+QUOTE_CHARS = ["", "'", '"', "`"]
+
+
+class TokenBuffer(object):
+    def __init__(self, source, symtable, lines=None):
+        # type: (bytes, SymbolTable, Optional[LineIndex]) -> None
+        self.source = source
+        self.symtable = symtable
+        self.lines = LineIndex(source) if lines is None else lines
+        self.types = array("B")
+        self.starts = array("l")
+        self.ends = array("l")
+        self.quotes = array("B")
+        self.symbol_ids = array("i")
+
+    @staticmethod
+    def from_lexer(lexer):
+        # type: (Lexer) -> TokenBuffer
+        buf = TokenBuffer(lexer.source, lexer.symtable, lexer.lines)
+        for token in lexer.tokenize():
+            buf.append(token)
+        return buf
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.types)
+
+    def append(self, token):
+        # type: (SpanToken) -> None
+        self.types.append(TOKEN_IDS[token.gettokentype()])
+        self.starts.append(token.start)
+        self.ends.append(token.end)
+        self.quotes.append(UNQUOTED if token.quote is None else QUOTE_CHARS.index(token.quote))
+        self.symbol_ids.append(token.symbol_id)
+
+    def gettokentype(self, i):
+        # type: (int) -> bytes
+        return tokens[self.types[i]]
+
+    def token(self, i):
+        # type: (int) -> SpanToken
+        name = tokens[self.types[i]]
+        start = self.starts[i]
+        end = self.ends[i]
+        quote = None  # type: Optional[bytes]
+        text = None  # type: Optional[bytes]
+        if self.quotes[i] != UNQUOTED:
+            quote = QUOTE_CHARS[self.quotes[i]]
+        elif name == "NEWLINE":
+            text = "\n"
+        token = SpanToken(name, self.source, start, end, None, quote, text,
+                          self.symbol_ids[i], self.lines)
+        if name == "NUM_CONST":
+            token.decode_number()
+        return token
+
+    def cursor(self, start=0):
+        # type: (int) -> TokenCursor
+        return TokenCursor(self, start)
+
+
+class TokenCursor(object):
+    """Iterates over a TokenBuffer, creating each Token as it is reached."""
+    def __init__(self, buf, start=0):
+        # type: (TokenBuffer, int) -> None
+        self.buf = buf
+        self.index = start
+
+    def __iter__(self):
+        # type: () -> TokenCursor
+        return self
+
+    def peektype(self):
+        # type: () -> Optional[bytes]
+        if self.index >= len(self.buf):
+            return None
+        return self.buf.gettokentype(self.index)
+
+    def next(self):
+        # type: () -> SpanToken
+        if self.index >= len(self.buf):
+            raise StopIteration
+        token = self.buf.token(self.index)
+        self.index += 1
+        return token
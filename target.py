@@ -2,24 +2,24 @@ import os
 import sys
 
 import blackbeard.ast
+import blackbeard.astcache
 import blackbeard.lexer
 import blackbeard.parser
 
-from typing import AnyStr  # noqa
+from typing import AnyStr, Optional  # noqa
 
 
-def run(fp):
-    # type: (int) -> None
-    program = b""
+def run(fp, cache=None):
+    # type: (int, Optional[blackbeard.astcache.ASTCache]) -> None
+    chunks = []
     while True:
-        read = os.read(fp, 4096)
+        read = os.read(fp, 65536)
         if len(read) == 0:
             break
-        program += read
+        chunks.append(read)
     os.close(fp)
-    lexer = blackbeard.lexer.Lexer(program, 1, {})
-    parser = blackbeard.parser.Parser(lexer)
-    result = parser.parse()
+    program = b"".join(chunks)
+    result = blackbeard.parser.parse(program, cache=cache)
     assert isinstance(result, blackbeard.ast.ASTNode)
     print result.__repr__()
 
@@ -32,7 +32,11 @@ def entry_point(argv):
         print("You must supply a filename")
         return 1
 
-    run(os.open(filename, os.O_RDONLY, 0o777))
+    cache = None
+    cache_dir = os.environ.get("BLACKBEARD_AST_CACHE")
+    if cache_dir:
+        cache = blackbeard.astcache.ASTCache(cache_dir)
+    run(os.open(filename, os.O_RDONLY, 0o777), cache)
     return 0
 
 